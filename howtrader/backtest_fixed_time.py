@@ -1,10 +1,17 @@
 from howtrader.app.cta_strategy.backtesting import BacktestingEngine
 from howtrader.trader.object import Interval
+from howtrader.trader.utility import get_folder_path
+from howtrader.trader.database import get_database
 from datetime import datetime
 
+from backtester.data_cache import BarDataCache, load_engine_data_cached
+from crawler.bar_store import ParquetBarStore, load_engine_data
+
 from strategies.class_12_fixed_trade_time_strategy import Class12FixedTradeTimeStrategy
 
 # Note: Need to crawl data first
+USE_BAR_STORE = False  # True: 从crawl_data.py保存的bar_store加载数据, 比数据库快很多
+USE_CACHE = True  # 加载过的时间段缓存到本地, 再次回测同样或者更小的时间段不需要查询数据库
 
 engine = BacktestingEngine()
 engine.set_parameters(
@@ -19,7 +26,13 @@ engine.set_parameters(
     capital=300000)
 
 engine.add_strategy(Class12FixedTradeTimeStrategy, {})
-engine.load_data()
+if USE_CACHE:
+    source = ParquetBarStore(get_folder_path("bar_store")) if USE_BAR_STORE else get_database()
+    load_engine_data_cached(engine, source, BarDataCache(get_folder_path("bar_cache")))
+elif USE_BAR_STORE:
+    load_engine_data(engine, ParquetBarStore(get_folder_path("bar_store")))
+else:
+    engine.load_data()
 engine.run_backtesting()
 
 engine.calculate_result()
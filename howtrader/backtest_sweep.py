@@ -0,0 +1,98 @@
+"""
+参数扫描的命令行入口, 例如:
+
+python backtest_sweep.py class_19_future_profit_grid_strategy.Class19FutureProfitGridStrategy \
+    --symbol BTCUSDT.BINANCE --start 2021-1-1 --end 2021-6-1 \
+    --param grid_step=0.5,1,2,4 --param profit_step=1:4:0.5 --param max_pos=5,7,10 \
+    --random 100 --output sweep.csv
+
+--param的取值用逗号分隔, 或者start:stop:step的数值范围(不含stop).
+网格策略在定时器里下单, --engine auto的时候自动用TickReplayEngine在1分钟K线拆成的tick上回测.
+"""
+
+import argparse
+import ast
+import importlib
+from datetime import datetime
+
+import numpy as np
+
+from howtrader.app.cta_strategy.backtesting import BacktestingEngine
+from howtrader.trader.object import Interval
+
+from backtester.sweep import check_parameters, expand_grid, print_best, random_settings, run_sweep
+from backtester.tick_replay import TickReplayEngine
+
+ENGINE_CLASSES = {
+    "auto": None,
+    "bar": BacktestingEngine,
+    "tick": TickReplayEngine,
+}
+
+
+def parse_values(text: str) -> list:
+    """
+    "0.5,1,2" -> [0.5, 1, 2], "1:4:0.5" -> [1.0, 1.5, ... 3.5]
+    """
+    if ":" in text:
+        start, stop, step = (float(value) for value in text.split(":"))
+        return [round(float(value), 10) for value in np.arange(start, stop, step)]
+    return [ast.literal_eval(value) for value in text.split(",")]
+
+
+def load_strategy_class(name: str):
+    """
+    :param name: strategies目录下的模块名.类名
+    """
+    module_name, class_name = name.rsplit(".", 1)
+    module = importlib.import_module(f"strategies.{module_name}")
+    return getattr(module, class_name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="多进程扫描策略参数")
+    parser.add_argument("strategy", help="例如class_19_future_profit_grid_strategy.Class19FutureProfitGridStrategy")
+    parser.add_argument("--symbol", default="btcusdt.BINANCE", help="vt_symbol, 现货是小写")
+    parser.add_argument("--start", required=True, help="例如2021-1-1")
+    parser.add_argument("--end", required=True, help="例如2021-6-1")
+    parser.add_argument("--param", action="append", default=[], help="参数名=取值, 可以重复")
+    parser.add_argument("--random", type=int, default=0, help="随机抽取多少组, 0表示全部网格")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="进程数量, 默认等于CPU核心数")
+    parser.add_argument("--output", default="sweep.csv", help="结果的csv文件")
+    parser.add_argument("--store", action="store_true", help="从bar_store加载数据")
+    parser.add_argument("--engine", choices=list(ENGINE_CLASSES), default="auto",
+                        help="bar: K线回测, tick: K线拆成tick并发出定时器, auto: 网格策略用tick, 其他用bar")
+    parser.add_argument("--rate", type=float, default=1 / 1000)
+    parser.add_argument("--slippage", type=float, default=0)
+    parser.add_argument("--size", type=float, default=1)
+    parser.add_argument("--pricetick", type=float, default=0.01)
+    parser.add_argument("--capital", type=float, default=300000)
+    parser.add_argument("--top", type=int, default=10, help="打印最好的多少组")
+    args = parser.parse_args()
+
+    strategy_class = load_strategy_class(args.strategy)
+
+    space = {}
+    for param in args.param:
+        name, text = param.split("=", 1)
+        space[name] = parse_values(text)
+    check_parameters(strategy_class, space)
+
+    settings = random_settings(space, args.random, args.seed) if args.random else expand_grid(space)
+
+    engine_setting = dict(
+        vt_symbol=args.symbol,
+        interval=Interval.MINUTE,
+        start=datetime.strptime(args.start, "%Y-%m-%d"),
+        end=datetime.strptime(args.end, "%Y-%m-%d"),
+        rate=args.rate,
+        slippage=args.slippage,
+        size=args.size,
+        pricetick=args.pricetick,
+        capital=args.capital,
+    )
+
+    result = run_sweep(strategy_class, settings, engine_setting, args.output, args.workers, args.store,
+                       ENGINE_CLASSES[args.engine])
+    print_best(result, args.top)
@@ -0,0 +1,238 @@
+"""
+多进程的参数扫描.
+
+每个策略都在parameters里声明了可以调整的参数, 这里把参数的网格(或者随机抽样)展开成很多组setting,
+放进ProcessPoolExecutor在所有的核心上回测:
+    - 主进程只加载一次K线并放进共享内存, 工作进程直接映射, 每一组参数都复用同一个BacktestingEngine;
+    - 网格策略只在on_tick和EVENT_TIMER里下单, 用TickReplayEngine在K线拆成的tick上回测,
+      主进程拆好tick再放进共享内存;
+    - 每回测完一组就追加一行到csv, 中途停止也不会丢掉已经完成的结果;
+    - 最后按夏普比率和最大回撤打印最好的几组参数.
+
+用法:
+    space = {"grid_step": [0.5, 1, 2], "max_pos": [5, 7, 10]}
+    settings = expand_grid(space)  # 或者random_settings(space, 100)
+    result = run_sweep(Class19FutureProfitGridStrategy, settings, engine_setting, "sweep.csv")  # 自动使用TickReplayEngine
+    print_best(result)
+"""
+
+import csv
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence, Tuple, Type
+
+import pandas as pd
+
+from howtrader.app.cta_strategy.backtesting import BacktestingEngine
+from howtrader.trader.utility import get_folder_path
+
+from backtester.shared_bars import LazyBarData, SharedBarArray
+from backtester.tick_replay import TickReplayEngine, bar_ticks
+from backtester.vectorized import history_to_array
+from crawler.bar_store import ParquetBarStore, load_engine_data
+
+# 写进csv的统计指标
+SWEEP_FIELDS = (
+    "total_net_pnl",
+    "total_return",
+    "annual_return",
+    "max_drawdown",
+    "max_ddpercent",
+    "sharpe_ratio",
+    "return_drawdown_ratio",
+    "total_trade_count",
+    "total_commission",
+)
+
+engine: Optional[BacktestingEngine] = None  # 每个进程一个, 在init_worker里创建
+shared_bars: Optional[SharedBarArray] = None  # 工作进程映射的共享K线
+
+
+def expand_grid(space: Dict[str, Sequence]) -> List[dict]:
+    """
+    所有参数取值的组合.
+    :param space: {参数名: [取值, ...]}
+    """
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+
+
+def random_settings(space: Dict[str, Sequence], count: int, seed: Optional[int] = None) -> List[dict]:
+    """
+    从网格里随机抽取count组不重复的参数, 网格太大的时候代替expand_grid.
+    """
+    total = 1
+    for values in space.values():
+        total *= len(values)
+
+    rng = random.Random(seed)
+    settings = {}
+    while len(settings) < min(count, total):
+        setting = {name: rng.choice(list(values)) for name, values in space.items()}
+        settings[tuple(setting.items())] = setting
+    return list(settings.values())
+
+
+def check_parameters(strategy_class, space: Dict[str, Sequence]) -> None:
+    """
+    只允许扫描策略parameters里声明的参数.
+    """
+    unknown = [name for name in space if name not in strategy_class.parameters]
+    if unknown:
+        raise Exception(f"{strategy_class.__name__}没有参数{unknown}, 可以扫描的参数: {strategy_class.parameters}")
+
+
+def is_tick_strategy(strategy_class) -> bool:
+    """
+    在EVENT_TIMER里下单的策略(Class16到Class19的网格策略)只能用TickReplayEngine回测,
+    BacktestingEngine没有event_engine, 这些策略在on_start里就会出错.
+    """
+    return hasattr(strategy_class, "process_timer_event")
+
+
+def select_engine_class(strategy_class, engine_class: Optional[Type[BacktestingEngine]] = None) -> type:
+    """
+    :param engine_class: None的时候按策略自动选择
+    """
+    tick = is_tick_strategy(strategy_class)
+    if engine_class is None:
+        return TickReplayEngine if tick else BacktestingEngine
+
+    if tick and not issubclass(engine_class, TickReplayEngine):
+        raise Exception(f"{strategy_class.__name__}在定时器里下单, 需要用TickReplayEngine回测, 不能用{engine_class.__name__}")
+    return engine_class
+
+
+def load_shared_bars(engine_setting: dict, use_store: bool = False, ticks: bool = False) -> SharedBarArray:
+    """
+    在主进程里加载一次回测数据, 放进共享内存.
+    :param engine_setting: engine.set_parameters的参数
+    :param use_store: 从bar_store加载, 否则从数据库加载
+    :param ticks: 按照OHLC的路径把K线拆成tick, 给TickReplayEngine回测
+    """
+    loader = BacktestingEngine()
+    loader.set_parameters(**engine_setting)
+
+    if use_store:
+        load_engine_data(loader, ParquetBarStore(get_folder_path("bar_store")))
+    else:
+        loader.load_data()
+
+    bars = history_to_array(loader.history_data)
+    if ticks:
+        return SharedBarArray.create(bar_ticks(bars, spread=loader.pricetick))
+    return SharedBarArray.create(bars)
+
+
+def init_worker(engine_setting: dict, spec: tuple, engine_class: type = BacktestingEngine) -> None:
+    """
+    进程启动的时候创建回测引擎, 映射共享内存里的K线, 不查询数据库.
+    :param spec: SharedBarArray.spec, TickReplayEngine的时候是tick
+    """
+    global engine, shared_bars
+    engine = engine_class()
+    engine.output = lambda msg: None  # 几百次回测的日志没有意义
+    engine.set_parameters(**engine_setting)
+
+    shared_bars = SharedBarArray.attach(*spec)
+    if isinstance(engine, TickReplayEngine):
+        engine.set_ticks(shared_bars.array)
+    else:
+        engine.history_data = LazyBarData(shared_bars.array, engine.symbol, engine.exchange, engine.interval)
+
+
+def run_backtest(strategy_class, setting: dict) -> dict:
+    """
+    在工作进程里用已经加载的数据回测一组参数.
+    :return: setting加上统计指标
+    """
+    engine.clear_data()
+    engine.add_strategy(strategy_class, setting)
+    engine.run_backtesting()
+    engine.calculate_result()
+    statistics = engine.calculate_statistics(output=False) or {}
+
+    row = dict(setting)
+    for field in SWEEP_FIELDS:
+        row[field] = statistics.get(field)
+    return row
+
+
+def run_sweep(
+    strategy_class,
+    settings: List[dict],
+    engine_setting: dict,
+    output: str = "sweep.csv",
+    workers: Optional[int] = None,
+    use_store: bool = False,
+    engine_class: Optional[Type[BacktestingEngine]] = None,
+) -> pd.DataFrame:
+    """
+    并行回测所有的settings, 每完成一组就追加到output.
+    :param workers: 进程数量, 默认等于CPU核心数
+    :param engine_class: BacktestingEngine或者TickReplayEngine, 默认按策略自动选择
+    :return: 所有结果
+    """
+    if not settings:
+        return pd.DataFrame()
+
+    check_parameters(strategy_class, settings[0])
+    engine_class = select_engine_class(strategy_class, engine_class)
+    ticks = issubclass(engine_class, TickReplayEngine)
+    workers = min(workers or os.cpu_count() or 1, len(settings))
+    fieldnames = list(settings[0]) + list(SWEEP_FIELDS)
+
+    rows = []
+    start = time.perf_counter()
+    errors = []
+    print(f"{strategy_class.__name__} 共{len(settings)}组参数, {workers}个进程, {engine_class.__name__}")
+
+    shared = load_shared_bars(engine_setting, use_store, ticks)
+    print(f"加载{shared.length}{'个tick' if ticks else '根K线'}到共享内存, {shared.array.nbytes / 1024 / 1024:.1f}MB")
+
+    try:
+        with open(output, "w", newline="") as f, ProcessPoolExecutor(
+            workers, initializer=init_worker, initargs=(engine_setting, shared.spec, engine_class)
+        ) as executor:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+
+            futures = {executor.submit(run_backtest, strategy_class, setting): setting for setting in settings}
+            for future in as_completed(futures):
+                try:
+                    row = future.result()
+                except Exception as error:
+                    print(f"{futures[future]} 回测失败: {error!r}")
+                    errors.append(error)
+                    continue
+
+                writer.writerow(row)
+                f.flush()
+                rows.append(row)
+                print(f"[{len(rows)}/{len(settings)}] {futures[future]} "
+                      f"sharpe: {row['sharpe_ratio']}, max_ddpercent: {row['max_ddpercent']}, "
+                      f"用时{time.perf_counter() - start:.1f}s")
+    finally:
+        shared.unlink()
+
+    if not rows:
+        raise Exception(f"{strategy_class.__name__}的{len(settings)}组参数全部回测失败, 第一个错误: {errors[0]!r}")
+
+    return pd.DataFrame(rows, columns=fieldnames)
+
+
+def print_best(result: pd.DataFrame, count: int = 10) -> None:
+    """
+    按夏普比率和最大回撤(百分比, 越接近0越好)分别打印最好的count组.
+    """
+    if result.empty:
+        print("没有回测结果")
+        return
+
+    print(f"夏普比率最高的{count}组:")
+    print(result.sort_values("sharpe_ratio", ascending=False).head(count).to_string(index=False))
+    print(f"最大回撤最小的{count}组:")
+    print(result.sort_values("max_ddpercent", ascending=False).head(count).to_string(index=False))
@@ -0,0 +1,391 @@
+"""
+Class12定投策略的向量化回测.
+
+Class12FixedTradeTimeStrategy和Class12FixedTradPriceStrategy在BacktestingEngine里要把每一根1分钟K线
+推给BarGenerator合成1小时/4小时K线, 真正的判断只是"是不是周四15点"或者"4小时跌了多少".
+这里把同样的过程用数组一次算完:
+    1. 按BarGenerator的规则一次性合成窗口K线, 并记下每根窗口K线在第几根1分钟K线的on_bar里推送;
+    2. 用窗口K线算出下单的掩码, ArrayManager没有初始化(前size根)和load_bar的初始化阶段不下单;
+    3. 限价单从推送之后的下一根1分钟K线开始撮合, 下一根窗口K线的cancel_all之后撤销,
+       成交价和cross_limit_order一样是min(委托价, 开盘价);
+    4. 按天计算盈亏, 列和calculate_result一样, 可以直接传给engine.calculate_statistics(df).
+
+BarGenerator的4小时K线是数满4根小时K线就推送, 和数据的开始时间有关, 不是按时钟对齐的,
+所以这里不用resample.py的结果, 而是从1分钟K线重新合成.
+
+用法:
+    backtester = VectorizedBacktester.from_engine(engine)
+    trades = backtester.run_fixed_trade_time(fixed_trade_money=1000)
+    df = backtester.calculate_result(trades)
+    print(backtester.calculate_statistics(df))
+    cross_check(engine, trades)  # 和engine.run_backtesting()的成交对比
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from crawler.kline_decoder import BAR_DTYPE, CHINA_OFFSET_MS, datetime_to_ms, ms_to_datetime
+from crawler.resample import MINUTE_MS, bucket_of
+
+HOUR_MS = 60 * MINUTE_MS
+DAY_MS = 24 * HOUR_MS
+
+# (isoweekday, hour), Class12FixedTradeTimeStrategy: 周四15点和周五16点的小时K线
+FIXED_TIME_SCHEDULE: Tuple[Tuple[int, int], ...] = ((4, 15), (5, 16))
+
+WINDOW_DTYPE = np.dtype([
+    ('datetime', np.int64),     # 第一根1分钟K线所在小时的开始时间, 和BarGenerator一致
+    ('open', np.float64),
+    ('high', np.float64),
+    ('low', np.float64),
+    ('close', np.float64),
+    ('emit', np.int64),         # 在第几根1分钟K线的on_bar里推送
+])
+
+FAST_TRADE_DTYPE = np.dtype([
+    ('datetime', np.int64),     # 成交的那根1分钟K线的开盘时间
+    ('price', np.float64),
+    ('volume', np.float64),
+])
+
+
+def history_to_array(history_data: list) -> np.ndarray:
+    """
+    engine.history_data转换成BAR_DTYPE数组.
+    """
+    bars = np.empty(len(history_data), dtype=BAR_DTYPE)
+    bars['datetime'] = [datetime_to_ms(bar.datetime) for bar in history_data]
+    bars['open'] = [float(bar.open_price) for bar in history_data]
+    bars['high'] = [float(bar.high_price) for bar in history_data]
+    bars['low'] = [float(bar.low_price) for bar in history_data]
+    bars['close'] = [float(bar.close_price) for bar in history_data]
+    bars['volume'] = [float(bar.volume) for bar in history_data]
+    bars['turnover'] = [float(getattr(bar, 'turnover', 0) or 0) for bar in history_data]
+    return bars
+
+
+def hour_bars(bars: np.ndarray) -> np.ndarray:
+    """
+    和BarGenerator.update_bar_hour_window一样合成小时K线:
+    59分的K线到了就推送; 没有59分的K线, 等到下一个小时的第一根K线才推送;
+    一个小时只有59分一根K线的时候, 59分只是创建, 也要等下一个小时.
+    最后一个没有走完的小时不推送.
+    """
+    hours = bucket_of(bars['datetime'], HOUR_MS)
+    minutes = (bars['datetime'] + CHINA_OFFSET_MS) // MINUTE_MS % 60
+
+    ends = np.flatnonzero(np.r_[hours[1:] != hours[:-1], False] | (minutes == 59))
+    if not len(ends):
+        return np.empty(0, dtype=WINDOW_DTYPE)
+
+    starts = np.r_[0, ends[:-1] + 1].astype(np.int64)
+    emit = np.where((minutes[ends] == 59) & (ends > starts), ends, ends + 1)
+
+    keep = emit < len(bars)
+    starts, ends, emit = starts[keep], ends[keep], emit[keep]
+
+    windows = np.empty(len(ends), dtype=WINDOW_DTYPE)
+    if not len(ends):
+        return windows
+
+    last = ends[-1] + 1
+    windows['datetime'] = hours[starts]
+    windows['open'] = bars['open'][starts]
+    windows['high'] = np.maximum.reduceat(bars['high'][:last], starts)
+    windows['low'] = np.minimum.reduceat(bars['low'][:last], starts)
+    windows['close'] = bars['close'][ends]
+    windows['emit'] = emit
+    return windows
+
+
+def window_bars(bars: np.ndarray, hours: int = 1) -> np.ndarray:
+    """
+    BarGenerator(on_bar, hours, on_window_bar, Interval.HOUR)推送的K线.
+    超过1小时的窗口从第一根小时K线开始数, 每hours根推送一次.
+    """
+    windows = hour_bars(bars)
+    if hours == 1:
+        return windows
+
+    count = len(windows) // hours
+    grouped = windows[:count * hours].reshape(count, hours)
+
+    result = np.empty(count, dtype=WINDOW_DTYPE)
+    result['datetime'] = grouped['datetime'][:, 0]
+    result['open'] = grouped['open'][:, 0]
+    result['high'] = grouped['high'].max(axis=1)
+    result['low'] = grouped['low'].min(axis=1)
+    result['close'] = grouped['close'][:, -1]
+    result['emit'] = grouped['emit'][:, -1]
+    return result
+
+
+def trading_start(bars: np.ndarray, days: int = 1) -> int:
+    """
+    run_backtesting里load_bar(days)的初始化阶段结束, 开始交易的第一根K线.
+    初始化阶段遇到第days次日期变化就结束.
+    """
+    dates = (bars['datetime'] + CHINA_OFFSET_MS) // DAY_MS
+    changes = np.flatnonzero(dates[1:] != dates[:-1]) + 1
+    if len(changes) >= days:
+        return int(changes[days - 1])
+    return max(len(bars) - 1, 0)
+
+
+def isoweekday(timestamps: np.ndarray) -> np.ndarray:
+    """
+    北京时间的星期, 周一是1. 1970-01-01是周四.
+    """
+    return ((timestamps + CHINA_OFFSET_MS) // DAY_MS + 3) % 7 + 1
+
+
+class VectorizedBacktester:
+    """
+    同一份1分钟K线可以反复地用不同的参数回测, 窗口K线只合成一次.
+    """
+
+    def __init__(
+        self,
+        bars: np.ndarray,
+        rate: float = 1 / 1000,
+        slippage: float = 0,
+        size: float = 1,
+        pricetick: float = 0.01,
+        capital: float = 1000000,
+        init_days: int = 1,
+        annual_days: int = 240,
+    ):
+        """
+        :param bars: 按时间排序的1分钟K线, BAR_DTYPE数组
+        :param init_days: 策略里load_bar的天数
+        :param annual_days: 计算夏普比率的年化天数, 默认值和BacktestingEngine一致
+        其他参数和engine.set_parameters一致.
+        """
+        self.bars = bars
+        self.rate = rate
+        self.slippage = slippage
+        self.size = size
+        self.pricetick = pricetick
+        self.capital = capital
+        self.annual_days = annual_days
+
+        self.start_index = trading_start(bars, init_days)
+        self.windows: Dict[int, np.ndarray] = {}
+
+        # 开始交易之后每天的最后一个收盘价, 和update_daily_close一致.
+        trading_bars = bars[self.start_index:]
+        dates = (trading_bars['datetime'] + CHINA_OFFSET_MS) // DAY_MS
+        self.days, last = np.unique(dates[::-1], return_index=True)
+        self.day_close = trading_bars['close'][len(trading_bars) - 1 - last]
+
+    @classmethod
+    def from_engine(cls, engine, init_days: int = 1, annual_days: Optional[int] = None) -> "VectorizedBacktester":
+        """
+        使用已经load_data的BacktestingEngine的数据和参数.
+        :param annual_days: None的时候用engine.annual_days, 夏普比率和engine.calculate_statistics一致
+        """
+        return cls(
+            history_to_array(engine.history_data),
+            rate=float(engine.rate),
+            slippage=float(engine.slippage),
+            size=float(engine.size),
+            pricetick=float(engine.pricetick),
+            capital=float(engine.capital),
+            init_days=init_days,
+            annual_days=annual_days or engine.annual_days,
+        )
+
+    def get_windows(self, hours: int) -> np.ndarray:
+        """"""
+        if hours not in self.windows:
+            self.windows[hours] = window_bars(self.bars, hours)
+        return self.windows[hours]
+
+    def run_fixed_trade_time(
+        self,
+        fixed_trade_money: float = 1000,
+        schedule: Sequence[Tuple[int, int]] = FIXED_TIME_SCHEDULE,
+        am_size: int = 100,
+    ) -> np.ndarray:
+        """
+        Class12FixedTradeTimeStrategy: 1小时K线, 在schedule的(星期, 小时)买入fixed_trade_money.
+        :return: FAST_TRADE_DTYPE数组
+        """
+        windows = self.get_windows(1)
+        weekdays = isoweekday(windows['datetime'])
+        hours = (windows['datetime'] + CHINA_OFFSET_MS) // HOUR_MS % 24
+
+        signals = np.zeros(len(windows), dtype=bool)
+        for weekday, hour in schedule:
+            signals |= (weekdays == weekday) & (hours == hour)
+
+        return self.buy_orders(windows, signals, fixed_trade_money, am_size)
+
+    def run_fixed_trade_price(
+        self,
+        fixed_trade_money: float = 1000,
+        price_change_pct: float = 0.05,
+        am_size: int = 100,
+        hours: int = 4,
+    ) -> np.ndarray:
+        """
+        Class12FixedTradPriceStrategy: 4小时K线的收盘价比上一根下跌price_change_pct以上的时候买入.
+        :return: FAST_TRADE_DTYPE数组
+        """
+        windows = self.get_windows(hours)
+        close = windows['close']
+
+        signals = np.zeros(len(windows), dtype=bool)
+        signals[1:] = (close[:-1] - close[1:]) / close[:-1] >= price_change_pct
+
+        return self.buy_orders(windows, signals, fixed_trade_money, am_size)
+
+    def buy_orders(self, windows: np.ndarray, signals: np.ndarray, money: float, am_size: int = 100) -> np.ndarray:
+        """
+        在信号的窗口K线上以收盘价*1.001挂限价买单, 数量为money/价格.
+        :param am_size: ArrayManager的size, 前am_size-1根窗口K线不下单
+        """
+        live = signals & (np.arange(len(windows)) >= am_size - 1) & (windows['emit'] >= self.start_index)
+        ix = np.flatnonzero(live)
+
+        raw_prices = windows['close'][ix] * 1.001
+        prices = np.round(raw_prices / self.pricetick) * self.pricetick
+        volumes = money / raw_prices
+
+        # 挂单从推送之后的下一根1分钟K线开始撮合, 到下一根窗口K线推送的那根1分钟K线(cancel_all之前)为止.
+        deadlines = np.r_[windows['emit'][1:], len(self.bars) - 1]
+        return self.match_limit_orders(windows['emit'][ix] + 1, deadlines[ix], prices, volumes)
+
+    def match_limit_orders(self, firsts: np.ndarray, lasts: np.ndarray, prices: np.ndarray,
+                           volumes: np.ndarray) -> np.ndarray:
+        """
+        买入限价单的撮合, 和cross_limit_order一致.
+        :param firsts: 每个委托第一根可以成交的1分钟K线
+        :param lasts: 每个委托最后一根可以成交的1分钟K线(含)
+        """
+        low = self.bars['low']
+        open_ = self.bars['open']
+
+        filled = np.full(len(prices), -1, dtype=np.int64)
+        for i in range(len(prices)):
+            hit = low[firsts[i]:lasts[i] + 1] <= prices[i]
+            if hit.any():
+                filled[i] = firsts[i] + hit.argmax()
+
+        ok = (filled >= 0) & (low[filled.clip(min=0)] > 0)
+        filled = filled[ok]
+
+        trades = np.empty(len(filled), dtype=FAST_TRADE_DTYPE)
+        trades['datetime'] = self.bars['datetime'][filled]
+        trades['price'] = np.minimum(prices[ok], open_[filled])
+        trades['volume'] = volumes[ok]
+        return trades
+
+    def calculate_result(self, trades: np.ndarray) -> pd.DataFrame:
+        """
+        按天计算盈亏, 列和engine.calculate_result()一致, 只包含开始交易之后的日期.
+        """
+        days = self.days
+        close = self.day_close
+        count = len(days)
+
+        trade_days = np.searchsorted(days, (trades['datetime'] + CHINA_OFFSET_MS) // DAY_MS)
+        volume = trades['volume']
+        price = trades['price']
+
+        pos_change = np.bincount(trade_days, volume, count)
+        end_pos = np.cumsum(pos_change)
+        start_pos = end_pos - pos_change
+        pre_close = np.r_[1.0, close[:-1]]  # DailyResult第一天的pre_close是1
+
+        turnover = np.bincount(trade_days, price * volume * self.size, count)
+        commission = turnover * self.rate
+        slippage = np.bincount(trade_days, volume * self.size * self.slippage, count)
+        trading_pnl = np.bincount(trade_days, volume * (close[trade_days] - price) * self.size, count)
+        holding_pnl = start_pos * (close - pre_close) * self.size
+        total_pnl = trading_pnl + holding_pnl
+
+        df = pd.DataFrame({
+            'date': days.astype('datetime64[D]').astype(object),
+            'close_price': close,
+            'pre_close': pre_close,
+            'trade_count': np.bincount(trade_days, minlength=count),
+            'start_pos': start_pos,
+            'end_pos': end_pos,
+            'turnover': turnover,
+            'commission': commission,
+            'slippage': slippage,
+            'trading_pnl': trading_pnl,
+            'holding_pnl': holding_pnl,
+            'total_pnl': total_pnl,
+            'net_pnl': total_pnl - commission - slippage,
+        })
+        return df.set_index('date')
+
+    def calculate_statistics(self, df: pd.DataFrame) -> Dict[str, float]:
+        """
+        参数扫描用的主要指标, 算法和engine.calculate_statistics一致.
+        """
+        if df is None or not len(df):
+            return {}
+
+        balance = df['net_pnl'].cumsum().values + self.capital
+        highlevel = np.maximum.accumulate(balance)
+        drawdown = balance - highlevel
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.nan_to_num(np.log(balance / np.r_[np.nan, balance[:-1]]))  # 第一天是0
+
+        std = returns.std(ddof=1) if len(returns) > 1 else 0
+        sharpe_ratio = returns.mean() / std * np.sqrt(self.annual_days) if std else 0
+
+        return {
+            'end_balance': float(balance[-1]),
+            'total_net_pnl': float(balance[-1] - self.capital),
+            'max_drawdown': float(drawdown.min()),
+            'max_ddpercent': float((drawdown / highlevel * 100).min()),
+            'total_commission': float(df['commission'].sum()),
+            'total_trade_count': int(df['trade_count'].sum()),
+            'sharpe_ratio': float(sharpe_ratio),
+        }
+
+    def scan(self, run: Callable[..., np.ndarray], name: str, values: Iterable, **kwargs) -> pd.DataFrame:
+        """
+        对一个参数的多个取值回测, 例如:
+            backtester.scan(backtester.run_fixed_trade_price, "price_change_pct", np.arange(0.01, 0.2, 0.001))
+        :return: 每个取值一行的统计指标
+        """
+        rows: List[dict] = []
+        for value in values:
+            trades = run(**{name: value}, **kwargs)
+            row = {name: value}
+            row.update(self.calculate_statistics(self.calculate_result(trades)))
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+
+def cross_check(engine, trades: np.ndarray, tolerance: float = 1e-8) -> bool:
+    """
+    和engine.run_backtesting()的成交逐笔对比, 打印第一处不一致.
+    """
+    engine_trades = sorted(engine.trades.values(), key=lambda trade: trade.datetime)
+    if len(engine_trades) != len(trades):
+        print(f"成交数量不一致: 引擎{len(engine_trades)}笔, 向量化{len(trades)}笔")
+
+    for trade, fast in zip(engine_trades, trades):
+        same = (
+            datetime_to_ms(trade.datetime) == fast['datetime']
+            and abs(float(trade.price) - fast['price']) <= tolerance * fast['price']
+            and abs(float(trade.volume) - fast['volume']) <= tolerance * fast['volume']
+        )
+        if not same:
+            print(f"成交不一致: 引擎{trade.datetime} {trade.price} {trade.volume}, "
+                  f"向量化{ms_to_datetime(fast['datetime'])} {fast['price']} {fast['volume']}")
+            return False
+
+    if len(engine_trades) != len(trades):
+        return False
+
+    print(f"成交一致, 共{len(trades)}笔")
+    return True
@@ -0,0 +1,97 @@
+"""
+爬虫的离线压测.
+
+在本地启动KlineStubServer, 用AsyncKlineDownloader在不同的并发数(async-c1/async-c3/async)以及
+服务器限频的情况下下载同样的数据, 输出每种模式的K线/秒、请求/秒、重试次数和连接复用情况,
+不需要访问交易所, 可以在CI里运行.
+
+python bench_crawler.py --symbols 4 --days 30 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from crawler.async_downloader import AsyncKlineDownloader
+from crawler.rate_limiter import WeightRateLimiter
+from crawler.stub_server import KlineStubServer
+
+START = 1577836800000  # 2020-01-01 UTC
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def run_mode(name: str, concurrency: int, args, max_weight: int = None) -> dict:
+    """
+    用一个新的模拟服务器跑一种模式.
+    """
+    server = KlineStubServer(latency=args.latency, max_weight=max_weight, weight_window=args.weight_window,
+                             error_rate=args.error_rate)
+    server.start()
+
+    bars = 0
+
+    def on_page(symbol, market, page):
+        nonlocal bars
+        bars += len(page)
+
+    limiter = WeightRateLimiter(max_weight or 10 ** 9, window=args.weight_window, base_delay=0.1)
+    downloader = AsyncKlineDownloader('spot', on_page, concurrency=concurrency, base_url=server.url,
+                                      limiter=limiter, max_retries=20)
+
+    symbols = [f"SYM{i}USDT" for i in range(args.symbols)]
+    start_time = time.perf_counter()
+    asyncio.run(downloader.download(symbols, START, START + args.days * DAY_MS))
+    elapsed = time.perf_counter() - start_time
+
+    server.stop()
+    stats = server.stats()
+
+    return {
+        "mode": name,
+        "concurrency": concurrency,
+        "bars": bars,
+        "seconds": round(elapsed, 3),
+        "bars_per_second": round(bars / elapsed),
+        "requests_per_second": round(stats["requests"] / elapsed, 1),
+        "retries": downloader.retries,
+        "rejected": stats["rejected"],
+        "errors": stats["errors"],
+        "connections_created": downloader.connection_stats.created,
+        "connections_reused": downloader.connection_stats.reused,
+    }
+
+
+def main():
+    """"""
+    parser = argparse.ArgumentParser(description="爬虫离线压测")
+    parser.add_argument("--symbols", type=int, default=4)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟的网络延迟, 秒")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--max-weight", type=int, default=600, help="限频模式下每个窗口的权重上限")
+    parser.add_argument("--weight-window", type=float, default=5, help="权重窗口, 秒")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机500错误的概率")
+    parser.add_argument("--json", help="结果保存为json文件")
+    args = parser.parse_args()
+
+    results = [
+        run_mode("async-c1", 1, args),
+        run_mode("async-c3", 3, args),
+        run_mode("async", args.concurrency, args),
+        run_mode("async+ratelimit", args.concurrency, args, args.max_weight),
+    ]
+
+    columns = ["mode", "concurrency", "bars", "seconds", "bars_per_second", "requests_per_second",
+               "retries", "rejected", "errors", "connections_created", "connections_reused"]
+    print("  ".join(f"{column:>16}" for column in columns))
+    for result in results:
+        print("  ".join(f"{result[column]:>16}" for column in columns))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+基于asyncio的币安K线下载器.
+
+把[start, end)的时间段按照每页的条数(limit)切分成多个窗口, 所有symbol的窗口
+放进同一个队列, 由一组协程通过同一个aiohttp的ClientSession并发地去请求.
+这样下载速度只受交易所的限频影响, 而不是受线程数量的限制.
+
+开始下载之前先查询每个symbol的第一根K线, 上市之前的时间段不会产生请求, 不需要再手动填写上市时间.
+每个窗口只有一页, 哪个协程空闲了就从队列里取下一个窗口, 所以不会出现某个线程负责的年份
+数据很少先结束、其他线程还在下载的情况.
+
+用法:
+    downloader = AsyncKlineDownloader('spot', on_page=save_klines)
+    downloader.run(["BTCUSDT", "ETHUSDT"], "2020-1-1", "2021-1-1")
+
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+import numpy as np
+
+from crawler.crawler_metrics import CrawlerMetrics
+from crawler.http_session import ConnectionStats, create_client_session
+from crawler.kline_decoder import decode_klines, ms_to_datetime
+from crawler.response_cache import ResponseCache
+from crawler.rate_limiter import WeightRateLimiter, klines_weight, BINANCE_WEIGHT_LIMITS, BACKOFF_STATUS
+
+BINANCE_SPOT_LIMIT = 1000
+BINANCE_FUTURE_LIMIT = 1500
+
+# market: (host, path, 每页最大条数, gateway_name)
+BINANCE_MARKETS: Dict[str, Tuple[str, str, int, str]] = {
+    'spot': ('https://api.binance.com', '/api/v3/klines', BINANCE_SPOT_LIMIT, "BINANCE_SPOT"),
+    'usdt_future': ('https://fapi.binance.com', '/fapi/v1/klines', BINANCE_FUTURE_LIMIT, "BINANCE_USDT"),
+    'inverse_future': ('https://dapi.binance.com', '/dapi/v1/klines', BINANCE_FUTURE_LIMIT, "BINANCE_INVERSE"),
+}
+
+INTERVAL_MS: Dict[str, int] = {
+    '1m': 60 * 1000,
+    '3m': 3 * 60 * 1000,
+    '5m': 5 * 60 * 1000,
+    '15m': 15 * 60 * 1000,
+    '30m': 30 * 60 * 1000,
+    '1h': 60 * 60 * 1000,
+    '2h': 2 * 60 * 60 * 1000,
+    '4h': 4 * 60 * 60 * 1000,
+    '6h': 6 * 60 * 60 * 1000,
+    '8h': 8 * 60 * 60 * 1000,
+    '12h': 12 * 60 * 60 * 1000,
+    '1d': 24 * 60 * 60 * 1000,
+}
+
+
+def to_milliseconds(date: str) -> int:
+    """
+    :param date: 格式如下:2020-1-1 或者2020-01-01, 按本地时间解析.
+    :return: 毫秒时间戳
+    """
+    return int(datetime.strptime(date, '%Y-%m-%d').timestamp() * 1000)
+
+
+def db_symbol(symbol: str, market: str) -> str:
+    """
+    保存到数据库里的symbol, 现货是小写, 合约是大写.
+    """
+    return symbol.lower() if market == 'spot' else symbol
+
+
+def split_windows(start: int, end: int, interval_ms: int, limit: int) -> List[Tuple[int, int]]:
+    """
+    把[start, end)切分成每页最多limit根K线的窗口, 窗口之间首尾相接不重叠.
+    :return: [(startTime, endTime), ...], endTime是闭区间, 可直接作为请求参数.
+    """
+    windows = []
+    step = interval_ms * limit
+    while start < end:
+        stop = min(start + step, end)
+        windows.append((start, stop - 1))
+        start = stop
+    return windows
+
+
+class AsyncKlineDownloader:
+    """
+    并发K线下载器, 所有的请求共享一个HTTP客户端.
+    """
+
+    def __init__(
+        self,
+        market: str,
+        on_page: Callable[[str, str, np.ndarray], Optional[Awaitable]],
+        interval: str = '1m',
+        concurrency: int = 10,
+        proxy: Optional[str] = None,
+        base_url: Optional[str] = None,
+        timeout: float = 10,
+        max_retries: int = 5,
+        limiter: Optional[WeightRateLimiter] = None,
+        checkpoint=None,
+        pool_size: Optional[int] = None,
+        metrics: Optional[CrawlerMetrics] = None,
+        path: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        offline: bool = False,
+    ):
+        """
+        :param market: spot, usdt_future, inverse_future
+        :param on_page: 每下载完一页的回调, on_page(symbol, market, bars), bars为decode_klines解码后的数组,
+                        也可以是协程, 例如BarWriter.put_async.
+        :param interval: K线周期, 如1m.
+        :param concurrency: 同时在途的请求数量.
+        :param proxy: 代理地址, 如http://127.0.0.1:1087
+        :param base_url: 替换掉默认的交易所域名, 例如本地的测试服务器.
+        :param limiter: 共享的限流器, 多个下载器同时运行的时候应该传入同一个.
+        :param checkpoint: DatabaseCheckpoint, 传入的时候只下载数据库里缺少的部分.
+        :param pool_size: 长连接池的大小, 默认等于concurrency.
+        :param metrics: 运行指标, 多个下载器可以共享同一个.
+        :param path: 替换默认的K线接口, 例如标记价格K线/fapi/v1/markPriceKlines.
+        :param cache: 原始响应的缓存, 命中的请求不访问网络.
+        :param offline: 只从cache里读取, 没有命中的页当作没有数据.
+        """
+        if market not in BINANCE_MARKETS:
+            raise Exception('交易所名称请输入以下其中一个：spot, usdt_future, inverse_future')
+
+        host, kline_path, limit, gateway = BINANCE_MARKETS[market]
+        self.market = market
+        self.url = (base_url or host) + (path or kline_path)
+        self.limit = limit
+        self.gateway_name = gateway
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+
+        self.on_page = on_page
+        self.concurrency = concurrency
+        self.proxy = proxy
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        self.limiter = limiter or WeightRateLimiter(BINANCE_WEIGHT_LIMITS[market])
+        self.checkpoint = checkpoint
+
+        self.pool_size = pool_size or concurrency
+        self.connection_stats = ConnectionStats()
+        self.metrics = metrics or CrawlerMetrics()
+        self.retries = 0
+
+        self.cache = cache
+        self.offline = offline
+
+    def run(self, symbols: List[str], start_time: str, end_time: str) -> None:
+        """
+        同步的入口, 下载symbols在[start_time, end_time)之间的K线.
+        """
+        asyncio.run(self.download(symbols, to_milliseconds(start_time), to_milliseconds(end_time)))
+
+    async def download(self, symbols: List[str], start: int, end: int) -> None:
+        """
+        :param start: 毫秒时间戳
+        :param end: 毫秒时间戳
+        """
+        self.metrics.add_total(len(symbols))
+        async with create_client_session(self.concurrency, self.timeout) as session:
+            firsts = await asyncio.gather(*[self.first_bar_time(session, symbol, start, end) for symbol in symbols])
+
+        jobs = []
+        skipped = 0
+        for symbol, first in zip(symbols, firsts):
+            if first is None:
+                print(f"{symbol} 在{ms_to_datetime(start)}到{ms_to_datetime(end)}之间没有K线")
+                continue
+
+            if first > start:
+                print(f"{symbol} 第一根K线: {ms_to_datetime(first)}")
+
+            for window in split_windows(max(start, first), end, self.interval_ms, self.limit):
+                if self.checkpoint:
+                    window = self.checkpoint.missing(db_symbol(symbol, self.market), *window)
+                    if not window:
+                        skipped += 1
+                        continue
+                jobs.append((symbol, window))
+
+        if skipped:
+            print(f"{skipped}个窗口已经在数据库里, 剩余{len(jobs)}个窗口需要下载")
+
+        await self.download_windows(jobs)
+
+    def create_session(self) -> aiohttp.ClientSession:
+        """
+        下载K线用的长连接session, 常驻运行的时候在整个事件循环里复用同一个.
+        """
+        return create_client_session(self.pool_size, self.timeout, self.connection_stats)
+
+    async def download_windows(
+        self,
+        jobs: List[Tuple[str, Tuple[int, int]]],
+        session: Optional[aiohttp.ClientSession] = None,
+    ) -> None:
+        """
+        下载指定的窗口, 例如gap_scanner找到的缺口.
+        :param jobs: [(symbol, (startTime, endTime)), ...]
+        :param session: create_session创建的session, 不传的时候新建一个, 下载完之后关闭.
+        """
+        if session is None:
+            async with self.create_session() as session:
+                await self.download_windows(jobs, session)
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+        self.metrics.add_total(len(jobs))
+
+        workers = [
+            asyncio.create_task(self.worker(session, queue, f"{self.market}-{i}"))
+            for i in range(self.concurrency)
+        ]
+        await queue.join()
+
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+        print(f"{self.market} {self.connection_stats}")
+        if self.cache:
+            print(f"{self.market} {self.cache}")
+
+    async def first_bar_time(self, session: aiohttp.ClientSession, symbol: str, start: int, end: int) -> Optional[int]:
+        """
+        [start, end)之间的第一根K线的开盘时间, 没有K线返回None.
+        币安按startTime返回之后最早的K线, 所以请求一根就可以了, 不需要一页一页地试.
+        """
+        try:
+            rows = await self.fetch_page(session, symbol, start, end - 1, limit=1)
+        except Exception as error:
+            print(f"{symbol} 查询第一根K线失败: {error}")
+            return start
+
+        if not rows:
+            return None
+        return rows[0][0]
+
+    async def worker(self, session: aiohttp.ClientSession, queue: asyncio.Queue, name: str) -> None:
+        """
+        :param name: 在metrics里区分每个worker.
+        """
+        while True:
+            symbol, (start, end) = await queue.get()
+            try:
+                rows = await self.fetch_page(session, symbol, start, end, worker=name)
+                if rows:
+                    result = self.on_page(symbol, self.market, self.decode(rows))
+                    if asyncio.iscoroutine(result):
+                        await result
+            except Exception as error:
+                self.metrics.record_error(name, error)
+                print(f"{symbol} {start}-{end} 下载失败: {error}")
+            finally:
+                queue.task_done()
+
+    async def fetch_page(
+        self,
+        session: aiohttp.ClientSession,
+        symbol: str,
+        start: int,
+        end: int,
+        limit: Optional[int] = None,
+        worker: str = "main",
+    ) -> list:
+        """
+        请求一页K线, 失败的时候退避并重试max_retries次.
+        :param limit: 默认为每页最大条数.
+        :param worker: 记录metrics用的worker名称.
+        """
+        limit = limit or self.limit
+        weight = klines_weight(self.market, limit)
+        params = {
+            'symbol': symbol,
+            'interval': self.interval,
+            'startTime': start,
+            'endTime': end,
+            'limit': limit,
+        }
+        return await self.request(session, params, weight, worker)
+
+    def decode(self, rows: list) -> np.ndarray:
+        """
+        把一页的json解码成传给on_page的数组.
+        """
+        return decode_klines(rows)
+
+    def cacheable(self, params: dict, rows: list) -> bool:
+        """
+        只缓存不会再变化的页: 最后一根K线已经走完, 并且这一页是满的或者窗口已经结束.
+        """
+        now = time.time() * 1000
+        if rows and rows[-1][6] >= now:
+            return False
+        return len(rows) >= params['limit'] or params['endTime'] < now
+
+    async def request(self, session: aiohttp.ClientSession, params: dict, weight: int, worker: str = "main"):
+        """
+        带限流的GET请求. 429/418的时候所有worker一起退避, 网络错误和5xx只重试这个请求,
+        其他的4xx直接抛出异常, 最多重试max_retries次.
+        :return: 解析后的json
+        """
+        metrics = self.metrics
+
+        key = None
+        if self.cache:
+            key = self.cache.key(self.url, params)
+            body = self.cache.get(key)
+            if body is not None:
+                datas = json.loads(body)
+                metrics.record_page(worker, 0, len(body), len(datas), cached=True)
+                return datas
+
+            if self.offline:
+                return []
+
+        for i in range(self.max_retries):
+            wait_start = time.perf_counter()
+            await self.limiter.acquire(weight)
+            request_start = time.perf_counter()
+            metrics.record_throttle(request_start - wait_start)
+
+            try:
+                async with session.get(self.url, params=params, proxy=self.proxy) as response:
+                    self.limiter.update_from_headers(response.headers)
+
+                    if response.status in BACKOFF_STATUS:
+                        self.retries += 1
+                        delay = self.limiter.backoff(response.headers.get("Retry-After"))
+                        metrics.record_backoff(worker, delay, response.status)
+                        continue
+
+                    # 参数错误、symbol不存在之类的4xx重试也不会成功, 也不能让其他worker跟着暂停.
+                    if 400 <= response.status < 500:
+                        text = await response.text()
+                        raise Exception(f"{params} 请求失败: {response.status} {text}")
+
+                    response.raise_for_status()
+                    body = await response.read()
+                    datas = json.loads(body)
+                    self.limiter.on_success()
+                    metrics.record_page(worker, time.perf_counter() - request_start, len(body), len(datas))
+
+                    if key and self.cacheable(params, datas):
+                        self.cache.put(key, body)
+                    return datas
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                if i == self.max_retries - 1:
+                    raise
+                self.retries += 1
+                delay = self.limiter.retry_delay(i)
+                metrics.record_backoff(worker, delay, getattr(error, "status", None) or type(error).__name__)
+                await asyncio.sleep(delay)
+
+        raise Exception(f"{params} 重试{self.max_retries}次后仍然失败")
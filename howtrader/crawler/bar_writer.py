@@ -0,0 +1,269 @@
+"""
+单独的写入线程.
+
+下载的协程只负责把解码后的一页K线放进有界队列, 由一个写入线程把队列里的多页合并起来,
+按(symbol, market)一次性调用sink写入, 一次save_bar_data就是一个大的事务.
+网络请求和数据库写入不再轮流进行, 也不会有多个线程争抢同一个SQLite文件.
+队列满了的时候, 下载的协程会等待, 下载速度自动降到数据库能写入的速度.
+同一次运行里已经写过的(symbol, market, datetime)会在写入之前被过滤掉, 不会重复更新数据库的索引.
+传入validator的时候, 每一页先在写入线程里检查, 不合格的K线放进隔离表, 不会写入数据库.
+sink或者检查出错之后写入线程继续取出并丢弃队列里的数据, 之后的put会抛出异常, stop()和退出with的时候
+抛出第一个异常, 不会静悄悄地少了数据.
+
+用法:
+    with BarWriter(save_klines) as writer:
+        downloader = AsyncKlineDownloader('spot', writer.put_async)
+        downloader.run(["BTCUSDT"], "2020-1-1", "2021-1-1")
+"""
+
+import asyncio
+import time
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from queue import Queue, Empty, Full
+from threading import Thread
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from crawler.crawler_metrics import CrawlerMetrics
+from crawler.validator import BarValidator
+
+
+class DuplicateFilter:
+    """
+    记录每个(symbol, market)已经写过的开盘时间, 把重复的K线变成一个很便宜的空操作.
+    写过的时间按互不重叠的区间分段保存, 每一页只和时间范围有交集的分段比较,
+    按顺序下载的页和已有的分段没有交集, 不会每一页都重新排序所有写过的时间.
+    """
+
+    def __init__(self, key: str = 'datetime'):
+        """
+        :param key: 用来判断重复的字段, 逐笔成交用id.
+        """
+        self.key = key
+        # (symbol, market): (每段的第一个值, 每段的最后一个值, 每段排好序的值)
+        self.written: Dict[Tuple[str, str], Tuple[List[int], List[int], List[np.ndarray]]] = {}
+        self.duplicates = 0
+
+    def filter(self, key: Tuple[str, str], bars: np.ndarray) -> np.ndarray:
+        """
+        去掉页内重复和已经写过的K线, 并把剩下的记为已写.
+        """
+        bars = self.select(key, bars)
+        self.add(key, bars)
+        return bars
+
+    def select(self, key: Tuple[str, str], bars: np.ndarray) -> np.ndarray:
+        """
+        去掉页内重复和已经写过的K线, 不记为已写, 写入成功之后再调用add.
+        """
+        if not len(bars):
+            return bars
+
+        times, ix = np.unique(bars[self.key], return_index=True)
+        for segment in self.overlapping(key, times)[2]:
+            pos = np.searchsorted(segment, times).clip(max=len(segment) - 1)
+            fresh = segment[pos] != times
+            times, ix = times[fresh], ix[fresh]
+
+        self.duplicates += len(bars) - len(ix)
+        if len(ix) == len(bars):
+            return bars
+        return bars[ix]
+
+    def add(self, key: Tuple[str, str], bars: np.ndarray) -> None:
+        """
+        :param bars: select返回的K线
+        """
+        if not len(bars):
+            return
+
+        times = np.sort(bars[self.key])
+        left, right, overlapping = self.overlapping(key, times)
+        merged = np.concatenate(overlapping + [times]) if overlapping else times
+        if overlapping:
+            merged.sort()
+
+        firsts, lasts, segments = self.written[key]
+        firsts[left:right] = [merged[0]]
+        lasts[left:right] = [merged[-1]]
+        segments[left:right] = [merged]
+
+    def overlapping(self, key: Tuple[str, str], times: np.ndarray) -> Tuple[int, int, List[np.ndarray]]:
+        """
+        分段按时间排序且互不重叠, 和[times[0], times[-1]]有交集的是连续的一段.
+        :param times: 排好序的值
+        :return: (left, right, segments[left:right])
+        """
+        firsts, lasts, segments = self.written.setdefault(key, ([], [], []))
+        left = bisect_left(lasts, times[0])
+        right = bisect_right(firsts, times[-1])
+        return left, right, segments[left:right]
+
+
+class BarWriter:
+    """
+    生产者/消费者模式的写入线程.
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[str, str, np.ndarray], None],
+        max_pages: int = 100,
+        batch_size: int = 50000,
+        flush_interval: float = 1.0,
+        metrics: Optional[CrawlerMetrics] = None,
+        key: Optional[str] = 'datetime',
+        validator: Optional[BarValidator] = None,
+    ):
+        """
+        :param sink: 真正的写入函数, sink(symbol, market, bars), 例如crawl_data.save_klines.
+        :param max_pages: 队列里最多缓存的页数, 超过之后put会等待.
+        :param batch_size: 累计到多少根K线的时候写一次.
+        :param flush_interval: 队列空闲多少秒之后把缓存写掉.
+        :param metrics: 记录写入的数量和时间, 以及队列满了之后下载等待的时间.
+        :param key: 去重的字段, 传None的时候不去重.
+        :param validator: 写入之前检查K线, 只能用于BAR_DTYPE的数据.
+        """
+        self.sink = sink
+        self.queue: Queue = Queue(maxsize=max_pages)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.buffers: Dict[Tuple[str, str], List[np.ndarray]] = defaultdict(list)
+        self.buffered = 0
+
+        self.pages = 0
+        self.rows = 0
+        self.flushes = 0
+        self.errors = 0
+        self.error: Optional[Exception] = None  # 第一个异常, 之后的数据都会被丢弃
+        self.finished = False  # 已经取到了stop()放进队列的None
+        self.dedup = DuplicateFilter(key) if key else None
+        self.metrics = metrics
+        self.validator = validator
+
+        self.thread = Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # with里面已经有异常的时候不要用写入的异常覆盖它
+        self.stop(raise_error=exc_type is None)
+
+    def start(self) -> None:
+        """"""
+        self.thread.start()
+
+    def stop(self, raise_error: bool = True) -> None:
+        """
+        写完队列里剩下的数据之后退出.
+        :param raise_error: 写入失败过的时候抛出第一个异常
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if raise_error and self.error:
+            raise self.error
+
+    def check(self) -> None:
+        """
+        写入线程已经出错的时候, 不再接收新的数据.
+        """
+        if self.error:
+            raise Exception(f"写入线程已经出错: {self.error!r}")
+
+    def put(self, symbol: str, market: str, bars: np.ndarray) -> None:
+        """
+        线程里调用, 队列满了会阻塞.
+        """
+        self.check()
+        self.queue.put((symbol, market, bars))
+
+    async def put_async(self, symbol: str, market: str, bars: np.ndarray) -> None:
+        """
+        协程里调用, 可以直接作为AsyncKlineDownloader的on_page, 队列满了不会阻塞事件循环.
+        """
+        self.check()
+        item = (symbol, market, bars)
+        try:
+            self.queue.put_nowait(item)
+        except Full:
+            start = time.perf_counter()
+            await asyncio.get_running_loop().run_in_executor(None, self.queue.put, item)
+            if self.metrics:
+                self.metrics.record_queue_wait(time.perf_counter() - start)
+
+    def run(self) -> None:
+        """"""
+        try:
+            self.consume()
+        except Exception as error:
+            self.error = error
+            print(f"写入线程出错, 之后的数据都会被丢弃: {error!r}")
+
+            # 继续取出队列里的数据, put和stop不会因为队列满了一直等待.
+            while not self.finished:
+                self.finished = self.queue.get() is None
+
+    def consume(self) -> None:
+        """"""
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except Empty:
+                self.flush()
+                continue
+
+            if item is None:
+                self.finished = True
+                break
+
+            symbol, market, bars = item
+            if self.validator:
+                bars = self.validator.filter(symbol, market, bars)
+            if not len(bars):
+                continue
+
+            self.buffers[(symbol, market)].append(bars)
+            self.buffered += len(bars)
+            self.pages += 1
+
+            if self.buffered >= self.batch_size:
+                self.flush()
+
+        self.flush()
+
+    def flush(self) -> None:
+        """
+        每个(symbol, market)合并成一次写入, 写入成功之后才记为已写.
+        """
+        buffers = self.buffers
+        self.buffers = defaultdict(list)
+        self.buffered = 0
+        if buffers:
+            self.flushes += 1
+
+        for key, pages in buffers.items():
+            symbol, market = key
+            bars = np.concatenate(pages)
+            if self.dedup:
+                bars = self.dedup.select(key, bars)
+            if not len(bars):
+                continue
+
+            try:
+                start = time.perf_counter()
+                self.sink(symbol, market, bars)
+            except Exception:
+                self.errors += 1
+                print(f"{symbol} 写入{len(bars)}根K线失败")
+                raise
+
+            if self.dedup:
+                self.dedup.add(key, bars)
+            self.rows += len(bars)
+            if self.metrics:
+                self.metrics.record_write(len(bars), time.perf_counter() - start)
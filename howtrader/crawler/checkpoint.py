@@ -0,0 +1,71 @@
+"""
+从数据库断点续传.
+
+每次运行crawl_data.py之前, 先问数据库每个(symbol, exchange, interval)已经存到了哪里,
+只去下载每个窗口缺少的尾部, 重新运行一个中断的多年回补只需要几秒钟.
+
+AsyncKlineDownloader每一页对应一个窗口, 一页的K线是在一次save_bar_data里面写入的,
+所以只要窗口的最后一根K线已经在数据库里面, 就认为整个窗口已经下载完了.
+"""
+
+from typing import Optional, Tuple
+
+from crawler.kline_decoder import ms_to_datetime, datetime_to_ms
+
+
+class DatabaseCheckpoint:
+    """
+    根据数据库里已有的K线, 计算每个窗口还需要下载的部分.
+    """
+
+    def __init__(self, database, exchange, interval, interval_ms: int):
+        """
+        :param database: BaseDatabase
+        :param exchange: Exchange.BINANCE
+        :param interval: Interval.MINUTE
+        :param interval_ms: K线周期的毫秒数, 需要与interval一致.
+        """
+        self.database = database
+        self.exchange = exchange
+        self.interval = interval
+        self.interval_ms = interval_ms
+
+        self.overviews = {}
+        for overview in database.get_bar_overview():
+            if overview.exchange == exchange and overview.interval == interval:
+                self.overviews[overview.symbol] = (datetime_to_ms(overview.start), datetime_to_ms(overview.end))
+
+    def newest_bar_time(self, symbol: str, start: int, end: int) -> Optional[int]:
+        """
+        [start, end]之间数据库里最新的一根K线的开盘时间, 没有就返回None.
+        """
+        overview = self.overviews.get(symbol)
+        if not overview or overview[1] < start or overview[0] > end:
+            return None
+
+        # 先只查窗口的最后一根K线, 大部分已完成的窗口一个很小的查询就能确定.
+        tail_start = max(start, end - self.interval_ms + 1)
+        for s in (tail_start, start):
+            bars = self.database.load_bar_data(
+                symbol, self.exchange, self.interval, ms_to_datetime(s), ms_to_datetime(end)
+            )
+            if bars:
+                return datetime_to_ms(bars[-1].datetime)
+
+        return None
+
+    def missing(self, symbol: str, start: int, end: int) -> Optional[Tuple[int, int]]:
+        """
+        :param symbol: 数据库里保存的symbol, 现货是小写.
+        :param start: 窗口的开始时间, 毫秒
+        :param end: 窗口的结束时间(闭区间), 毫秒
+        :return: 还需要下载的(start, end), 已经完整的时候返回None.
+        """
+        newest = self.newest_bar_time(symbol, start, end)
+        if newest is None:
+            return start, end
+
+        start = newest + self.interval_ms
+        if start > end:
+            return None
+        return start, end
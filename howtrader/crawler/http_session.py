@@ -0,0 +1,90 @@
+"""
+爬虫使用的HTTP连接池.
+
+每个请求都重新建立TCP连接和TLS握手的话, 经过代理的时候握手占了每一页很大一部分的延迟.
+所有的协程共享一个保持长连接的aiohttp session, 并且接受gzip压缩, ConnectionStats记录新建和复用的连接数,
+可以用来确认每一页是不是在已经建立好的连接上请求的.
+"""
+
+from threading import Lock
+from typing import Dict, Optional
+
+import aiohttp
+
+ACCEPT_ENCODING = "gzip, deflate"
+
+
+class ConnectionStats:
+    """
+    连接复用的统计.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.created = 0
+        self.reused = 0
+        self.lock = Lock()
+
+    def add(self, requests: int = 0, created: int = 0, reused: int = 0) -> None:
+        """"""
+        with self.lock:
+            self.requests += requests
+            self.created += created
+            self.reused += reused
+
+    @property
+    def reuse_ratio(self) -> float:
+        """
+        复用连接的请求占比.
+        """
+        return self.reused / self.requests if self.requests else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        """"""
+        return {
+            "requests": self.requests,
+            "created": self.created,
+            "reused": self.reused,
+            "reuse_ratio": round(self.reuse_ratio, 4),
+        }
+
+    def __str__(self) -> str:
+        return f"请求{self.requests}次, 新建连接{self.created}个, 复用连接{self.reused}次({self.reuse_ratio:.1%})"
+
+
+def create_client_session(
+    pool_size: int = 10,
+    timeout: float = 10,
+    stats: Optional[ConnectionStats] = None,
+) -> aiohttp.ClientSession:
+    """
+    aiohttp的长连接session, 所有的协程共享.
+    :param pool_size: 最多同时打开的连接数.
+    :param stats: 传入的时候通过trace记录新建和复用的连接.
+    """
+    connector = aiohttp.TCPConnector(limit=pool_size, keepalive_timeout=60, ttl_dns_cache=300)
+
+    trace_configs = []
+    if stats is not None:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_end(session, context, params):
+            stats.add(requests=1)
+
+        async def on_connection_create_end(session, context, params):
+            stats.add(created=1)
+
+        async def on_connection_reuseconn(session, context, params):
+            stats.add(reused=1)
+
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_configs.append(trace_config)
+
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        headers={"Accept-Encoding": ACCEPT_ENCODING},
+        trace_configs=trace_configs,
+    )
@@ -0,0 +1,153 @@
+"""
+列式的K线解码.
+
+币安返回的一页K线直接转成一个NumPy结构化数组(int64的开盘时间, float64的OHLCV),
+而不是每一行都去构造一个BarData并调用pytz.localize. 只有在调用方真正需要BarData的时候
+(例如保存到SQL数据库或者回测), 才通过to_bars一次性构造.
+
+    [
+        1591258320000,      // 开盘时间
+        "9640.7",           // 开盘价
+        "9642.4",           // 最高价
+        "9640.6",           // 最低价
+        "9642.0",           // 收盘价(当前K线未结束的即为最新价)
+        "206",              // 成交量
+        1591258379999,      // 收盘时间
+        "2.13660389",       // 成交额(标的数量)
+        48,                 // 成交笔数
+        "119",              // 主动买入成交量
+        "1.23424865",      // 主动买入成交额(标的数量)
+        "0"                 // 请忽略该参数
+    ]
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from howtrader.trader.object import BarData
+
+CHINA_TZ = pytz.timezone("Asia/Shanghai")
+
+# 中国没有夏令时, 用固定的时差做向量化的时区转换.
+CHINA_OFFSET_MS = 8 * 60 * 60 * 1000
+CHINA_FIXED_TZ = timezone(timedelta(hours=8), "Asia/Shanghai")
+
+BAR_DTYPE = np.dtype([
+    ('datetime', np.int64),     # 开盘时间, 毫秒时间戳(UTC)
+    ('open', np.float64),
+    ('high', np.float64),
+    ('low', np.float64),
+    ('close', np.float64),
+    ('volume', np.float64),
+    ('turnover', np.float64),
+])
+
+# 币安K线每一列在BAR_DTYPE里的字段.
+KLINE_COLUMNS = (
+    (0, 'datetime'),
+    (1, 'open'),
+    (2, 'high'),
+    (3, 'low'),
+    (4, 'close'),
+    (5, 'volume'),
+    (7, 'turnover'),
+)
+
+
+def ms_to_datetime(timestamp: int) -> datetime:
+    """
+    毫秒时间戳转成北京时间.
+    """
+    return datetime.fromtimestamp(timestamp / 1000, CHINA_TZ)
+
+
+def datetime_to_ms(dt: datetime) -> int:
+    """
+    ms_to_datetime的逆运算, 没有时区的datetime按照北京时间处理.
+    """
+    if not dt.tzinfo:
+        dt = CHINA_TZ.localize(dt)
+    return int(dt.timestamp() * 1000)
+
+
+def decode_klines(datas: list) -> np.ndarray:
+    """
+    把一页币安K线解码成BAR_DTYPE的数组.
+    :param datas: 币安返回的K线, 每一行是一个list.
+    """
+    bars = np.empty(len(datas), dtype=BAR_DTYPE)
+    if not datas:
+        return bars
+
+    raw = np.array(datas, dtype=object)
+    for column, name in KLINE_COLUMNS:
+        bars[name] = raw[:, column].astype(bars.dtype[name])
+
+    return bars
+
+
+def decode_kline_csv(file, has_header: bool = False) -> np.ndarray:
+    """
+    解码币安历史数据(data.binance.vision)的K线csv, 列的顺序与REST接口一致.
+    :param file: 文件路径或者二进制流, 例如ZipFile.open返回的流, 不需要先解压到磁盘.
+    :param has_header: 新的合约文件第一行是列名.
+    """
+    columns = [column for column, _ in KLINE_COLUMNS]
+    frame = pd.read_csv(file, header=0 if has_header else None, usecols=columns)
+
+    bars = np.empty(len(frame), dtype=BAR_DTYPE)
+    for column, name in KLINE_COLUMNS:
+        bars[name] = frame[frame.columns[columns.index(column)]].to_numpy()
+
+    # 2025年之后的现货文件时间戳是微秒.
+    microseconds = bars['datetime'] > 10 ** 14
+    bars['datetime'][microseconds] //= 1000
+
+    return bars
+
+
+def china_datetimes(timestamps: np.ndarray) -> np.ndarray:
+    """
+    一次性把毫秒时间戳转成北京时间的datetime64[ms](不带时区).
+    """
+    return (np.asarray(timestamps, dtype=np.int64) + CHINA_OFFSET_MS).astype('datetime64[ms]')
+
+
+def to_bars(bars: np.ndarray, symbol: str, exchange, interval, gateway_name: str) -> List[BarData]:
+    """
+    按需构造BarData.
+    :param bars: BAR_DTYPE数组
+    :param exchange: Exchange.BINANCE
+    :param interval: Interval.MINUTE
+    """
+    datetimes = china_datetimes(bars['datetime']).astype(datetime)
+    columns = zip(
+        datetimes.tolist(),
+        bars['open'].tolist(),
+        bars['high'].tolist(),
+        bars['low'].tolist(),
+        bars['close'].tolist(),
+        bars['volume'].tolist(),
+        bars['turnover'].tolist(),
+    )
+
+    return [
+        BarData(
+            symbol=symbol,
+            exchange=exchange,
+            datetime=dt.replace(tzinfo=CHINA_FIXED_TZ),
+            interval=interval,
+            volume=volume,
+            turnover=turnover,
+            open_price=open_price,
+            high_price=high_price,
+            low_price=low_price,
+            close_price=close_price,
+            gateway_name=gateway_name,
+        )
+        for dt, open_price, high_price, low_price, close_price, volume, turnover in columns
+    ]
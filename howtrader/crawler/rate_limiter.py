@@ -0,0 +1,175 @@
+"""
+币安请求权重(weight)的令牌桶限流器.
+
+币安按照每分钟的请求权重来限频, 超过之后返回429, 继续请求会返回418并封禁IP.
+WeightRateLimiter按照每个请求的权重扣减令牌, 并根据响应头里的
+X-MBX-USED-WEIGHT-1M校准令牌数量. 服务器返回429/418的时候, 所有共享这个
+限流器的worker一起做带随机抖动的指数退避, 而不是各自固定sleep 10秒.
+
+同一个限流器可以同时给asyncio的协程(acquire)和线程(acquire_sync)使用.
+"""
+
+import asyncio
+import random
+import time
+from threading import Lock
+from typing import Mapping, Optional
+
+# 每分钟的权重上限, 以币安文档为准, 可以在创建限流器的时候修改.
+BINANCE_WEIGHT_LIMITS = {
+    'spot': 6000,
+    'usdt_future': 2400,
+    'inverse_future': 2400,
+}
+
+USED_WEIGHT_HEADERS = ("X-MBX-USED-WEIGHT-1M", "X-MBX-USED-WEIGHT-1m")
+
+BACKOFF_STATUS = (418, 429)
+
+
+def klines_weight(market: str, limit: int) -> int:
+    """
+    K线接口的请求权重.
+    :param market: spot, usdt_future, inverse_future
+    :param limit: 每页的条数
+    """
+    if market == 'spot':
+        return 2
+
+    if limit < 100:
+        return 1
+    elif limit < 500:
+        return 2
+    elif limit <= 1000:
+        return 5
+    return 10
+
+
+def agg_trades_weight(market: str) -> int:
+    """
+    归集成交(aggTrades)接口的请求权重.
+    """
+    return 4 if market == 'spot' else 20
+
+
+class WeightRateLimiter:
+    """
+    令牌桶: 容量为max_weight * safety, 每window秒匀速补满.
+    """
+
+    def __init__(
+        self,
+        max_weight: int = 1200,
+        window: float = 60,
+        safety: float = 0.9,
+        base_delay: float = 1.0,
+        max_delay: float = 300.0,
+    ):
+        """
+        :param max_weight: 交易所每个window的权重上限.
+        :param safety: 只使用上限的一部分, 给其他程序(例如实盘)留一些余量.
+        :param base_delay: 第一次退避的秒数, 之后每次翻倍.
+        :param max_delay: 退避的最大秒数.
+        """
+        self.capacity = max_weight * safety
+        self.rate = self.capacity / window
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.tokens = self.capacity
+        self.last_time = time.monotonic()
+        self.blocked_until = 0.0
+        self.attempts = 0
+
+        self.lock = Lock()
+
+    def _reserve(self, weight: int) -> float:
+        """
+        尝试扣减weight个令牌, 返回还需要等待的秒数, 0表示已经扣减成功.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_time) * self.rate)
+            self.last_time = now
+
+            if self.blocked_until > now:
+                return self.blocked_until - now
+
+            if self.tokens >= weight:
+                self.tokens -= weight
+                return 0
+
+            return (weight - self.tokens) / self.rate
+
+    async def acquire(self, weight: int = 1) -> None:
+        """
+        协程里使用, 等到有足够的令牌为止.
+        """
+        while True:
+            delay = self._reserve(weight)
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self, weight: int = 1) -> None:
+        """
+        线程里使用, 等到有足够的令牌为止.
+        """
+        while True:
+            delay = self._reserve(weight)
+            if not delay:
+                return
+            time.sleep(delay)
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """
+        用服务器返回的已用权重校准本地的令牌数量.
+        """
+        for key in USED_WEIGHT_HEADERS:
+            used = headers.get(key)
+            if used is not None:
+                break
+        else:
+            return
+
+        with self.lock:
+            self.tokens = min(self.tokens, self.capacity - int(used))
+
+    def on_success(self) -> None:
+        """
+        请求成功之后重置退避次数.
+        """
+        with self.lock:
+            self.attempts = 0
+
+    def backoff(self, retry_after: Optional[float] = None) -> float:
+        """
+        服务器拒绝(429/418)的时候调用, 所有共享的worker一起暂停.
+        同一次暂停期间其他worker的失败不再加倍, 只有暂停结束之后再被拒绝才加倍.
+        :param retry_after: 响应头里的Retry-After秒数, 有的话优先使用.
+        :return: 暂停的秒数
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, now + float(retry_after))
+                return self.blocked_until - now
+
+            delay = min(self.max_delay, self.base_delay * 2 ** self.attempts)
+            delay = random.uniform(delay / 2, delay)  # 抖动, 避免所有worker同时恢复
+            if retry_after:
+                delay = max(delay, float(retry_after))
+
+            self.attempts += 1
+            self.tokens = 0
+            self.blocked_until = now + delay
+            return delay
+
+    def retry_delay(self, attempt: int) -> float:
+        """
+        网络错误或者5xx的重试间隔, 只有出错的请求自己等待, 不暂停其他worker.
+        :param attempt: 这个请求已经重试的次数
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
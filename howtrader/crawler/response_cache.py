@@ -0,0 +1,128 @@
+"""
+K线原始响应的本地缓存.
+
+以请求(接口地址 + 排序后的参数)的sha1作为文件名, 保存zlib压缩后的原始响应:
+    root/ab/abcdef....z
+修改了解析或者时区处理之后, 带着同一个缓存重新运行下载, 命中的页直接从磁盘读取,
+不占用限频的权重, 只有没有命中的页才请求交易所. offline=True的时候完全不访问网络.
+
+超过max_bytes之后按最近使用的时间淘汰(LRU), 命中的时候会更新文件的修改时间.
+只缓存已经走完的K线, 最后一页还在变化的K线每次都重新请求.
+"""
+
+import hashlib
+import os
+import zlib
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+from urllib.parse import urlencode
+
+
+class ResponseCache:
+    """
+    线程安全, 下载的协程和线程可以共用一个.
+    """
+
+    def __init__(self, root: str, max_bytes: Optional[int] = None, level: int = 6):
+        """
+        :param root: 缓存目录
+        :param max_bytes: 缓存的大小上限(压缩之后), None表示不限制
+        :param level: zlib的压缩级别
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.level = level
+
+        self.lock = Lock()
+        self.size = sum(path.stat().st_size for path in self.root.glob("*/*.z"))
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    @staticmethod
+    def key(url: str, params: dict) -> str:
+        """
+        同一个接口同样的参数总是得到同一个key, 例如market/symbol/interval/startTime/limit.
+        """
+        query = urlencode(sorted((key, str(value)) for key, value in params.items()))
+        return hashlib.sha1(f"{url}?{query}".encode()).hexdigest()
+
+    def get_path(self, key: str) -> Path:
+        """"""
+        return self.root.joinpath(key[:2], f"{key[2:]}.z")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        :return: 原始的响应, 没有命中返回None
+        """
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as f:
+                body = zlib.decompress(f.read())
+            os.utime(path)
+        except (FileNotFoundError, zlib.error):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return body
+
+    def put(self, key: str, body: bytes) -> None:
+        """
+        先写临时文件再替换, 多个worker同时写同一个key也不会得到损坏的文件.
+        """
+        path = self.get_path(key)
+        path.parent.mkdir(exist_ok=True)
+
+        data = zlib.compress(body, self.level)
+        old_size = path.stat().st_size if path.exists() else 0
+
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{id(data)}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.size += len(data) - old_size
+
+        if self.max_bytes and self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        删除最久没有使用的文件, 直到缓存小于上限的90%.
+        """
+        with self.lock:
+            target = self.max_bytes * 0.9
+            if self.size <= target:
+                return
+
+            files = []
+            for path in self.root.glob("*/*.z"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+            files.sort()
+
+            size = sum(file[1] for file in files)
+            for _, file_size, path in files:
+                if size <= target:
+                    break
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                size -= file_size
+                self.evicted += 1
+
+            self.size = size
+
+    def __str__(self) -> str:
+        return f"缓存命中{self.hits}次, 未命中{self.misses}次, 淘汰{self.evicted}个文件, 占用{self.size / 1024 / 1024:.1f}MB"
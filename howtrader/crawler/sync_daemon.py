@@ -0,0 +1,155 @@
+"""
+常驻的增量同步.
+
+crawl_data.py的下载是一次性的, 实盘策略的load_bar()和每天晚上的回测还是要自己去请求API.
+SyncDaemon常驻运行, 在每个K线周期结束之后醒来, 把所有symbol新走完的K线放进同一批窗口,
+通过共享的限流器一次性并发地请求, 下载完之后调用一次on_batch写入, 数据库里就是一个事务.
+整个运行期间只有一个事件循环和一个长连接session, 每个周期不用重新建立连接和TLS握手.
+本地的数据总是最新的, 策略和回测直接读数据库或者bar_store就可以了.
+
+用法:
+    daemon = SyncDaemon('spot', ["BTCUSDT", "ETHUSDT"], save_kline_batch, database)
+    daemon.run_forever()
+"""
+
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
+import numpy as np
+
+from crawler.async_downloader import AsyncKlineDownloader, INTERVAL_MS, db_symbol, split_windows
+from crawler.crawler_metrics import CrawlerMetrics
+from crawler.kline_decoder import datetime_to_ms, ms_to_datetime
+from crawler.validator import BarValidator
+
+
+class SyncDaemon:
+    """
+    每个周期同步一次已经走完的K线.
+    """
+
+    def __init__(
+        self,
+        market: str,
+        symbols: List[str],
+        on_batch: Callable[[str, Dict[str, np.ndarray]], None],
+        source=None,
+        interval: str = '1m',
+        lookback_days: int = 3,
+        delay: float = 2.0,
+        validator: Optional[BarValidator] = None,
+        **kwargs,
+    ):
+        """
+        :param market: spot, usdt_future, inverse_future
+        :param symbols: ["BTCUSDT", "ETHUSDT"]
+        :param on_batch: on_batch(market, {symbol: bars}), 一次同步的所有K线, 应该在一个事务里写入.
+        :param source: 数据库或者bar_store, 启动的时候用get_bar_overview()查询每个symbol已经存到了哪里.
+        :param lookback_days: 本地还没有数据的symbol, 从多少天之前开始同步.
+        :param delay: 周期结束之后再等多少秒, 交易所需要一点时间才能返回最后一根K线.
+        :param validator: 写入之前检查K线.
+        其他参数传给AsyncKlineDownloader, 例如concurrency, proxy, limiter, cache.
+        """
+        self.market = market
+        self.symbols = symbols
+        self.on_batch = on_batch
+        self.interval_ms = INTERVAL_MS[interval]
+        self.lookback_days = lookback_days
+        self.delay = delay
+        self.validator = validator
+
+        self.pages: Dict[str, List[np.ndarray]] = {}
+        self.downloader = AsyncKlineDownloader(market, self.on_page, interval=interval, **kwargs)
+
+        # symbol: 本地最后一根K线的开盘时间
+        self.last_times: Dict[str, int] = {}
+        if source:
+            ends = {overview.symbol: overview.end for overview in source.get_bar_overview()
+                    if overview.interval.value == interval}
+            for symbol in symbols:
+                end = ends.get(db_symbol(symbol, market))
+                if end:
+                    self.last_times[symbol] = datetime_to_ms(end)
+
+        self.syncs = 0
+
+    async def on_page(self, symbol: str, market: str, bars: np.ndarray) -> None:
+        """"""
+        self.pages.setdefault(symbol, []).append(bars)
+
+    def run_forever(self) -> None:
+        """
+        在每个周期结束之后同步一次, Ctrl+C退出.
+        """
+        print(f"{self.market} 开始同步{len(self.symbols)}个symbol, 周期{self.interval_ms // 1000}秒")
+        try:
+            asyncio.run(self.sync_forever())
+        except KeyboardInterrupt:
+            print(f"{self.market} 停止同步, 共同步{self.syncs}次")
+
+    async def sync_forever(self) -> None:
+        """
+        所有周期共用一个session.
+        """
+        async with self.downloader.create_session() as session:
+            while True:
+                now = time.time() * 1000
+                wake = (now // self.interval_ms + 1) * self.interval_ms + self.delay * 1000
+                await asyncio.sleep((wake - now) / 1000)
+
+                try:
+                    await self.sync_once(session)
+                except Exception as error:
+                    # 下一个周期会从本地最后一根K线之后继续, 不会丢数据.
+                    print(f"{self.market} 同步失败: {error}")
+
+    async def sync_once(self, session: Optional[aiohttp.ClientSession] = None) -> int:
+        """
+        下载所有symbol最后一根K线之后、已经走完的K线, 并一次性写入.
+        :param session: 不传的时候这一次同步新建一个session.
+        :return: 写入的K线数量
+        """
+        start_time = time.perf_counter()
+        now = int(time.time() * 1000)
+        end = now // self.interval_ms * self.interval_ms  # 开盘时间小于end的K线都已经走完了
+        default_start = end - self.lookback_days * 24 * 60 * 60 * 1000
+
+        jobs = []
+        for symbol in self.symbols:
+            last = self.last_times.get(symbol)
+            start = last + self.interval_ms if last else default_start
+            for window in split_windows(start, end, self.interval_ms, self.downloader.limit):
+                jobs.append((symbol, window))
+
+        if not jobs:
+            return 0
+
+        self.pages = {}
+        self.downloader.metrics = CrawlerMetrics(verbose=False)
+        await self.downloader.download_windows(jobs, session)
+
+        batches: Dict[str, np.ndarray] = {}
+        for symbol, pages in self.pages.items():
+            bars = np.concatenate(pages)
+            bars = bars[bars['datetime'] < end]  # 还没有走完的K线不保存
+            bars = bars[np.unique(bars['datetime'], return_index=True)[1]]
+            if self.validator:
+                bars = self.validator.filter(symbol, self.market, bars)
+            if len(bars):
+                batches[symbol] = bars
+
+        count = sum(len(bars) for bars in batches.values())
+        errors = sum(self.downloader.metrics.errors.values())
+        if batches:
+            self.on_batch(self.market, batches)
+            # 有窗口失败的时候不知道缺的是哪一段, 下一次从原来的位置重新同步, 重复的K线写入的时候会覆盖.
+            if not errors:
+                for symbol, bars in batches.items():
+                    self.last_times[symbol] = int(bars['datetime'][-1])
+
+        self.syncs += 1
+        print(f"{ms_to_datetime(end)} {self.market} 同步{len(batches)}个symbol, {count}根K线, "
+              f"{len(jobs)}个请求, 失败{errors}个, 用时{time.perf_counter() - start_time:.2f}s")
+        return count
@@ -0,0 +1,247 @@
+"""
+列式的逐笔成交(aggTrades)存储.
+
+每笔成交只保存id(int64)、datetime(int64毫秒)、price(float64)、volume(float64)和side(int8,
+1为主动买入, -1为主动卖出), 一个月几千万笔成交也只有几百MB.
+
+目录结构: root/exchange/symbol/trades/YYYY-MM/{第一笔id}-{最后一笔id}.parquet.
+和ParquetBarStore不同, 每次写入都是一个新的分片文件, 不需要读出整个月的数据再合并,
+写入的速度不会随着月份文件变大而变慢. 每个分片里的id都是连续的, 所以只看文件名就知道
+哪些id已经下载过, 断点续传的时候只请求缺少的id范围.
+下载完成之后可以用compact把一个月的分片合并成一个文件.
+"""
+
+import os
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from crawler.bar_store import ParquetBarStore, month_of
+
+TRADE_DTYPE = np.dtype([
+    ('id', np.int64),
+    ('datetime', np.int64),
+    ('price', np.float64),
+    ('volume', np.float64),
+    ('side', np.int8),
+])
+
+TRADE_FOLDER = "trades"
+
+
+def decode_agg_trades(datas: list) -> np.ndarray:
+    """
+    把aggTrades接口返回的一页成交转换成TRADE_DTYPE数组.
+    [
+        {
+            "a": 26129,         // 归集成交ID
+            "p": "0.01633102",  // 成交价
+            "q": "4.70443515",  // 成交量
+            "f": 27781,         // 被归集的首个成交ID
+            "l": 27781,         // 被归集的末个成交ID
+            "T": 1498793709153, // 成交时间
+            "m": true,          // 是否为主动卖出单
+            "M": true           // 是否为最优撮合单(可忽略)
+        }
+    ]
+    """
+    trades = np.empty(len(datas), dtype=TRADE_DTYPE)
+    if not datas:
+        return trades
+
+    trades['id'] = [data['a'] for data in datas]
+    trades['datetime'] = [data['T'] for data in datas]
+    trades['price'] = np.array([data['p'] for data in datas]).astype(np.float64)
+    trades['volume'] = np.array([data['q'] for data in datas]).astype(np.float64)
+    trades['side'] = np.where([data['m'] for data in datas], -1, 1)
+    return trades
+
+
+class ParquetTradeStore:
+    """
+    按月分区、按id分片的成交存储.
+    """
+
+    def __init__(self, root: str):
+        """
+        :param root: 存储目录, 可以和ParquetBarStore共用.
+        """
+        self.root = Path(root)
+
+    def get_folder(self, symbol: str, exchange: str) -> Path:
+        """"""
+        return self.root.joinpath(exchange, symbol, TRADE_FOLDER)
+
+    def write(self, symbol: str, exchange: str, trades: np.ndarray) -> List[Path]:
+        """
+        写入TRADE_DTYPE数组, 按月份和id的断开处切分, 每一段写一个新的分片.
+        :param exchange: 交易所, 例如BINANCE
+        :return: 写入的分片文件
+        """
+        if not len(trades):
+            return []
+
+        _, ix = np.unique(trades['id'], return_index=True)
+        trades = trades[ix]
+
+        months = month_of(trades['datetime'])
+        breaks = np.flatnonzero((np.diff(trades['id']) != 1) | (months[1:] != months[:-1])) + 1
+        paths = []
+        for data in np.split(trades, breaks):
+            folder = self.get_folder(symbol, exchange).joinpath(str(month_of(data['datetime'][0])))
+            folder.mkdir(parents=True, exist_ok=True)
+            path = folder.joinpath(self.file_name(data))
+            self.write_file(path, data)
+            paths.append(path)
+        return paths
+
+    def read(
+        self,
+        symbol: str,
+        exchange: str,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        columns: Optional[Sequence[str]] = None,
+    ) -> np.ndarray:
+        """
+        读取[start, end]之间的成交.
+        :param start: 毫秒, None表示不限制
+        :param end: 毫秒, 闭区间, None表示不限制
+        :param columns: 需要读取的列, id和datetime总会被读取.
+        :return: 按id排序的结构化数组, 重复写入的成交只保留一笔.
+        """
+        names = list(TRADE_DTYPE.names)
+        if columns:
+            names = ['id', 'datetime'] + [name for name in columns if name not in ('id', 'datetime')]
+        dtype = np.dtype([(name, TRADE_DTYPE[name]) for name in names])
+
+        filters = []
+        if start is not None:
+            filters.append(('datetime', '>=', start))
+        if end is not None:
+            filters.append(('datetime', '<=', end))
+
+        first = month_of(start) if start is not None else None
+        last = month_of(end) if end is not None else None
+
+        parts = []
+        for month, paths in self.get_months(symbol, exchange):
+            if (first is not None and month < first) or (last is not None and month > last):
+                continue
+
+            for path in paths:
+                table = pq.read_table(path, columns=names, filters=filters or None)
+                if table.num_rows:
+                    parts.append(ParquetBarStore.table_to_array(table, dtype))
+
+        if not parts:
+            return np.empty(0, dtype=dtype)
+
+        trades = np.concatenate(parts)
+        if np.any(np.diff(trades['id']) <= 0):
+            _, ix = np.unique(trades['id'], return_index=True)
+            trades = trades[ix]
+        return trades
+
+    def id_ranges(self, symbol: str, exchange: str) -> np.ndarray:
+        """
+        已经保存的id范围, 只看文件名, 不读取文件.
+        :return: (n, 2)的数组, 每一行是[第一笔id, 最后一笔id], 相邻的范围已经合并.
+        """
+        ranges = [
+            [int(value) for value in path.stem.split("-")]
+            for _, paths in self.get_months(symbol, exchange) for path in paths
+        ]
+        if not ranges:
+            return np.empty((0, 2), dtype=np.int64)
+
+        ranges = np.array(sorted(ranges), dtype=np.int64)
+        # 下一段的开始和之前所有段的最大结束不相连的地方是新的一段
+        ends = np.maximum.accumulate(ranges[:, 1])
+        starts = np.flatnonzero(np.r_[True, ranges[1:, 0] > ends[:-1] + 1])
+        return np.column_stack([ranges[starts, 0], np.r_[ends[starts[1:] - 1], ends[-1]]])
+
+    def missing_ids(self, symbol: str, exchange: str, first: int, last: int) -> List[tuple]:
+        """
+        [first, last]之间还没有保存的id范围.
+        :return: [(第一笔id, 最后一笔id), ...]
+        """
+        missing = []
+        for start, end in self.id_ranges(symbol, exchange):
+            if end < first:
+                continue
+            if start > last:
+                break
+            if start > first:
+                missing.append((first, int(start) - 1))
+            first = int(end) + 1
+
+        if first <= last:
+            missing.append((first, last))
+        return missing
+
+    def last_trade_id(self, symbol: str, exchange: str) -> Optional[int]:
+        """
+        已经保存的最后一笔成交的id.
+        """
+        ranges = self.id_ranges(symbol, exchange)
+        return int(ranges[-1, 1]) if len(ranges) else None
+
+    def compact(self, symbol: str, exchange: str, month: str) -> None:
+        """
+        把一个月的分片合并成尽量少的文件, id不连续的地方仍然是不同的文件.
+        :param month: 例如2020-01
+        """
+        folder = self.get_folder(symbol, exchange).joinpath(month)
+        paths = sorted(folder.glob("*.parquet"))
+        if len(paths) < 2:
+            return
+
+        trades = self.read(symbol, exchange, *self.month_range(month))
+        written = self.write(symbol, exchange, trades)
+
+        for path in paths:
+            if path not in written:
+                path.unlink()
+
+    def get_months(self, symbol: str, exchange: str) -> List[tuple]:
+        """
+        :return: [(月份, [按id排序的分片文件]), ...], 按月份排序.
+        """
+        folder = self.get_folder(symbol, exchange)
+        if not folder.exists():
+            return []
+
+        months = []
+        for month_folder in sorted(folder.iterdir()):
+            paths = sorted(month_folder.glob("*.parquet"))
+            if paths:
+                months.append((np.datetime64(month_folder.name, 'M'), paths))
+        return months
+
+    @staticmethod
+    def file_name(trades: np.ndarray) -> str:
+        """"""
+        return f"{trades['id'][0]:012d}-{trades['id'][-1]:012d}.parquet"
+
+    @staticmethod
+    def month_range(month: str) -> tuple:
+        """
+        一个月的[start, end]毫秒时间戳(UTC).
+        """
+        start = np.datetime64(month, 'M')
+        return int(start.astype('datetime64[ms]').astype(np.int64)), \
+            int((start + 1).astype('datetime64[ms]').astype(np.int64)) - 1
+
+    @staticmethod
+    def write_file(path: Path, trades: np.ndarray) -> None:
+        """
+        先写临时文件再替换, 中途退出不会留下损坏的分片.
+        """
+        table = pa.table({name: trades[name] for name in trades.dtype.names})
+        tmp_path = path.with_suffix(".tmp")
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
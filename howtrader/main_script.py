@@ -14,6 +14,8 @@ from howtrader.gateway.binance import BinanceUsdtGateway
 from howtrader.app.cta_strategy import CtaStrategyApp
 from howtrader.app.cta_strategy.base import EVENT_CTA_LOG
 
+from recorder.book_recorder import BookRecorderEngine
+
 SETTINGS["log.level"] = INFO
 SETTINGS["log.file"] = True
 SETTINGS["log.active"] = True  
@@ -27,6 +29,10 @@ main_engine.add_gateway(BinanceUsdtGateway)
 cta_engine: CtaEngine = main_engine.add_app(CtaStrategyApp) # 添加cta引擎, 实际上就是初始化引擎
 main_engine.write_log("主引擎创建成功")
 
+recorder: BookRecorderEngine = main_engine.add_engine(BookRecorderEngine)  # 记录策略收到的盘口快照
+# recorder.add_recording("btcusdt.BINANCE")  # 只记录指定的合约, 默认记录所有收到的tick
+main_engine.write_log("盘口记录引擎创建成功")
+
 log_engine = main_engine.get_engine("log")
 event_engine.register(EVENT_CTA_LOG, log_engine.process_log_event)
 main_engine.write_log("注册日志事件监听")
@@ -0,0 +1,198 @@
+"""
+实盘的盘口快照记录引擎.
+
+Class16/17/18等策略只看tick.bid_price_1/ask_price_1下单, 但是没有保存它们当时面对的盘口,
+成交没办法复现. BookRecorderEngine监听EVENT_TICK, 把每个tick的1~N档盘口放进有界队列,
+由单独的写入线程攒成块, 压缩之后追加到每个symbol每天一个的快照文件里(见book_file.py).
+事件引擎的线程只做一次put_nowait, 不会被磁盘写入阻塞; 队列满了的时候丢弃tick并计数,
+内存占用的上限是队列长度加上每个symbol一个块.
+
+用法(main_script.py):
+    recorder: BookRecorderEngine = main_engine.add_engine(BookRecorderEngine)
+    recorder.add_recording("btcusdt.BINANCE")  # 不调用的时候记录收到的所有tick
+"""
+
+from datetime import datetime
+from pathlib import Path
+from queue import Queue, Empty, Full
+from threading import Thread
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+
+from howtrader.event import Event, EventEngine
+from howtrader.trader.engine import BaseEngine, MainEngine
+from howtrader.trader.event import EVENT_TICK
+from howtrader.trader.object import SubscribeRequest, TickData
+from howtrader.trader.utility import get_folder_path
+
+from recorder.book_file import BOOK_DEPTH, BookFileWriter, book_dtype
+
+APP_NAME = "BookRecorder"
+
+DAY_MS = 24 * 60 * 60 * 1000
+CHINA_OFFSET_MS = 8 * 60 * 60 * 1000  # 按北京时间切分每天的文件
+
+
+class BookRecorderEngine(BaseEngine):
+    """
+    盘口快照记录引擎.
+    """
+
+    def __init__(self, main_engine: MainEngine, event_engine: EventEngine):
+        """"""
+        super().__init__(main_engine, event_engine, APP_NAME)
+
+        self.root = Path(get_folder_path("book_recorder"))
+        self.depth = BOOK_DEPTH
+        self.dtype = book_dtype(self.depth)
+        self.block_size = 2000  # 每个块的快照数量
+        self.flush_interval = 10  # 没有写满的块最多等多少秒写入
+
+        self.vt_symbols: Set[str] = set()
+        self.queue: Queue = Queue(maxsize=100000)
+        self.dropped = 0
+        self.rows = 0
+        self.bytes = 0
+
+        self.buffers: Dict[str, List[tuple]] = {}
+        self.writers: Dict[str, Tuple[int, BookFileWriter]] = {}
+        self.last_flush = datetime.now()
+
+        self.active = True
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        self.register_event()
+
+    def register_event(self) -> None:
+        """"""
+        self.event_engine.register(EVENT_TICK, self.process_tick_event)
+
+    def add_recording(self, vt_symbol: str) -> None:
+        """
+        只记录指定的合约, 并订阅它的行情.
+        """
+        self.vt_symbols.add(vt_symbol)
+
+        contract = self.main_engine.get_contract(vt_symbol)
+        if not contract:
+            self.write_log(f"找不到合约：{vt_symbol}, 只记录已经订阅的行情")
+            return
+
+        req = SubscribeRequest(symbol=contract.symbol, exchange=contract.exchange)
+        self.main_engine.subscribe(req, contract.gateway_name)
+        self.write_log(f"添加盘口记录：{vt_symbol}")
+
+    def process_tick_event(self, event: Event) -> None:
+        """
+        在事件引擎的线程里调用, 只做转换和入队.
+        """
+        tick: TickData = event.data
+        if self.vt_symbols and tick.vt_symbol not in self.vt_symbols:
+            return
+
+        try:
+            self.queue.put_nowait((tick.vt_symbol, self.tick_to_row(tick)))
+        except Full:
+            self.dropped += 1
+
+    def tick_to_row(self, tick: TickData) -> tuple:
+        """
+        与book_dtype的字段顺序一致.
+        """
+        row = [int(tick.datetime.timestamp() * 1000)]
+        for side in ('bid', 'ask'):
+            row += [float(getattr(tick, f'{side}_price_{i}')) for i in range(1, self.depth + 1)]
+            row += [float(getattr(tick, f'{side}_volume_{i}')) for i in range(1, self.depth + 1)]
+        row += [float(tick.last_price), float(tick.volume)]
+        return tuple(row)
+
+    def run(self) -> None:
+        """
+        写入线程.
+        """
+        while self.active:
+            try:
+                vt_symbol, row = self.queue.get(timeout=1)
+            except Empty:
+                # 行情很少的时候也按flush_interval写入, 不要每秒都写一个很小的块
+                if (datetime.now() - self.last_flush).total_seconds() >= self.flush_interval:
+                    self.flush_all()
+                continue
+
+            buffer = self.buffers.setdefault(vt_symbol, [])
+            buffer.append(row)
+            if len(buffer) >= self.block_size:
+                self.flush(vt_symbol)
+
+            if (datetime.now() - self.last_flush).total_seconds() >= self.flush_interval:
+                self.flush_all()
+
+        # 退出之前把队列里剩下的写掉
+        while True:
+            try:
+                vt_symbol, row = self.queue.get_nowait()
+            except Empty:
+                break
+            self.buffers.setdefault(vt_symbol, []).append(row)
+        self.flush_all()
+
+    def flush_all(self) -> None:
+        """"""
+        for vt_symbol in list(self.buffers):
+            self.flush(vt_symbol)
+        self.last_flush = datetime.now()
+
+    def flush(self, vt_symbol: str) -> None:
+        """
+        把一个合约缓存的快照按天写成块.
+        """
+        buffer = self.buffers.get(vt_symbol)
+        if not buffer:
+            return
+
+        rows = np.array(buffer, dtype=self.dtype)
+        buffer.clear()
+
+        days = (rows['datetime'] + CHINA_OFFSET_MS) // DAY_MS
+        for day in np.unique(days):
+            try:
+                self.bytes += self.get_writer(vt_symbol, int(day)).write_block(rows[days == day], self.depth)
+                self.rows += int(np.count_nonzero(days == day))
+            except Exception as error:
+                self.write_log(f"{vt_symbol} 写入盘口快照失败: {error}")
+
+    def get_writer(self, vt_symbol: str, day: int) -> BookFileWriter:
+        """
+        每个合约每天一个文件, 换天的时候关闭前一天的文件.
+        """
+        current = self.writers.get(vt_symbol)
+        if current and current[0] == day:
+            return current[1]
+
+        if current:
+            current[1].close()
+
+        symbol, exchange = vt_symbol.rsplit(".", 1)
+        date = np.datetime64(day, 'D')
+        writer = BookFileWriter(self.root.joinpath(exchange, symbol, f"{date}.book"))
+        self.writers[vt_symbol] = (day, writer)
+        return writer
+
+    def write_log(self, msg: str) -> None:
+        """"""
+        self.main_engine.write_log(msg, APP_NAME)
+
+    def close(self) -> None:
+        """
+        MainEngine.close的时候调用, 写完缓存之后关闭文件.
+        """
+        self.active = False
+        self.thread.join()
+
+        for _, writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+
+        self.write_log(f"盘口记录停止, 共{self.rows}条快照, {self.bytes}字节, 丢弃{self.dropped}条")
@@ -0,0 +1,39 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# howtrader目录下的模块互相用crawler.xxx、backtester.xxx导入, 和直接运行脚本的时候一样.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1].joinpath("howtrader")))
+
+from crawler.kline_decoder import BAR_DTYPE  # noqa: E402
+
+MINUTE_MS = 60 * 1000
+
+
+def make_bars(close: np.ndarray, start: int, first_open: float, wick: float = 1, volume: float = 10) -> np.ndarray:
+    """
+    测试用的连续1分钟K线, 开盘价是上一根的收盘价.
+    :param close: 每一根的收盘价
+    :param start: 第一根的开盘时间, 毫秒
+    :param first_open: 第一根的开盘价
+    :param wick: 最高价和最低价超出实体的部分
+    """
+    count = len(close)
+    open_ = np.r_[first_open, close[:-1]]
+    bars = np.zeros(count, dtype=BAR_DTYPE)
+    bars['datetime'] = start + np.arange(count) * MINUTE_MS
+    bars['open'] = open_
+    bars['close'] = close
+    bars['high'] = np.maximum(open_, close) + wick
+    bars['low'] = np.minimum(open_, close) - wick
+    bars['volume'] = volume
+    return bars
+
+
+def sine_bars(start: int, days: int = 2) -> np.ndarray:
+    """
+    价格在30000附近振荡的1分钟K线, 网格策略会反复成交.
+    """
+    close = np.round(30000 + 50 * np.sin(np.arange(1, days * 24 * 60 + 1) / 30), 2)
+    return make_bars(close, start, 30000)
@@ -0,0 +1,67 @@
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+from crawler.archive_importer import find_archives, parse_archive_name, read_archive, read_archives
+from crawler.bar_store import ParquetBarStore
+from crawler.bar_writer import BarWriter
+from crawler.kline_decoder import decode_kline_csv
+
+FIXTURES = Path(__file__).resolve().parent.joinpath("fixtures")
+
+
+def test_decode_without_header():
+    with zipfile.ZipFile(FIXTURES.joinpath("BTCUSDT-1m-2021-01.zip")) as zip_file:
+        with zip_file.open("BTCUSDT-1m-2021-01.csv") as file:
+            bars = decode_kline_csv(file)
+
+    assert len(bars) == 5
+    assert bars['datetime'][0] == 1609459200000
+    assert np.all(np.diff(bars['datetime']) == 60000)
+    assert bars['open'][0] == 29000 and bars['close'][0] == 29000.5
+    assert bars['high'][0] == 29001.5 and bars['low'][0] == 28999
+    assert bars['volume'][4] == 14
+
+
+def test_read_archive_with_header_and_microseconds():
+    symbol, bars = read_archive(FIXTURES.joinpath("ETHUSDT-1m-2024-01.zip"))
+    assert symbol == "ETHUSDT"
+    assert len(bars) == 4  # 列名不会被当作一根K线
+    assert bars['datetime'][0] == 1704067200000
+    assert bars['close'][3] == 2283.25
+
+    # 2025年之后的现货文件时间戳是微秒
+    _, bars = read_archive(FIXTURES.joinpath("BTCUSDT-1m-2025-01.zip"))
+    assert list(bars['datetime']) == [1735689600000, 1735689660000, 1735689720000]
+
+    assert parse_archive_name(FIXTURES.joinpath("BTCUSDT-1m-2021-01-01.zip")) == ("BTCUSDT", "1m")
+    assert len(find_archives(str(FIXTURES))) == 3
+
+
+def import_fixtures(store: ParquetBarStore) -> int:
+    """和crawl_data.py import --store一样经过BarWriter写入."""
+    count = 0
+
+    def sink(symbol, market, bars):
+        store.write(symbol.lower(), "BINANCE", "1m", bars)
+
+    with BarWriter(sink) as writer:
+        for symbol, bars in read_archives(str(FIXTURES), '1m', workers=2):
+            writer.put(symbol, 'spot', bars)
+            count += len(bars)
+    return count
+
+
+def test_import_is_idempotent(tmp_path):
+    store = ParquetBarStore(str(tmp_path))
+
+    assert import_fixtures(store) == 12
+    btc = store.read("btcusdt", "BINANCE", "1m")
+    eth = store.read("ethusdt", "BINANCE", "1m")
+    assert len(btc) == 8 and len(eth) == 4
+
+    # 重新导入同样的文件不会产生重复的K线, 数据也不变
+    assert import_fixtures(store) == 12
+    assert np.array_equal(store.read("btcusdt", "BINANCE", "1m"), btc)
+    assert np.array_equal(store.read("ethusdt", "BINANCE", "1m"), eth)
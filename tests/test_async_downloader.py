@@ -0,0 +1,94 @@
+import asyncio
+
+import numpy as np
+
+from howtrader.trader.constant import Exchange, Interval
+
+from crawler.async_downloader import AsyncKlineDownloader, db_symbol
+from crawler.bar_store import ParquetBarStore
+from crawler.checkpoint import DatabaseCheckpoint
+from crawler.rate_limiter import WeightRateLimiter
+from crawler.stub_server import KlineStubServer
+
+MINUTE_MS = 60 * 1000
+START = 1609459200000  # 2021-01-01 UTC
+END = START + 3 * 24 * 60 * MINUTE_MS  # 4320根K线, 5个窗口
+
+
+def create_downloader(server, on_page, **kwargs) -> AsyncKlineDownloader:
+    limiter = WeightRateLimiter(10 ** 9, base_delay=0.01)
+    return AsyncKlineDownloader('spot', on_page, base_url=server.url, limiter=limiter, **kwargs)
+
+
+def assert_complete(times: np.ndarray) -> None:
+    assert len(times) == (END - START) // MINUTE_MS
+    assert times[0] == START
+    assert times[-1] == END - MINUTE_MS
+    assert np.all(np.diff(times) == MINUTE_MS)
+
+
+def test_download_windows_complete_with_429():
+    server = KlineStubServer(now=END + MINUTE_MS)
+    server.start()
+    pages = []
+
+    def on_page(symbol, market, bars):
+        pages.append(bars)
+
+    try:
+        server.inject_errors(429)
+        downloader = create_downloader(server, on_page, concurrency=3)
+        asyncio.run(downloader.download(["BTCUSDT"], START, END))
+    finally:
+        server.stop()
+
+    assert server.rejected == 1
+    assert downloader.retries == 1
+    assert len(pages) == 5
+
+    # 每一页内部递增, 按第一根排序之后首尾相接, 没有重叠.
+    pages.sort(key=lambda page: page['datetime'][0])
+    for page in pages:
+        assert np.all(np.diff(page['datetime']) > 0)
+    assert_complete(np.concatenate([page['datetime'] for page in pages]))
+
+
+def test_resume_after_interrupt(tmp_path):
+    server = KlineStubServer(now=END + MINUTE_MS)
+    server.start()
+    store = ParquetBarStore(str(tmp_path))
+    symbol = db_symbol("BTCUSDT", 'spot')
+
+    async def interrupted():
+        task = None
+
+        async def on_page(_, market, bars):
+            store.write(symbol, Exchange.BINANCE.value, Interval.MINUTE.value, bars)
+            if len(store.read(symbol, Exchange.BINANCE.value, Interval.MINUTE.value)) >= 2000:
+                task.cancel()  # 下载到一半的时候中断
+
+        downloader = create_downloader(server, on_page, concurrency=1)
+        task = asyncio.ensure_future(downloader.download(["BTCUSDT"], START, END))
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def on_page(_, market, bars):
+        store.write(symbol, Exchange.BINANCE.value, Interval.MINUTE.value, bars)
+
+    try:
+        asyncio.run(interrupted())
+        first = len(store.read(symbol, Exchange.BINANCE.value, Interval.MINUTE.value))
+        assert 0 < first < (END - START) // MINUTE_MS
+
+        requests = server.requests
+        checkpoint = DatabaseCheckpoint(store, Exchange.BINANCE, Interval.MINUTE, MINUTE_MS)
+        downloader = create_downloader(server, on_page, concurrency=3, checkpoint=checkpoint)
+        asyncio.run(downloader.download(["BTCUSDT"], START, END))
+    finally:
+        server.stop()
+
+    # 一次查询第一根K线, 已经完整的窗口不再请求.
+    assert server.requests - requests == 1 + 5 - first // 1000
+    assert_complete(store.read(symbol, Exchange.BINANCE.value, Interval.MINUTE.value)['datetime'])
@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+import pytest
+
+from crawler.bar_writer import BarWriter, DuplicateFilter
+from crawler.trade_store import TRADE_DTYPE
+
+KEY = ("BTCUSDT", "spot")
+
+
+def trades(first: int, last: int) -> np.ndarray:
+    page = np.zeros(last - first + 1, dtype=TRADE_DTYPE)
+    page['id'] = np.arange(first, last + 1)
+    return page
+
+
+def test_filter_out_of_order_and_overlapping_pages():
+    dedup = DuplicateFilter('id')
+    assert len(dedup.filter(KEY, trades(1000, 1999))) == 1000
+    assert len(dedup.filter(KEY, trades(0, 999))) == 1000
+    assert len(dedup.filter(KEY, trades(3000, 3999))) == 1000
+
+    # 和前后两页都有重叠, 只剩中间缺少的部分
+    page = dedup.filter(KEY, trades(1500, 3500))
+    assert list(page['id']) == list(range(2000, 3000))
+    assert dedup.duplicates == 1001
+
+    # 页内重复
+    repeated = np.concatenate([trades(5000, 5009), trades(5005, 5014)])
+    assert list(dedup.filter(KEY, repeated)['id']) == list(range(5000, 5015))
+
+    # 其他symbol互不影响
+    assert len(dedup.filter(("ETHUSDT", "spot"), trades(0, 999))) == 1000
+
+    firsts, lasts, segments = dedup.written[KEY]
+    assert all(last < first for last, first in zip(lasts, firsts[1:]))
+    assert np.array_equal(np.concatenate(segments), np.r_[0:4000, 5000:5015])
+
+
+def test_filter_cost_does_not_grow_with_history():
+    dedup = DuplicateFilter('id')
+    start = time.perf_counter()
+    for i in range(2000):
+        dedup.filter(KEY, trades(i * 1000, i * 1000 + 999))
+    # 200万个id, 每一页都和所有写过的id合并的时候要几分钟
+    assert time.perf_counter() - start < 5
+    assert dedup.duplicates == 0
+
+
+def test_writer_skips_rewritten_trades():
+    written = []
+    with BarWriter(lambda symbol, market, page: written.append(page), key='id') as writer:
+        writer.put(*KEY, trades(0, 999))
+        writer.put(*KEY, trades(500, 1499))
+    ids = np.concatenate(written)['id']
+    assert np.array_equal(np.sort(ids), np.arange(1500))
+
+
+def test_writer_surfaces_sink_failure():
+    def sink(symbol, market, page):
+        raise IOError("disk full")
+
+    writer = BarWriter(sink, max_pages=2, batch_size=1, key='id')
+    writer.start()
+    writer.put(*KEY, trades(0, 999))
+    while writer.error is None:
+        time.sleep(0.01)
+
+    # 没写进去的id不能记为已写, 重新下载之后还要再写
+    assert len(writer.dedup.select(KEY, trades(0, 999))) == 1000
+
+    with pytest.raises(Exception, match="disk full"):
+        writer.put(*KEY, trades(1000, 1999))
+    with pytest.raises(IOError):
+        writer.stop()
+    assert not writer.thread.is_alive()
+
+
+def test_writer_without_key_writes_everything():
+    written = []
+    with BarWriter(lambda symbol, market, page: written.append(page), key=None) as writer:
+        writer.put(*KEY, trades(0, 999))
+        writer.put(*KEY, trades(500, 1499))
+    assert writer.dedup is None
+    assert len(np.concatenate(written)) == 2000
@@ -0,0 +1,15 @@
+from argparse import Namespace
+
+from bench_crawler import run_mode
+
+
+def test_bench_modes_download_everything():
+    args = Namespace(symbols=2, days=3, latency=0.0, weight_window=1, error_rate=0.05)
+    expected = args.symbols * args.days * 24 * 60
+
+    for name, concurrency, max_weight in (("async-c1", 1, None), ("async-c3", 3, None), ("async+ratelimit", 8, 20)):
+        result = run_mode(name, concurrency, args, max_weight)
+        assert result["bars"] == expected, result
+        assert result["connections_reused"] > 0
+        # 服务器返回的每一个500和429都被重试了一次, 没有丢页
+        assert result["retries"] == result["errors"] + result["rejected"]
@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+
+from recorder.book_file import BLOCK_HEADER, INDEX_DTYPE, BookFileWriter, book_dtype, load_index, read_book
+
+SECOND_MS = 1000
+START = 1609459200000  # 2021-01-01 UTC
+
+
+def snapshots(first: int, last: int, depth: int = 5) -> np.ndarray:
+    rows = np.zeros(last - first, dtype=book_dtype(depth))
+    rows['datetime'] = START + np.arange(first, last) * SECOND_MS
+    rows['bid_price_1'] = 100 + np.arange(first, last)
+    rows['ask_price_1'] = rows['bid_price_1'] + 0.5
+    return rows
+
+
+def write_blocks(path, blocks) -> None:
+    writer = BookFileWriter(path)
+    for rows in blocks:
+        writer.write_block(rows, 5)
+    writer.close()
+
+
+def test_round_trip_and_filter(tmp_path):
+    path = tmp_path / "2021-01-01.book"
+    # 第二个块里的tick没有按时间排序, 索引里记录的是最早和最晚的时间
+    second = snapshots(100, 200)[::-1].copy()
+    write_blocks(path, [snapshots(0, 100), second, snapshots(200, 300)])
+
+    index = load_index(path)
+    assert len(index) == 3
+    assert index['start'][1] == START + 100 * SECOND_MS
+    assert index['end'][1] == START + 199 * SECOND_MS
+
+    rows = read_book(path)
+    assert len(rows) == 300
+    assert np.array_equal(np.sort(rows['datetime']), START + np.arange(300) * SECOND_MS)
+
+    rows = read_book(path, START + 150 * SECOND_MS, START + 250 * SECOND_MS)
+    assert np.array_equal(np.sort(rows['datetime']), START + np.arange(150, 251) * SECOND_MS)
+    assert np.array_equal(rows['ask_price_1'] - rows['bid_price_1'], np.full(len(rows), 0.5))
+
+    assert not len(read_book(path, START + 1000 * SECOND_MS))
+
+
+def test_recover_truncated_index(tmp_path):
+    path = tmp_path / "2021-01-01.book"
+    write_blocks(path, [snapshots(0, 100), snapshots(100, 200), snapshots(200, 300)])
+
+    # 索引只写完了第一条和半条, 最后一条指向的块不在文件末尾结束
+    index_path = path.with_suffix(".idx")
+    os.truncate(index_path, INDEX_DTYPE.itemsize + INDEX_DTYPE.itemsize // 2)
+
+    assert len(load_index(path)) == 3
+    assert len(read_book(path, START + 250 * SECOND_MS)) == 50
+
+
+def test_recover_truncated_book(tmp_path):
+    path = tmp_path / "2021-01-01.book"
+    write_blocks(path, [snapshots(0, 100), snapshots(100, 200), snapshots(200, 300)])
+
+    # 最后一个块只写了一半, 索引是完整的
+    last = load_index(path)[-1]
+    os.truncate(path, int(last['offset']) + BLOCK_HEADER.size + 10)
+
+    index = load_index(path)
+    assert len(index) == 2
+    rows = read_book(path)
+    assert np.array_equal(rows['datetime'], START + np.arange(200) * SECOND_MS)
@@ -0,0 +1,38 @@
+import asyncio
+
+import numpy as np
+
+from crawler.funding import AsyncFundingDownloader, FUNDING_INTERVAL_MS, FUNDING_LIMIT
+from crawler.rate_limiter import WeightRateLimiter
+from crawler.stub_server import KlineStubServer
+
+HOUR_MS = 60 * 60 * 1000
+START = 1609459200000  # 2021-01-01 UTC
+END = START + 3 * FUNDING_LIMIT * FUNDING_INTERVAL_MS // 2  # 2个窗口
+
+
+def test_download_pages_within_window():
+    # 每小时结算一次, 一个8小时x1000的窗口里有8000条, 要翻8页.
+    server = KlineStubServer(now=END + HOUR_MS, funding_interval_ms=HOUR_MS)
+    server.start()
+    pages = []
+
+    def on_page(symbol, market, funding):
+        pages.append(funding)
+
+    try:
+        limiter = WeightRateLimiter(10 ** 9, base_delay=0.01)
+        downloader = AsyncFundingDownloader(on_page, base_url=server.url, limiter=limiter)
+        asyncio.run(downloader.download(["BTCUSDT"], START, END))
+    finally:
+        server.stop()
+
+    assert len(pages) == 2
+    # 第一个窗口正好8页满页, 还要再请求一次空页才知道结束; 第二个窗口同理是4页加一次空页.
+    assert server.requests == 9 + 5
+
+    times = np.sort(np.concatenate([page['datetime'] for page in pages]))
+    assert times[0] == START
+    assert len(times) == (END - START) // HOUR_MS
+    assert times[-1] == END - HOUR_MS
+    assert np.all(np.diff(times) == HOUR_MS)
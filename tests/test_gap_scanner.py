@@ -0,0 +1,28 @@
+import numpy as np
+
+from howtrader.trader.constant import Exchange, Interval
+
+from crawler.bar_store import ParquetBarStore
+from crawler.gap_scanner import database_timestamps, scan_gaps
+from crawler.kline_decoder import BAR_DTYPE
+
+MINUTE_MS = 60 * 1000
+START = 1609459200000  # 2021-01-01 UTC
+
+
+def test_scan_store_gaps(tmp_path):
+    store = ParquetBarStore(str(tmp_path))
+    bars = np.zeros(100, dtype=BAR_DTYPE)
+    bars['datetime'] = START + np.arange(100) * MINUTE_MS
+    bars = np.delete(bars, np.r_[10:15, 50])
+    store.write("btcusdt", Exchange.BINANCE.value, Interval.MINUTE.value, bars)
+
+    load = database_timestamps(store, Exchange.BINANCE, Interval.MINUTE)
+    assert load("btcusdt", START, START + 99 * MINUTE_MS).dtype == np.int64
+
+    gaps = scan_gaps(load, ["btcusdt"], START, START + 109 * MINUTE_MS, MINUTE_MS)["btcusdt"]
+    assert (gaps - START).tolist() == [
+        [10 * MINUTE_MS, 14 * MINUTE_MS],
+        [50 * MINUTE_MS, 50 * MINUTE_MS],
+        [100 * MINUTE_MS, 109 * MINUTE_MS],
+    ]
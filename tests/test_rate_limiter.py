@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from crawler.async_downloader import AsyncKlineDownloader
+from crawler.rate_limiter import WeightRateLimiter
+from crawler.stub_server import KlineStubServer
+
+START = 1609459200000  # 2021-01-01 UTC
+
+
+def test_concurrent_backoff_escalates_once():
+    limiter = WeightRateLimiter(1200, base_delay=0.2, max_delay=300)
+
+    # 8个worker被同一次429拒绝
+    delays = [limiter.backoff() for _ in range(8)]
+    assert limiter.attempts == 1
+    assert max(delays) <= 0.2
+
+    time.sleep(limiter.blocked_until - time.monotonic())
+    limiter.backoff()
+    assert limiter.attempts == 2
+
+
+def test_backoff_honors_retry_after():
+    limiter = WeightRateLimiter(1200, base_delay=0.01)
+    limiter.backoff()
+    delay = limiter.backoff(retry_after=2)
+    assert limiter.attempts == 1
+    assert 1.9 < delay <= 2
+
+
+def test_client_error_is_not_retried():
+    server = KlineStubServer(now=START + 24 * 60 * 60 * 1000)
+    server.start()
+    pages = []
+
+    limiter = WeightRateLimiter(10 ** 9, base_delay=1)
+    downloader = AsyncKlineDownloader('spot', lambda *args: pages.append(args), base_url=server.url,
+                                      limiter=limiter, concurrency=1)
+    try:
+        server.inject_errors(400)
+        asyncio.run(downloader.download_windows([("BTCUSDT", (START, START + 999 * 60 * 1000))]))
+    finally:
+        server.stop()
+
+    assert server.requests == 1
+    assert downloader.retries == 0
+    assert limiter.attempts == 0 and limiter.blocked_until == 0
+    assert sum(downloader.metrics.errors.values()) == 1
+    assert not pages
@@ -0,0 +1,48 @@
+import numpy as np
+
+from crawler.bar_store import ParquetBarStore
+from crawler.kline_decoder import CHINA_OFFSET_MS
+from crawler.resample import resample_bars, update_derived_bars
+
+from conftest import make_bars
+
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+DAY_START = 1609459200000 - CHINA_OFFSET_MS  # 2021-01-01 00:00 北京时间
+
+
+def minute_bars(start: int, count: int) -> np.ndarray:
+    return make_bars(100.5 + np.arange(count), start, 100, wick=0.5, volume=1)
+
+
+def test_resample_clock_aligned():
+    bars = minute_bars(DAY_START + 3 * MINUTE_MS, 60)  # 从00:03开始
+    hours = resample_bars(bars, HOUR_MS, include_partial=True)
+    assert list(hours['datetime']) == [DAY_START, DAY_START + HOUR_MS]
+    assert hours['open'][0] == 100 and hours['close'][0] == 156.5
+    assert hours['high'][0] == 157 and hours['volume'][0] == 57
+
+    # 最后一个周期还没有走完
+    assert len(resample_bars(bars, HOUR_MS)) == 1
+
+
+def test_backfill_regenerates_derived_bars(tmp_path):
+    store = ParquetBarStore(str(tmp_path))
+    day = 24 * HOUR_MS
+
+    store.write("btcusdt", "BINANCE", "1m", minute_bars(DAY_START + day, 24 * 60))
+    assert update_derived_bars(store, "btcusdt", "BINANCE", ["1h", "1d"]) == {"1h": 24, "1d": 1}
+
+    # 回补前一天, 只增量合成的时候不会出现在1h里
+    backfill = minute_bars(DAY_START, 24 * 60)
+    store.write("btcusdt", "BINANCE", "1m", backfill)
+    assert update_derived_bars(store, "btcusdt", "BINANCE", ["1h"]) == {"1h": 0}
+
+    counts = update_derived_bars(store, "btcusdt", "BINANCE", ["1h", "1d"], since=int(backfill['datetime'][0]))
+    assert counts == {"1h": 48, "1d": 2}
+
+    hours = store.read("btcusdt", "BINANCE", "1h")
+    assert len(hours) == 48
+    assert np.all(np.diff(hours['datetime']) == HOUR_MS)
+    assert hours['datetime'][0] == DAY_START
+    assert store.read("btcusdt", "BINANCE", "1d")['datetime'][0] == DAY_START
@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from howtrader.app.cta_strategy import CtaTemplate
+from howtrader.app.cta_strategy.backtesting import BacktestingEngine
+from howtrader.trader.constant import Interval
+
+from backtester import sweep
+from backtester.shared_bars import SharedBarArray
+from backtester.sweep import expand_grid, is_tick_strategy, run_sweep
+from backtester.tick_replay import bar_ticks
+from strategies.class_12_fixed_trade_time_strategy import Class12FixedTradeTimeStrategy
+from strategies.class_19_future_profit_grid_strategy import Class19FutureProfitGridStrategy
+
+from conftest import sine_bars
+
+START = 1609430400000  # 2021-01-01 00:00 北京时间
+
+ENGINE_SETTING = dict(
+    vt_symbol="btcusdt.BINANCE",
+    interval=Interval.MINUTE,
+    start=datetime(2021, 1, 1),
+    end=datetime(2021, 1, 3),
+    rate=1 / 1000,
+    slippage=0,
+    size=1,
+    pricetick=0.01,
+    capital=300000,
+)
+
+
+class BrokenStrategy(CtaTemplate):
+    """"""
+    broken = 1
+    parameters = ["broken"]
+
+    def on_init(self):
+        raise ValueError("broken")
+
+
+def load_sine_bars(engine_setting: dict, use_store: bool = False, ticks: bool = False) -> SharedBarArray:
+    """
+    代替数据库: 两天的1分钟K线, 价格在30000附近振荡, 网格策略会反复成交.
+    """
+    bars = sine_bars(START)
+    return SharedBarArray.create(bar_ticks(bars, spread=0.01) if ticks else bars)
+
+
+def test_tick_strategy_detection():
+    assert is_tick_strategy(Class19FutureProfitGridStrategy)
+    assert not is_tick_strategy(Class12FixedTradeTimeStrategy)
+
+
+def test_grid_strategy_sweep_uses_tick_engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep, "load_shared_bars", load_sine_bars)
+    output = str(tmp_path / "sweep.csv")
+
+    settings = expand_grid({"grid_step": [2.0, 5.0]})
+    result = run_sweep(Class19FutureProfitGridStrategy, settings, ENGINE_SETTING, output, workers=2)
+
+    assert len(result) == 2
+    assert (result["total_trade_count"] > 0).all()
+    assert len(pd.read_csv(output)) == 2
+
+
+def test_bar_engine_rejects_tick_strategy(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep, "load_shared_bars", load_sine_bars)
+
+    with pytest.raises(Exception, match="TickReplayEngine"):
+        run_sweep(Class19FutureProfitGridStrategy, [{"grid_step": 2.0}], ENGINE_SETTING, str(tmp_path / "sweep.csv"),
+                  engine_class=BacktestingEngine)
+
+
+def test_all_failed_runs_raise(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep, "load_shared_bars", load_sine_bars)
+
+    with pytest.raises(Exception, match="全部回测失败"):
+        run_sweep(BrokenStrategy, [{"broken": 1}, {"broken": 2}], ENGINE_SETTING, str(tmp_path / "sweep.csv"),
+                  workers=1)
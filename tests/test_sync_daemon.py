@@ -0,0 +1,35 @@
+import asyncio
+import time
+
+from crawler.rate_limiter import WeightRateLimiter
+from crawler.stub_server import KlineStubServer
+from crawler.sync_daemon import SyncDaemon
+
+MINUTE_MS = 60 * 1000
+
+
+def test_syncs_share_one_session():
+    server = KlineStubServer(now=int(time.time() * 1000) + MINUTE_MS)
+    server.start()
+    batches = []
+
+    daemon = SyncDaemon('spot', ["BTCUSDT"], lambda market, bars: batches.append(bars), lookback_days=1,
+                        base_url=server.url, limiter=WeightRateLimiter(10 ** 9), concurrency=1)
+
+    async def sync_twice():
+        async with daemon.downloader.create_session() as session:
+            for _ in range(2):
+                daemon.last_times.clear()  # 每次都从头同步一天
+                await daemon.sync_once(session)
+
+    try:
+        asyncio.run(sync_twice())
+    finally:
+        server.stop()
+
+    assert daemon.syncs == 2
+    assert len(batches) == 2 and len(batches[0]["BTCUSDT"]) >= 1440
+    # 两次同步的所有请求都在同一个连接上
+    stats = daemon.downloader.connection_stats
+    assert stats.requests == server.requests >= 4
+    assert stats.created == 1
@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from howtrader.app.cta_strategy import CtaTemplate
+from howtrader.trader.constant import Direction, Interval
+from howtrader.trader.event import EVENT_TIMER
+
+from backtester.tick_replay import TickReplayEngine, bar_ticks, trade_ticks
+from crawler.kline_decoder import BAR_DTYPE
+from crawler.trade_store import TRADE_DTYPE
+from strategies.class_18_high_frequency_strategy import Class18HighFrequencyStrategy
+
+from conftest import sine_bars
+
+MINUTE_MS = 60 * 1000
+START = 1609430400000  # 2021-01-01 00:00 北京时间
+
+
+class TimerStrategy(CtaTemplate):
+    """
+    记录开始交易之后的tick和定时器的时间.
+    """
+
+    def __init__(self, cta_engine, strategy_name, vt_symbol, setting):
+        """"""
+        super().__init__(cta_engine, strategy_name, vt_symbol, setting)
+        self.tick_times = []
+        self.timer_times = []
+
+    def on_start(self):
+        self.cta_engine.event_engine.register(EVENT_TIMER, self.process_timer_event)
+
+    def process_timer_event(self, event):
+        self.timer_times.append(self.cta_engine.datetime)
+
+    def on_tick(self, tick):
+        if self.trading:
+            self.tick_times.append(tick.datetime)
+
+
+def create_engine() -> TickReplayEngine:
+    engine = TickReplayEngine()
+    engine.output = lambda msg: None
+    engine.set_parameters(
+        vt_symbol="btcusdt.BINANCE",
+        interval=Interval.MINUTE,
+        start=datetime(2021, 1, 1),
+        end=datetime(2021, 1, 3),
+        rate=1 / 1000,
+        slippage=0,
+        size=1,
+        pricetick=0.01,
+        capital=300000,
+    )
+    return engine
+
+
+def test_bar_ticks_follow_ohlc_path():
+    bars = np.zeros(2, dtype=BAR_DTYPE)
+    bars['datetime'] = [START, START + MINUTE_MS]
+    bars['open'] = [10, 11]
+    bars['high'] = [12, 13]
+    bars['low'] = [9, 8]
+    bars['close'] = [11, 9]  # 阳线, 阴线
+    bars['volume'] = [8, 4]
+
+    ticks = bar_ticks(bars, spread=0.5)
+
+    assert list(ticks['last_price']) == [10, 9, 12, 11, 11, 13, 8, 9]
+    assert list(ticks['datetime'] - START) == [0, 15000, 30000, 45000, 60000, 75000, 90000, 105000]
+    assert list(ticks['volume']) == [2] * 4 + [1] * 4
+    assert np.all(ticks['ask_price_1'] == ticks['bid_price_1'] + 0.5)
+
+
+def test_trade_ticks_keep_last_trade_per_interval():
+    trades = np.zeros(5, dtype=TRADE_DTYPE)
+    trades['id'] = np.arange(5)
+    trades['datetime'] = START + np.array([0, 300, 900, 1200, 2500])
+    trades['price'] = [100, 101, 102, 103, 104]
+    trades['volume'] = [1, 2, 3, 4, 5]
+    trades['side'] = [1, 1, -1, 1, -1]
+
+    ticks = trade_ticks(trades, spread=0.5, min_interval_ms=1000)
+
+    assert list(ticks['datetime'] - START) == [900, 1200, 2500]
+    assert list(ticks['last_price']) == [102, 103, 104]
+    assert list(ticks['volume']) == [6, 4, 5]
+    # 主动买入在卖一成交, 主动卖出在买一成交
+    assert list(ticks['bid_price_1']) == [102, 102.5, 104]
+    assert list(ticks['ask_price_1']) == [102.5, 103, 104.5]
+
+
+def test_timer_count_matches_elapsed_time():
+    engine = create_engine()
+    engine.add_strategy(TimerStrategy, {})
+    engine.set_ticks(bar_ticks(sine_bars(START), spread=0.01))
+    engine.run_backtesting()
+
+    strategy = engine.strategy
+    first, last = strategy.tick_times[0], strategy.tick_times[-1]
+    elapsed = int((last - first).total_seconds())
+
+    assert elapsed > 0
+    assert len(strategy.timer_times) == elapsed
+    assert engine.timer_count == elapsed
+    assert strategy.timer_times[0] == first + timedelta(seconds=1)
+    assert strategy.timer_times[-1] == last
+    assert all(b - a == timedelta(seconds=1) for a, b in zip(strategy.timer_times, strategy.timer_times[1:]))
+
+
+def test_grid_strategy_places_and_fills_orders():
+    engine = create_engine()
+    engine.add_strategy(Class18HighFrequencyStrategy, {"grid_step": 5.0, "trading_size": 0.01, "max_pos": 10.0})
+    engine.set_ticks(bar_ticks(sine_bars(START), spread=0.01))
+    engine.run_backtesting()
+
+    trades = list(engine.trades.values())
+    directions = {trade.direction for trade in trades}
+    assert len(engine.limit_orders) > len(trades) > 10
+    assert directions == {Direction.LONG, Direction.SHORT}
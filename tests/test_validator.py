@@ -0,0 +1,41 @@
+import numpy as np
+
+from crawler.validator import BarValidator, Quarantine, HIGH_LOW, OUTLIER, check_bars
+
+from conftest import make_bars
+
+MINUTE_MS = 60 * 1000
+START = 1609459200000  # 2021-01-01 UTC
+
+
+def minute_bars(count: int) -> np.ndarray:
+    return make_bars(100 + np.sin(np.arange(1, count + 1) * 0.3) * 0.1, START, 100, wick=0.05)
+
+
+def test_wick_is_kept_and_broken_bar_is_quarantined(tmp_path):
+    bars = minute_bars(100)
+    bars['low'][30] = 50  # 插针, 收盘价正常
+    bars['high'][60] = bars['low'][60] - 1  # 最高价小于最低价
+
+    flags = check_bars(bars)
+    assert flags[30] == OUTLIER
+    assert flags[60] & HIGH_LOW
+
+    quarantine = Quarantine(str(tmp_path / "quarantine.db"))
+    validator = BarValidator(quarantine)
+    good = validator.filter("BTCUSDT", "spot", bars)
+
+    assert START + 30 * MINUTE_MS in good['datetime']
+    assert START + 60 * MINUTE_MS not in good['datetime']
+    assert len(good) == 99
+    assert validator.rejected == 1
+    assert validator.suspects == 1
+    assert validator.gaps == 1
+
+    connection = quarantine.connection
+    assert connection.execute("SELECT datetime FROM bar_suspects").fetchall() == [(START + 30 * MINUTE_MS,)]
+    assert connection.execute("SELECT datetime FROM bar_quarantine").fetchall() == [(START + 60 * MINUTE_MS,)]
+    assert connection.execute("SELECT start, end, missing FROM data_gaps").fetchall() == [
+        (START + 60 * MINUTE_MS, START + 60 * MINUTE_MS, 1)
+    ]
+    quarantine.close()
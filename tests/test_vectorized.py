@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from howtrader.app.cta_strategy.backtesting import BacktestingEngine
+from howtrader.trader.constant import Exchange, Interval
+
+from backtester.shared_bars import LazyBarData
+from backtester.vectorized import VectorizedBacktester, cross_check
+from strategies.class_12_fixed_trade_price_strategy import Class12FixedTradPriceStrategy
+from strategies.class_12_fixed_trade_time_strategy import Class12FixedTradeTimeStrategy
+
+from conftest import make_bars
+
+MINUTE_MS = 60 * 1000
+DAY_MS = 24 * 60 * MINUTE_MS
+START = 1609430400000  # 2021-01-01 00:00 北京时间
+DAYS = 40
+
+
+def random_walk_bars() -> np.ndarray:
+    """
+    随机游走的1分钟K线, 每3天有一次1小时内跌8%再慢慢涨回来, 保证有4小时跌幅超过5%的信号.
+    """
+    rng = np.random.default_rng(7)
+    count = DAYS * DAY_MS // MINUTE_MS
+    returns = rng.normal(0, 0.001, count)
+    crashes = np.arange(count) % (3 * 24 * 60)
+    returns[(crashes >= 600) & (crashes < 660)] -= 0.08 / 60
+    returns[(crashes >= 1200) & (crashes < 1440)] += 0.08 / 240
+
+    close = np.round(30000 * np.exp(np.cumsum(returns)), 2)
+    bars = make_bars(close, START, 30000, wick=0)
+    bars['high'] = np.round(bars['high'] * (1 + rng.uniform(0, 0.0005, count)), 2)
+    bars['low'] = np.round(bars['low'] * (1 - rng.uniform(0, 0.0005, count)), 2)
+    bars['turnover'] = bars['volume'] * close
+    return bars
+
+
+@pytest.mark.parametrize("strategy_class, setting, run", [
+    (Class12FixedTradeTimeStrategy, {"fixed_trade_money": 1000},
+     lambda backtester: backtester.run_fixed_trade_time(fixed_trade_money=1000)),
+    (Class12FixedTradPriceStrategy, {"fixed_trade_money": 1000, "price_change_pct": 0.05},
+     lambda backtester: backtester.run_fixed_trade_price(fixed_trade_money=1000, price_change_pct=0.05)),
+])
+def test_same_trades_and_statistics_as_engine(strategy_class, setting, run):
+    engine = BacktestingEngine()
+    engine.output = lambda msg: None
+    engine.set_parameters(
+        vt_symbol="btcusdt.BINANCE",
+        interval=Interval.MINUTE,
+        start=datetime(2021, 1, 1),
+        end=datetime(2021, 2, 10),
+        rate=1 / 1000,
+        slippage=0,
+        size=1,
+        pricetick=0.01,
+        capital=300000,
+    )
+    engine.add_strategy(strategy_class, setting)
+    engine.history_data = LazyBarData(random_walk_bars(), "btcusdt", Exchange.BINANCE, Interval.MINUTE)
+    engine.run_backtesting()
+    engine.calculate_result()
+    expected = engine.calculate_statistics(output=False)
+
+    backtester = VectorizedBacktester.from_engine(engine)
+    assert backtester.annual_days == engine.annual_days
+
+    trades = run(backtester)
+    assert len(trades) > 0
+    assert cross_check(engine, trades)
+
+    statistics = backtester.calculate_statistics(backtester.calculate_result(trades))
+    assert statistics["total_trade_count"] == expected["total_trade_count"]
+    assert statistics["total_net_pnl"] == pytest.approx(expected["total_net_pnl"], rel=1e-6)
+    assert statistics["max_drawdown"] == pytest.approx(expected["max_drawdown"], rel=1e-6)
+    assert statistics["sharpe_ratio"] == pytest.approx(expected["sharpe_ratio"], rel=1e-6)
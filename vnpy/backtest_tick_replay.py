@@ -0,0 +1,43 @@
+import vnpy_crypto
+vnpy_crypto.init()
+
+from vnpy.trader.object import Interval
+from vnpy.trader.utility import get_folder_path
+from vnpy.trader.database import get_database
+from datetime import datetime
+
+from backtester.data_cache import BarDataCache
+from backtester.tick_replay import TickReplayEngine
+from crawler.bar_store import ParquetBarStore
+from crawler.trade_store import ParquetTradeStore
+
+from strategies.class_18_high_frequency_strategy import Class18HighFrequencyStrategy
+
+# Note: Need to crawl data first
+USE_TRADES = False  # True: 用crawl_data.py下载的逐笔成交作为tick, 否则把1分钟K线按照OHLC的路径拆成tick
+USE_BAR_STORE = False  # True: 从bar_store加载K线, 比数据库快很多
+
+engine = TickReplayEngine(timer_interval=1)  # 和实盘EventEngine一样每秒一次EVENT_TIMER
+engine.set_parameters(
+    vt_symbol="btcusdt.BINANCE",
+    interval=Interval.MINUTE,
+    start=datetime(2022,12,1),
+    end  =datetime(2023,1,1),
+    rate=1/1000,     # 币安手续费千分之1
+    slippage=0,
+    size=1,          # 若币本位合约为100
+    pricetick=0.01,  # 价格精度
+    capital=300000)
+
+engine.add_strategy(Class18HighFrequencyStrategy, {})
+if USE_TRADES:
+    engine.load_trade_ticks(ParquetTradeStore(get_folder_path("bar_store")), min_interval_ms=100)
+else:
+    source = ParquetBarStore(get_folder_path("bar_store")) if USE_BAR_STORE else get_database()
+    engine.load_bar_ticks(source, BarDataCache(get_folder_path("bar_cache")))
+engine.run_backtesting()
+print(f"回放了{engine.timer_count}次定时器")
+
+engine.calculate_result()
+engine.calculate_statistics()
+engine.show_chart()
@@ -0,0 +1,39 @@
+import vnpy_crypto
+vnpy_crypto.init()
+
+from vnpy_ctastrategy.backtesting import BacktestingEngine
+from vnpy.trader.object import Interval
+from datetime import datetime
+
+import numpy as np
+
+from backtester.vectorized import VectorizedBacktester, cross_check
+
+from strategies.class_12_fixed_trade_price_strategy import Class12FixedTradPriceStrategy
+
+# Note: Need to crawl data first
+engine = BacktestingEngine()
+engine.set_parameters(
+    vt_symbol="btcusdt.BINANCE",
+    interval=Interval.MINUTE,
+    start=datetime(2022,12,1),
+    end  =datetime(2023,2,13),
+    rate=1/1000,     # 币安手续费千分之1
+    slippage=0,
+    size=1,          # 若币本位合约为100
+    pricetick=0.01,  # 价格精度
+    capital=300000)
+
+engine.add_strategy(Class12FixedTradPriceStrategy, {"price_change_pct": 0.05})
+engine.load_data()
+engine.run_backtesting()
+
+# 同样的数据和参数用向量化的方式回测, 成交应该和事件驱动的引擎完全一致.
+backtester = VectorizedBacktester.from_engine(engine)
+trades = backtester.run_fixed_trade_price(fixed_trade_money=1000, price_change_pct=0.05)
+cross_check(engine, trades)
+engine.calculate_statistics(backtester.calculate_result(trades))
+
+# 几百个参数只需要几秒.
+result = backtester.scan(backtester.run_fixed_trade_price, "price_change_pct", np.arange(0.005, 0.2, 0.0005))
+print(result.sort_values("sharpe_ratio", ascending=False).head(10))
@@ -0,0 +1,152 @@
+"""
+回测数据的本地缓存.
+
+每次运行backtest_fixed_time.py, engine.load_data()都要查询数据库再构造几十万个BarData,
+调整策略的时候大部分时间都花在加载数据上. 这里把加载过的时间段保存成.npy(BAR_DTYPE数组):
+    root/BINANCE/btcusdt/1m/{start}-{end}.npy
+    root/BINANCE/btcusdt/1m/index.json   数据源的指纹和每个文件覆盖的时间段
+再次回测同样的或者更小的时间段, 直接用mmap打开覆盖它的文件, 只切出需要的部分, 不查询数据库.
+数据源的指纹是get_bar_overview()里的(数量, 开始时间, 结束时间), 下载了新的K线之后指纹变化,
+这个symbol的缓存全部失效.
+
+用法:
+    cache = BarDataCache(get_folder_path("bar_cache"))
+    load_engine_data_cached(engine, database, cache)  # 代替engine.load_data()
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from backtester.shared_bars import LazyBarData
+from backtester.vectorized import history_to_array
+from crawler.kline_decoder import datetime_to_ms
+
+
+class BarDataCache:
+    """
+    按(symbol, exchange, interval)分目录保存加载过的时间段.
+    """
+
+    def __init__(self, root: str):
+        """
+        :param root: 缓存目录, 例如get_folder_path("bar_cache")
+        """
+        self.root = Path(root)
+        self.hits = 0
+        self.misses = 0
+
+    def get_folder(self, symbol: str, exchange, interval) -> Path:
+        """"""
+        return self.root.joinpath(exchange.value, symbol, interval.value)
+
+    @staticmethod
+    def fingerprint(source, symbol: str, exchange, interval) -> Optional[List[int]]:
+        """
+        数据源里这个symbol的(数量, 开始时间, 结束时间), 没有数据返回None.
+        :param source: 数据库或者ParquetBarStore
+        """
+        for overview in source.get_bar_overview():
+            if overview.symbol == symbol and overview.exchange == exchange and overview.interval == interval:
+                return [int(overview.count), datetime_to_ms(overview.start), datetime_to_ms(overview.end)]
+        return None
+
+    def load(self, source, symbol: str, exchange, interval, start: datetime, end: datetime) -> np.ndarray:
+        """
+        读取[start, end]之间的K线, 优先从缓存读取.
+        :param source: 数据库或者ParquetBarStore, 需要load_bar_data和get_bar_overview
+        :return: BAR_DTYPE数组, 命中缓存的时候是只读的memmap
+        """
+        folder = self.get_folder(symbol, exchange, interval)
+        fingerprint = self.fingerprint(source, symbol, exchange, interval)
+        if not fingerprint:
+            return history_to_array([])
+
+        # 数据源里第一根到最后一根K线之外的时间没有数据, 所以end=datetime.now()的回测也能命中缓存.
+        start_ms = max(datetime_to_ms(start), fingerprint[1])
+        end_ms = min(datetime_to_ms(end), fingerprint[2])
+        if start_ms > end_ms:
+            return history_to_array([])
+
+        index = self.load_index(folder, fingerprint)
+        for range_start, range_end, file_name in index["ranges"]:
+            if range_start <= start_ms and end_ms <= range_end:
+                bars = np.load(folder.joinpath(file_name), mmap_mode='r')
+                begin = np.searchsorted(bars['datetime'], start_ms, side='left')
+                stop = np.searchsorted(bars['datetime'], end_ms, side='right')
+                self.hits += 1
+                return bars[begin:stop]
+
+        self.misses += 1
+        bars = history_to_array(source.load_bar_data(symbol, exchange, interval, start, end))
+
+        folder.mkdir(parents=True, exist_ok=True)
+        file_name = f"{start_ms}-{end_ms}.npy"
+        tmp_path = folder.joinpath(f"{file_name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, bars)
+        os.replace(tmp_path, folder.joinpath(file_name))
+
+        # 被新的时间段完全覆盖的旧文件不再需要.
+        ranges = []
+        for range_start, range_end, old_name in index["ranges"]:
+            if start_ms <= range_start and range_end <= end_ms:
+                if old_name != file_name:
+                    try:
+                        folder.joinpath(old_name).unlink()
+                    except FileNotFoundError:
+                        pass
+            else:
+                ranges.append([range_start, range_end, old_name])
+        ranges.append([start_ms, end_ms, file_name])
+
+        self.save_index(folder, {"fingerprint": fingerprint, "ranges": ranges})
+        return bars
+
+    def load_index(self, folder: Path, fingerprint: Optional[List[int]]) -> dict:
+        """
+        指纹和数据源不一致的时候删除这个目录下所有的缓存.
+        """
+        path = folder.joinpath("index.json")
+        try:
+            with open(path) as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            index = None
+
+        if index and index.get("fingerprint") == fingerprint:
+            return index
+
+        if folder.exists():
+            for file in folder.glob("*.npy"):
+                file.unlink()
+        return {"fingerprint": fingerprint, "ranges": []}
+
+    def save_index(self, folder: Path, index: dict) -> None:
+        """"""
+        tmp_path = folder.joinpath(f"index.json.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, folder.joinpath("index.json"))
+
+    def __str__(self) -> str:
+        return f"回测数据缓存命中{self.hits}次, 未命中{self.misses}次"
+
+
+def load_engine_data_cached(engine, source, cache: BarDataCache) -> None:
+    """
+    代替engine.load_data(), 经过BarDataCache加载回测数据.
+    :param engine: 已经调用过set_parameters的BacktestingEngine
+    :param source: 数据库(get_database())或者ParquetBarStore
+    """
+    engine.output("开始加载历史数据")
+
+    end = engine.end or datetime.now()
+    bars = cache.load(source, engine.symbol, engine.exchange, engine.interval, engine.start, end)
+    engine.history_data = LazyBarData(bars, engine.symbol, engine.exchange, engine.interval)
+
+    engine.output(f"历史数据加载完成，数据量：{len(engine.history_data)}, {cache}")
@@ -0,0 +1,133 @@
+"""
+永续合约回测的资金费.
+
+BacktestingEngine只按K线计算持仓盈亏, 没有资金费. Class19FutureProfitGridStrategy这类长时间持有
+永续合约的策略, 资金费可能比网格的利润还大. 这里在回测结束之后, 用成交记录算出每次资金费结算时的
+持仓, 一次性向量化地算出所有的资金费, 再按天加到calculate_result的结果里:
+
+    engine.run_backtesting()
+    df = engine.calculate_result()
+    store = ParquetBarStore(get_folder_path("bar_store"), FUNDING_DTYPE)  # crawler.funding.FUNDING_DTYPE
+    funding = load_funding(store, "BTCUSDT", engine.start, engine.end)
+    df = apply_funding(engine, df, funding)
+    engine.calculate_statistics(df)
+
+资金费 = -结算时的持仓 * 合约乘数 * 标记价格 * 资金费率, 资金费率为正的时候多头付给空头.
+"""
+
+from datetime import datetime
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from vnpy.trader.constant import Direction
+
+from crawler.bar_store import ParquetBarStore
+from crawler.funding import FUNDING_FOLDER, MARK_PRICE_FOLDER
+from crawler.kline_decoder import BAR_DTYPE, CHINA_OFFSET_MS, datetime_to_ms
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def load_funding(store: ParquetBarStore, symbol: str, start: datetime, end: Optional[datetime] = None,
+                 exchange: str = "BINANCE") -> np.ndarray:
+    """
+    读取资金费率, 没有标记价格的结算用标记价格K线补齐.
+    :param store: 保存资金费率的ParquetBarStore, dtype为FUNDING_DTYPE
+    :param symbol: 保存时候的symbol, 合约是大写, 例如BTCUSDT
+    :return: FUNDING_DTYPE数组
+    """
+    start_ms = datetime_to_ms(start)
+    end_ms = datetime_to_ms(end) if end else None
+    funding = store.read(symbol, exchange, FUNDING_FOLDER, start_ms, end_ms)
+
+    missing = np.isnan(funding['mark_price'])
+    if missing.any():
+        mark_store = ParquetBarStore(store.root, BAR_DTYPE)
+        mark = mark_store.read(symbol, exchange, MARK_PRICE_FOLDER, start_ms, end_ms, columns=['open'])
+        funding['mark_price'][missing] = price_at(mark['datetime'], mark['open'], funding['datetime'][missing])
+
+    return funding
+
+
+def price_at(times: np.ndarray, prices: np.ndarray, when: np.ndarray) -> np.ndarray:
+    """
+    when时刻的价格, 取开始时间不晚于when的最后一根K线, 之前没有K线的为nan.
+    """
+    if not len(times):
+        return np.full(len(when), np.nan)
+
+    ix = np.searchsorted(times, when, side='right') - 1
+    result = prices[ix.clip(min=0)].astype(np.float64)
+    result[ix < 0] = np.nan
+    return result
+
+
+def position_timeline(engine) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    成交之后的持仓变化.
+    :return: (成交时间的毫秒时间戳, 成交之后的持仓), 按时间排序
+    """
+    trades = sorted(engine.trades.values(), key=lambda trade: trade.datetime)
+    times = np.array([datetime_to_ms(trade.datetime) for trade in trades], dtype=np.int64)
+    changes = np.array(
+        [float(trade.volume) if trade.direction == Direction.LONG else -float(trade.volume) for trade in trades],
+        dtype=np.float64,
+    )
+    return times, np.cumsum(changes)
+
+
+def funding_cashflows(
+    trade_times: np.ndarray,
+    positions: np.ndarray,
+    funding: np.ndarray,
+    size: float = 1,
+) -> np.ndarray:
+    """
+    每一次资金费结算的现金流, 正数是收到, 负数是支付.
+    :param trade_times: position_timeline返回的成交时间
+    :param positions: position_timeline返回的持仓
+    :param funding: FUNDING_DTYPE数组, mark_price不能为nan
+    :param size: 合约乘数
+    """
+    # 结算时间之前(含)的最后一笔成交之后的持仓, 在第一笔成交之前为0.
+    ix = np.searchsorted(trade_times, funding['datetime'], side='right') - 1
+    pos = np.where(ix >= 0, positions[ix.clip(min=0)] if len(positions) else 0.0, 0.0)
+    return -pos * size * funding['mark_price'] * funding['rate']
+
+
+def apply_funding(engine, df: pd.DataFrame, funding: np.ndarray) -> pd.DataFrame:
+    """
+    把资金费按天加到calculate_result返回的DataFrame, 新增funding列, 并从net_pnl里扣除.
+    之后调用engine.calculate_statistics(df)就是包含资金费的统计.
+    :param funding: load_funding返回的数组
+    """
+    if df is None or not len(funding):
+        return df
+
+    start = datetime_to_ms(engine.start)
+    end = datetime_to_ms(engine.end) if engine.end else np.iinfo(np.int64).max
+    funding = funding[(funding['datetime'] >= start) & (funding['datetime'] <= end)].copy()
+
+    # 标记价格仍然缺失的, 用回测数据的收盘价代替.
+    missing = np.isnan(funding['mark_price'])
+    if missing.any():
+        times = np.array([datetime_to_ms(bar.datetime) for bar in engine.history_data], dtype=np.int64)
+        closes = np.array([float(bar.close_price) for bar in engine.history_data], dtype=np.float64)
+        funding['mark_price'][missing] = price_at(times, closes, funding['datetime'][missing])
+
+    trade_times, positions = position_timeline(engine)
+    cashflows = funding_cashflows(trade_times, positions, funding, float(engine.size))
+    cashflows = np.nan_to_num(cashflows)
+
+    # 按北京时间的日期汇总, 和calculate_result的date一致.
+    days = ((funding['datetime'] + CHINA_OFFSET_MS) // DAY_MS).astype('datetime64[D]').astype(object)
+    daily = pd.Series(cashflows).groupby(days).sum()
+
+    df = df.copy()
+    df["funding"] = daily.reindex(df.index).fillna(0).values
+    df["net_pnl"] = df["net_pnl"] + df["funding"]
+
+    engine.output(f"资金费结算{len(funding)}次, 合计{cashflows.sum():.2f}")
+    return df
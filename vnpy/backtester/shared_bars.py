@@ -0,0 +1,120 @@
+"""
+多进程回测共享的K线.
+
+并行回测同一段btcusdt.BINANCE的1分钟K线的时候, 每个进程都要查询一次数据库,
+再各自保存几十万个BarData. 这里由主进程加载一次, 把BAR_DTYPE数组放进共享内存,
+工作进程按名字直接映射成只读的NumPy数组, 不复制数据, 启动时间和数据量无关;
+LazyBarData代替engine.history_data, 遍历的时候才分块构造BarData, 内存不会随进程数量增长.
+
+用法:
+    shared = SharedBarArray.create(bars)
+    # 工作进程
+    attached = SharedBarArray.attach(*shared.spec)
+    engine.history_data = LazyBarData(attached.array, "btcusdt", Exchange.BINANCE, Interval.MINUTE)
+    # 结束之后在主进程里
+    shared.unlink()
+
+SharedBarArray也可以共享其他的结构化数组, 例如TickReplayEngine用的TICK_DTYPE数组.
+"""
+
+from collections.abc import Sequence
+from multiprocessing import shared_memory
+from typing import Iterator, Tuple
+
+import numpy as np
+
+from crawler.kline_decoder import BAR_DTYPE, to_bars
+
+
+class SharedBarArray:
+    """
+    共享内存里的BAR_DTYPE数组.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, length: int, dtype: np.dtype = BAR_DTYPE):
+        """"""
+        self.shm = shm
+        self.length = length
+        self.dtype = dtype
+
+        self.array = np.ndarray((length,), dtype=dtype, buffer=shm.buf)
+        self.array.flags.writeable = False
+
+    @classmethod
+    def create(cls, bars: np.ndarray) -> "SharedBarArray":
+        """
+        在主进程里创建, 复制一次数据.
+        """
+        shm = shared_memory.SharedMemory(create=True, size=max(bars.nbytes, 1))
+        array = np.ndarray((len(bars),), dtype=bars.dtype, buffer=shm.buf)
+        array[:] = bars
+        return cls(shm, len(bars), bars.dtype)
+
+    @classmethod
+    def attach(cls, name: str, length: int, dtype: np.dtype = BAR_DTYPE) -> "SharedBarArray":
+        """
+        在工作进程里按名字映射, 不复制数据.
+        """
+        return cls(shared_memory.SharedMemory(name=name), length, dtype)
+
+    @property
+    def spec(self) -> Tuple[str, int, np.dtype]:
+        """
+        传给工作进程的(name, length, dtype), 可以pickle.
+        """
+        return self.shm.name, self.length, self.dtype
+
+    def close(self) -> None:
+        """"""
+        self.array = None
+        self.shm.close()
+
+    def unlink(self) -> None:
+        """
+        主进程用完之后释放共享内存.
+        """
+        self.close()
+        self.shm.unlink()
+
+
+class LazyBarData(Sequence):
+    """
+    只读的BarData序列, 支持len、下标、切片和遍历, 可以直接作为engine.history_data.
+    切片只是数组的视图, 遍历的时候每次构造chunk_size个BarData.
+    """
+
+    def __init__(self, bars: np.ndarray, symbol: str, exchange, interval, gateway_name: str = "DB",
+                 chunk_size: int = 10000):
+        """
+        :param bars: BAR_DTYPE数组, 例如SharedBarArray.array
+        :param exchange: Exchange.BINANCE
+        :param interval: Interval.MINUTE
+        """
+        self.bars = bars
+        self.symbol = symbol
+        self.exchange = exchange
+        self.interval = interval
+        self.gateway_name = gateway_name
+        self.chunk_size = chunk_size
+
+    def __len__(self) -> int:
+        return len(self.bars)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LazyBarData(self.bars[index], self.symbol, self.exchange, self.interval, self.gateway_name,
+                               self.chunk_size)
+
+        if index < 0:
+            index += len(self.bars)
+        if not 0 <= index < len(self.bars):
+            raise IndexError("LazyBarData index out of range")
+        return self.make_bars(index, index + 1)[0]
+
+    def __iter__(self) -> Iterator:
+        for start in range(0, len(self.bars), self.chunk_size):
+            yield from self.make_bars(start, start + self.chunk_size)
+
+    def make_bars(self, start: int, end: int) -> list:
+        """"""
+        return to_bars(self.bars[start:end], self.symbol, self.exchange, self.interval, self.gateway_name)
@@ -0,0 +1,311 @@
+"""
+网格策略的tick回测.
+
+Class16、Class17、Class18和Class19的网格策略的on_bar什么都不做, 下单和撤单都在on_tick和
+cta_engine.event_engine上注册的EVENT_TIMER里, 普通的K线回测既没有tick也没有定时器.
+TickReplayEngine在TICK模式下回测:
+    - 把1分钟K线按照OHLC的路径拆成4个tick(阳线: 开-低-高-收, 阴线: 开-高-低-收),
+      或者把trade_store里的逐笔成交、book_recorder录制的盘口快照直接当作tick;
+    - 用虚拟的时钟发出EVENT_TIMER, 每两个tick之间补上这段时间里所有的定时器事件,
+      不用真的等待, 一个月的1秒定时器几秒钟就能回放完.
+tick统一保存成book_dtype数组, LazyTickData遍历的时候才分块构造TickData.
+
+用法:
+    engine = TickReplayEngine()
+    engine.set_parameters(vt_symbol="btcusdt.BINANCE", interval=Interval.MINUTE, ...)
+    engine.add_strategy(Class18HighFrequencyStrategy, {})
+    engine.load_bar_ticks(database)  # 或者engine.load_trade_ticks(ParquetTradeStore(...))
+    engine.run_backtesting()
+
+参数扫描(backtester/sweep.py)遇到在定时器里下单的策略会自动改用TickReplayEngine.
+"""
+
+from collections import defaultdict
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List
+
+import numpy as np
+
+from vnpy_ctastrategy.backtesting import BacktestingEngine
+from vnpy_ctastrategy.base import BacktestingMode
+from vnpy.event import Event
+from vnpy.trader.constant import Interval
+from vnpy.trader.event import EVENT_TIMER
+from vnpy.trader.object import TickData
+
+from backtester.vectorized import history_to_array
+from crawler.kline_decoder import CHINA_FIXED_TZ, china_datetimes, datetime_to_ms
+from recorder.book_file import book_dtype
+
+TICK_DTYPE = book_dtype(1)
+
+BAR_TICKS = 4  # 每根K线拆成的tick数量
+
+
+def bar_ticks(bars: np.ndarray, interval_ms: int = 60 * 1000, spread: float = 0.0) -> np.ndarray:
+    """
+    按照OHLC的路径把K线拆成tick, 在K线周期里均匀分布.
+    :param bars: BAR_DTYPE数组
+    :param spread: 买一和卖一的价差, bid_price_1是路径上的价格, ask_price_1再加上spread
+    :return: TICK_DTYPE数组
+    """
+    up = bars['close'] >= bars['open']
+    paths = np.empty((len(bars), BAR_TICKS))
+    paths[:, 0] = bars['open']
+    paths[:, 1] = np.where(up, bars['low'], bars['high'])
+    paths[:, 2] = np.where(up, bars['high'], bars['low'])
+    paths[:, 3] = bars['close']
+
+    offsets = np.arange(BAR_TICKS, dtype=np.int64) * (interval_ms // BAR_TICKS)
+    volumes = bars['volume'] / BAR_TICKS
+
+    ticks = np.zeros(len(bars) * BAR_TICKS, dtype=TICK_DTYPE)
+    ticks['datetime'] = (bars['datetime'][:, None] + offsets).ravel()
+    ticks['last_price'] = paths.ravel()
+    ticks['volume'] = np.repeat(volumes, BAR_TICKS)
+    ticks['bid_price_1'] = ticks['last_price']
+    ticks['ask_price_1'] = ticks['last_price'] + spread
+    ticks['bid_volume_1'] = ticks['volume']
+    ticks['ask_volume_1'] = ticks['volume']
+    return ticks
+
+
+def trade_ticks(trades: np.ndarray, spread: float = 0.0, min_interval_ms: int = 0) -> np.ndarray:
+    """
+    逐笔成交转换成tick. 主动买入成交在卖一, 主动卖出成交在买一, 另一边按spread推算.
+    :param trades: TRADE_DTYPE数组, 按id排序
+    :param min_interval_ms: 大于0的时候每个时间段只保留最后一笔成交, 成交量累加, 一个月几千万笔成交的时候可以减少tick数量
+    :return: TICK_DTYPE数组
+    """
+    volumes = trades['volume']
+    if min_interval_ms > 0 and len(trades):
+        buckets = trades['datetime'] // min_interval_ms
+        last = np.flatnonzero(np.append(buckets[1:] != buckets[:-1], True))
+        volumes = np.add.reduceat(volumes, np.append(0, last[:-1] + 1))
+        trades = trades[last]
+
+    buy = trades['side'] > 0
+    ticks = np.zeros(len(trades), dtype=TICK_DTYPE)
+    ticks['datetime'] = trades['datetime']
+    ticks['last_price'] = trades['price']
+    ticks['volume'] = volumes
+    ticks['bid_price_1'] = np.where(buy, trades['price'] - spread, trades['price'])
+    ticks['ask_price_1'] = np.where(buy, trades['price'], trades['price'] + spread)
+    ticks['bid_volume_1'] = volumes
+    ticks['ask_volume_1'] = volumes
+    return ticks
+
+
+class LazyTickData(Sequence):
+    """
+    只读的TickData序列, 可以直接作为TICK模式的engine.history_data, 和LazyBarData一样按块构造.
+    """
+
+    def __init__(self, ticks: np.ndarray, symbol: str, exchange, gateway_name: str = "DB", chunk_size: int = 10000):
+        """
+        :param ticks: book_dtype(档数)数组, 例如TICK_DTYPE或者read_book()的结果
+        """
+        self.ticks = ticks
+        self.symbol = symbol
+        self.exchange = exchange
+        self.gateway_name = gateway_name
+        self.chunk_size = chunk_size
+
+        # 数组里有的档位才赋值, 其余的保持TickData的默认值.
+        self.fields = [name for name in ticks.dtype.names if name != 'datetime']
+
+    def __len__(self) -> int:
+        return len(self.ticks)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LazyTickData(self.ticks[index], self.symbol, self.exchange, self.gateway_name, self.chunk_size)
+
+        if index < 0:
+            index += len(self.ticks)
+        if not 0 <= index < len(self.ticks):
+            raise IndexError("LazyTickData index out of range")
+        return self.make_ticks(index, index + 1)[0]
+
+    def __iter__(self) -> Iterator:
+        for start in range(0, len(self.ticks), self.chunk_size):
+            yield from self.make_ticks(start, start + self.chunk_size)
+
+    def make_ticks(self, start: int, end: int) -> List[TickData]:
+        """"""
+        ticks = self.ticks[start:end]
+        datetimes = china_datetimes(ticks['datetime']).astype(datetime).tolist()
+        columns = [ticks[name].tolist() for name in self.fields]
+
+        return [
+            TickData(
+                symbol=self.symbol,
+                exchange=self.exchange,
+                datetime=dt.replace(tzinfo=CHINA_FIXED_TZ),
+                gateway_name=self.gateway_name,
+                **dict(zip(self.fields, values))
+            )
+            for dt, values in zip(datetimes, zip(*columns))
+        ]
+
+
+class ReplayEventEngine:
+    """
+    回测用的事件引擎, 和EventEngine的接口一样, 但是没有线程和队列, put的时候直接调用处理函数.
+    """
+
+    def __init__(self):
+        """"""
+        self.handlers: Dict[str, List[Callable]] = defaultdict(list)
+        self.general_handlers: List[Callable] = []
+
+    def start(self) -> None:
+        """"""
+        pass
+
+    def stop(self) -> None:
+        """"""
+        pass
+
+    def put(self, event: Event) -> None:
+        """"""
+        for handler in self.handlers.get(event.type, ()):
+            handler(event)
+        for handler in self.general_handlers:
+            handler(event)
+
+    def register(self, type: str, handler: Callable) -> None:
+        """"""
+        handler_list = self.handlers[type]
+        if handler not in handler_list:
+            handler_list.append(handler)
+
+    def unregister(self, type: str, handler: Callable) -> None:
+        """"""
+        handler_list = self.handlers[type]
+        if handler in handler_list:
+            handler_list.remove(handler)
+        if not handler_list:
+            self.handlers.pop(type)
+
+    def register_general(self, handler: Callable) -> None:
+        """"""
+        if handler not in self.general_handlers:
+            self.general_handlers.append(handler)
+
+    def unregister_general(self, handler: Callable) -> None:
+        """"""
+        if handler in self.general_handlers:
+            self.general_handlers.remove(handler)
+
+
+class TickReplayEngine(BacktestingEngine):
+    """
+    在tick上回测, 并且按照虚拟时钟发出EVENT_TIMER.
+    """
+
+    def __init__(self, timer_interval: int = 1):
+        """
+        :param timer_interval: 定时器的间隔(秒), 和实盘EventEngine的interval一样默认1秒
+        """
+        super().__init__()
+        self.event_engine = ReplayEventEngine()
+        self.timer_interval_ms = timer_interval * 1000
+        self.timer_event = Event(EVENT_TIMER)
+        self.next_timer = 0
+        self.timer_count = 0
+
+    def clear_data(self) -> None:
+        """"""
+        super().clear_data()
+        self.event_engine = ReplayEventEngine()
+        self.next_timer = 0
+        self.timer_count = 0
+
+    def add_strategy(self, strategy_class: type, setting: dict) -> None:
+        """
+        网格策略一般不调用load_bar, 初始化阶段的tick也交给on_tick.
+        """
+        super().add_strategy(strategy_class, setting)
+        self.callback = self.strategy.on_tick
+
+    def load_bar(
+        self, vt_symbol: str, days: int, interval: Interval, callback: Callable, use_database: bool
+    ) -> List:
+        """
+        回测的数据都是tick, 初始化阶段也只能推送tick.
+        """
+        self.days = days
+        self.callback = self.strategy.on_tick
+        return []
+
+    def load_tick(self, vt_symbol: str, days: int, callback: Callable) -> List:
+        """"""
+        self.days = days
+        self.callback = callback
+        return []
+
+    def set_ticks(self, ticks: np.ndarray) -> None:
+        """
+        设置回测的tick, 切换到TICK模式.
+        :param ticks: book_dtype(档数)数组, 按时间排序
+        """
+        self.mode = BacktestingMode.TICK
+        self.history_data = LazyTickData(ticks, self.symbol, self.exchange)
+        self.output(f"历史数据加载完成，数据量：{len(self.history_data)}")
+
+    def load_bar_ticks(self, source, cache=None) -> None:
+        """
+        加载1分钟K线, 按照OHLC的路径拆成tick, 买卖价差是一个pricetick.
+        :param source: 数据库(get_database())或者ParquetBarStore
+        :param cache: BarDataCache, 可选
+        """
+        self.output("开始加载历史数据")
+        end = self.end or datetime.now()
+        if cache:
+            bars = cache.load(source, self.symbol, self.exchange, Interval.MINUTE, self.start, end)
+        else:
+            bars = history_to_array(source.load_bar_data(self.symbol, self.exchange, Interval.MINUTE, self.start, end))
+        self.set_ticks(bar_ticks(bars, spread=self.pricetick))
+
+    def load_trade_ticks(self, store, min_interval_ms: int = 0) -> None:
+        """
+        加载逐笔成交作为tick.
+        :param store: ParquetTradeStore
+        """
+        self.output("开始加载历史数据")
+        end = self.end or datetime.now()
+        trades = store.read(self.symbol, self.exchange.value, datetime_to_ms(self.start), datetime_to_ms(end),
+                            columns=['datetime', 'price', 'volume', 'side'])
+        self.set_ticks(trade_ticks(trades, spread=self.pricetick, min_interval_ms=min_interval_ms))
+
+    def new_tick(self, tick: TickData) -> None:
+        """
+        先补上这个tick之前所有的定时器事件, 再撮合和推送tick.
+        """
+        now = int(tick.datetime.timestamp() * 1000)
+        if not self.next_timer:
+            self.next_timer = (now // self.timer_interval_ms + 1) * self.timer_interval_ms
+        if self.next_timer <= now:
+            self.emit_timers(now)
+
+        super().new_tick(tick)
+
+    def emit_timers(self, now: int) -> None:
+        """
+        发出(next_timer, now]之间的定时器事件, 期间的委托由下一个tick撮合.
+        """
+        count = (now - self.next_timer) // self.timer_interval_ms + 1
+
+        # 没有策略注册定时器的时候直接跳到当前时间.
+        if EVENT_TIMER in self.event_engine.handlers or self.event_engine.general_handlers:
+            step = timedelta(milliseconds=self.timer_interval_ms)
+            timer_time = datetime.fromtimestamp(self.next_timer / 1000, CHINA_FIXED_TZ)
+            for _ in range(count):
+                self.datetime = timer_time  # 定时器里下的单用定时器的时间
+                self.event_engine.put(self.timer_event)
+                timer_time += step
+
+        self.next_timer += count * self.timer_interval_ms
+        self.timer_count += count
@@ -11,16 +11,19 @@ discord: 51bitquant#8078
 import vnpy_crypto
 vnpy_crypto.init()
 
+import argparse
 import pandas as pd
-import time
+import numpy as np
+import asyncio
 import json
+from contextlib import nullcontext
 from datetime import datetime
-import requests
 import pytz
 from vnpy.trader.database import get_database, BaseDatabase
 
 from vnpy.trader.object import BarData,Interval
 from vnpy.trader.constant import Exchange
+from vnpy.trader.utility import get_folder_path, get_file_path
 
 pd.set_option('expand_frame_repr', False)  #
 
@@ -28,166 +31,391 @@ BINANCE_SPOT_LIMIT = 1000
 BINANCE_FUTURE_LIMIT = 1500
 
 CHINA_TZ = pytz.timezone("Asia/Shanghai")
-from threading import Thread
+from crawler.archive_importer import read_archives
+from crawler.async_downloader import AsyncKlineDownloader, BINANCE_MARKETS, INTERVAL_MS, db_symbol, to_milliseconds
+from crawler.bar_store import ParquetBarStore, month_of
+from crawler.bar_writer import BarWriter
+from crawler.checkpoint import DatabaseCheckpoint
+from crawler.crawler_metrics import CrawlerMetrics
+from crawler.funding import AsyncFundingDownloader, FUNDING_DTYPE, FUNDING_FOLDER, MARK_PRICE_FOLDER, MARK_PRICE_PATH
+from crawler.kline_decoder import to_bars, ms_to_datetime
+from crawler.gap_scanner import scan_gaps, gaps_to_windows, print_gaps, database_timestamps
+from crawler.resample import update_derived_bars
+from crawler.response_cache import ResponseCache
+from crawler.sync_daemon import SyncDaemon
+from crawler.rate_limiter import WeightRateLimiter, BINANCE_WEIGHT_LIMITS
+from crawler.trade_downloader import AsyncTradeDownloader, AGG_TRADE_MARKETS
+from crawler.trade_store import ParquetTradeStore
+from crawler.validator import BarValidator, Quarantine
 
 database: BaseDatabase = get_database()
+bar_store = ParquetBarStore(get_folder_path("bar_store"))
+trade_store = ParquetTradeStore(get_folder_path("bar_store"))
+funding_store = ParquetBarStore(get_folder_path("bar_store"), FUNDING_DTYPE)
+proxies = None  # 在__main__里根据配置文件设置
+metrics_file = None  # 运行指标的json文件, 在__main__里设置
+response_cache = None  # 原始响应的缓存, 在__main__里根据--cache设置
+offline = False  # 只从缓存里读取, 不访问网络
+
+# 1分钟K线写入之前的检查, 不合格的K线和页内的缺口保存在quarantine.db里, 用到的时候才创建.
+validator = None
+
+# 每个市场一个限流器, 所有的下载线程和协程共享.
+limiters = {market: WeightRateLimiter(max_weight) for market, max_weight in BINANCE_WEIGHT_LIMITS.items()}
+
+def get_validator() -> BarValidator:
+    """
+    第一次调用的时候才打开quarantine.db, import crawl_data不会创建文件.
+    """
+    global validator
+    if validator is None:
+        validator = BarValidator(Quarantine(get_file_path("quarantine.db")))
+    return validator
+
 
 def generate_datetime(timestamp: float) -> datetime:
     """
     :param timestamp:
     :return:
     """
-    dt = datetime.fromtimestamp(timestamp / 1000)
-    dt = CHINA_TZ.localize(dt)
-    return dt
+    return ms_to_datetime(timestamp)
 
 
-def get_binance_data(symbol: str, exchanges: str, start_time: str, end_time: str):
+def save_klines(symbol: str, market: str, bars: np.ndarray):
     """
-    爬取币安交易所的数据
+    把一页解码后的K线保存到数据库, 作为AsyncKlineDownloader的on_page回调.
+    SQL数据库只接收BarData, 所以在这里才构造BarData.
     :param symbol: BTCUSDT.
-    :param exchanges: 现货、USDT合约, 或者币币合约.
+    :param market: spot, usdt_future, inverse_future
+    :param bars: decode_klines返回的数组.
+    """
+    gateway = BINANCE_MARKETS[market][3]
+    database.save_bar_data(to_bars(bars, db_symbol(symbol, market), Exchange.BINANCE, Interval.MINUTE, gateway))
+
+
+def save_klines_to_store(symbol: str, market: str, bars: np.ndarray):
+    """
+    保存到列式的bar_store, 可以代替save_klines作为BarWriter的sink.
+    """
+    bar_store.write(db_symbol(symbol, market), Exchange.BINANCE.value, Interval.MINUTE.value, bars)
+
+
+def save_kline_batch(market: str, batches: dict):
+    """
+    SyncDaemon的on_batch, 所有symbol的K线在同一个事务里写入数据库.
+    :param batches: {symbol: bars}
+    """
+    db = getattr(database, "db", None)  # peewee的数据库, save_bar_data里面的atomic()会变成savepoint
+    with db.atomic() if db else nullcontext():
+        for symbol, bars in batches.items():
+            save_klines(symbol, market, bars)
+
+
+def save_kline_batch_to_store(market: str, batches: dict):
+    """
+    SyncDaemon的on_batch, 保存到bar_store.
+    """
+    for symbol, bars in batches.items():
+        save_klines_to_store(symbol, market, bars)
+
+
+def save_trades(symbol: str, market: str, trades: np.ndarray):
+    """
+    保存逐笔成交到trade_store, 作为BarWriter的sink.
+    """
+    trade_store.write(db_symbol(symbol, market), Exchange.BINANCE.value, trades)
+
+
+def save_funding(symbol: str, market: str, funding: np.ndarray):
+    """
+    保存资金费率, 作为BarWriter的sink.
+    """
+    funding_store.write(symbol, Exchange.BINANCE.value, FUNDING_FOLDER, funding)
+
+
+def save_mark_prices(symbol: str, market: str, bars: np.ndarray):
+    """
+    保存标记价格的1分钟K线, 作为BarWriter的sink.
+    """
+    bar_store.write(symbol, Exchange.BINANCE.value, MARK_PRICE_FOLDER, bars)
+
+
+def derive_bars(symbols: list, market: str, since: int = None):
+    """
+    用bar_store里的1分钟K线增量合成5m/15m/1h/4h/1d的K线.
+    :param since: 毫秒, 回补了这个时间之后的1分钟K线, 从这里开始重新合成.
+    """
+    for symbol in symbols:
+        counts = update_derived_bars(bar_store, db_symbol(symbol, market), Exchange.BINANCE.value, since=since)
+        print(f"{symbol} 合成K线: {counts}")
+
+
+def get_checkpoint(source: BaseDatabase = database):
+    """
+    数据库(或者bar_store)里已有的1分钟K线, 用来断点续传.
+    """
+    return DatabaseCheckpoint(source, Exchange.BINANCE, Interval.MINUTE, INTERVAL_MS['1m'])
+
+
+def get_proxy():
+    """
+    aiohttp只接收一个代理地址.
+    """
+    return proxies['https'] if proxies else None
+
+
+def download_spot(symbols: list, start_time: str, end_time: str, concurrency: int = 10, use_store: bool = False):
+    """
+    下载现货数据的方法.
+    :param symbols: ["BTCUSDT", "ETHUSDT"]
     :param start_time: 格式如下:2020-1-1 或者2020-01-01
     :param end_time: 格式如下:2020-1-1 或者2020-01-01
-    :param gate_way the gateway name for binance is:BINANCE_SPOT, BINANCE_USDT, BINANCE_INVERSE
+    :param concurrency: 同时在途的请求数量.
+    :param use_store: 保存到bar_store而不是数据库.
     :return:
     """
+    sink, source = (save_klines_to_store, bar_store) if use_store else (save_klines, database)
+    metrics = CrawlerMetrics()
+    with BarWriter(sink, metrics=metrics, validator=get_validator()) as writer:
+        downloader = AsyncKlineDownloader('spot', writer.put_async, concurrency=concurrency, proxy=get_proxy(),
+                                          limiter=limiters['spot'], checkpoint=get_checkpoint(source),
+                                          metrics=metrics,
+                                          cache=response_cache, offline=offline)
+        downloader.run(symbols, start_time, end_time)
+    metrics.print_summary(metrics_file)
+    print(get_validator())
+
+    if use_store:
+        derive_bars(symbols, 'spot', to_milliseconds(start_time))
+
+
+def download_future(symbols: list, start_time: str, end_time: str, concurrency: int = 10, use_store: bool = False):
+    """
+    下载USDT合约数据的方法, 上市之前的时间会自动跳过.
+    :param use_store: 保存到bar_store而不是数据库.
+    :return:
+    """
+    sink, source = (save_klines_to_store, bar_store) if use_store else (save_klines, database)
+    metrics = CrawlerMetrics()
+    with BarWriter(sink, metrics=metrics, validator=get_validator()) as writer:
+        downloader = AsyncKlineDownloader('usdt_future', writer.put_async, concurrency=concurrency, proxy=get_proxy(),
+                                          limiter=limiters['usdt_future'], checkpoint=get_checkpoint(source),
+                                          metrics=metrics,
+                                          cache=response_cache, offline=offline)
+        downloader.run(symbols, start_time, end_time)
+    metrics.print_summary(metrics_file)
+    print(get_validator())
+
+    if use_store:
+        derive_bars(symbols, 'usdt_future', to_milliseconds(start_time))
+
+
+def fill_gaps(symbols: list, market: str, start_time: str, end_time: str, concurrency: int = 10):
+    """
+    扫描数据库里1分钟K线的缺口, 打印出来并只重新下载缺失的部分.
+    :param symbols: ["BTCUSDT", "ETHUSDT"]
+    :param market: spot, usdt_future, inverse_future
+    :return:
+    """
+    metrics = CrawlerMetrics()
+    writer = BarWriter(save_klines, metrics=metrics, validator=get_validator())
+    downloader = AsyncKlineDownloader(market, writer.put_async, concurrency=concurrency, proxy=get_proxy(),
+                                      limiter=limiters[market], metrics=metrics,
+                                      cache=response_cache, offline=offline)
 
-    api_url = ''
-    save_symbol = symbol
+    start = to_milliseconds(start_time)
+    end = to_milliseconds(end_time) - 1
+    load_timestamps = database_timestamps(database, Exchange.BINANCE, Interval.MINUTE)
 
-    if exchanges == 'spot':
-        print("spot")
-        limit = BINANCE_SPOT_LIMIT
-        save_symbol = symbol.lower()
-        gateway = "BINANCE_SPOT"
-        api_url = f'https://api.binance.com/api/v3/klines?symbol={symbol}&interval=1m&limit={limit}'
+    jobs = []
+    for symbol in symbols:
+        results = scan_gaps(load_timestamps, [db_symbol(symbol, market)], start, end, downloader.interval_ms)
+        print_gaps(results, downloader.interval_ms)
 
-    elif exchanges == 'usdt_future':
-        print('usdt_future')
-        limit = BINANCE_FUTURE_LIMIT
-        gateway = "BINANCE_USDT"
-        api_url = f'https://fapi.binance.com/fapi/v1/klines?symbol={symbol}&interval=1m&limit={limit}'
+        for gaps in results.values():
+            for window in gaps_to_windows(gaps, downloader.interval_ms, downloader.limit):
+                jobs.append((symbol, window))
 
-    elif exchanges == 'inverse_future':
-        print("inverse_future")
-        limit = BINANCE_FUTURE_LIMIT
-        gateway = "BINANCE_INVERSE"
-        f'https://dapi.binance.com/dapi/v1/klines?symbol={symbol}&interval=1m&limit={limit}'
+    if jobs:
+        with writer:
+            asyncio.run(downloader.download_windows(jobs))
+        metrics.print_summary(metrics_file)
+        print(get_validator())
 
-    else:
-        raise Exception('交易所名称请输入以下其中一个：spot, future, coin_future')
-
-    start_time = int(datetime.strptime(start_time, '%Y-%m-%d').timestamp() * 1000)
-    end_time = int(datetime.strptime(end_time, '%Y-%m-%d').timestamp() * 1000)
-
-    while True:
-        try:
-            print(start_time)
-            url = f'{api_url}&startTime={start_time}'
-            print(url)
-            datas = requests.get(url=url, timeout=10, proxies=proxies).json()
-
-            """
-            [
-                [
-                    1591258320000,      // 开盘时间
-                    "9640.7",           // 开盘价
-                    "9642.4",           // 最高价
-                    "9640.6",           // 最低价
-                    "9642.0",           // 收盘价(当前K线未结束的即为最新价)
-                    "206",              // 成交量
-                    1591258379999,      // 收盘时间
-                    "2.13660389",       // 成交额(标的数量)
-                    48,                 // 成交笔数
-                    "119",              // 主动买入成交量
-                    "1.23424865",      // 主动买入成交额(标的数量)
-                    "0"                 // 请忽略该参数
-                ]
-
-            """
-
-            buf = []
-
-            for row in datas:
-                bar: BarData = BarData(
-                    symbol=save_symbol,
-                    exchange=Exchange.BINANCE,
-                    datetime=generate_datetime(row[0]),
-                    interval=Interval.MINUTE,
-                    volume=float(row[5]),
-                    turnover=float(row[7]),
-                    open_price=float(row[1]),
-                    high_price=float(row[2]),
-                    low_price=float(row[3]),
-                    close_price=float(row[4]),
-                    gateway_name=gateway
-                )
-                buf.append(bar)
-                #buf.append(bar)
-
-            database.save_bar_data(buf)
-
-            # 到结束时间就退出, 后者收盘价大于当前的时间.
-            if (datas[-1][0] > end_time) or datas[-1][6] >= (int(time.time() * 1000) - 60 * 1000):
-                break
-
-            start_time = datas[-1][0]
-
-        except Exception as error:
-            print("error:", error)
-            time.sleep(10)
-
-
-def download_spot(symbol):
+
+def download_funding(symbols: list, start_time: str, end_time: str, concurrency: int = 10):
     """
-    下载现货数据的方法.
-    :return:
+    下载USDT合约的资金费率和标记价格K线, 用于永续合约回测的资金费.
+    每个symbol从已经保存的最后一条之后开始下载.
+    :param symbols: ["BTCUSDT", "ETHUSDT"]
     """
-    t1 = Thread(target=get_binance_data, args=(symbol, 'spot', "2022-12-01", "2022-12-31"))
-    t2 = Thread(target=get_binance_data, args=(symbol, 'spot', "2023-01-01", "2023-01-31"))
-    t3 = Thread(target=get_binance_data, args=(symbol, 'spot', "2023-02-01", "2023-02-13"))
+    start = to_milliseconds(start_time)
+    end = to_milliseconds(end_time)
+    metrics = CrawlerMetrics()
+
+    for symbol in symbols:
+        last = funding_store.last_bar_time(symbol, Exchange.BINANCE.value, FUNDING_FOLDER)
+        with BarWriter(save_funding, metrics=metrics) as writer:
+            downloader = AsyncFundingDownloader(writer.put_async, concurrency=concurrency, proxy=get_proxy(),
+                                                limiter=limiters['usdt_future'], metrics=metrics,
+                                                cache=response_cache, offline=offline)
+            asyncio.run(downloader.download([symbol], max(start, last + 1) if last else start, end))
 
-    t1.start()
-    t2.start()
-    t3.start()
+        last = bar_store.last_bar_time(symbol, Exchange.BINANCE.value, MARK_PRICE_FOLDER)
+        with BarWriter(save_mark_prices, metrics=metrics) as writer:
+            downloader = AsyncKlineDownloader('usdt_future', writer.put_async, concurrency=concurrency,
+                                              proxy=get_proxy(), limiter=limiters['usdt_future'], metrics=metrics,
+                                              path=MARK_PRICE_PATH, cache=response_cache, offline=offline)
+            asyncio.run(downloader.download([symbol], max(start, last + INTERVAL_MS['1m']) if last else start, end))
 
-    t1.join()
-    t2.join()
-    t3.join()
+    metrics.print_summary(metrics_file)
 
 
-def download_future(symbol):
+def download_trades(symbols: list, market: str, start_time: str, end_time: str, concurrency: int = 10):
     """
-    下载合约数据的方法。
-    :return:
+    下载逐笔的归集成交, 用于Class16/17/18这类在on_tick里下单的策略的回测.
+    已经下载过的id范围会被跳过, 下载完之后把每个月的分片合并.
+    :param symbols: ["BTCUSDT", "ETHUSDT"]
+    :param market: spot, usdt_future
+    """
+    metrics = CrawlerMetrics()
+    # 成交的数量比K线多得多, 攒够更多再写一个分片.
+    # 保存过的id范围在下载之前已经跳过, 不用再在内存里记住几千万个写过的id.
+    with BarWriter(save_trades, batch_size=1000000, metrics=metrics, key=None) as writer:
+        downloader = AsyncTradeDownloader(market, writer.put_async, store=trade_store, concurrency=concurrency,
+                                          proxy=get_proxy(), limiter=limiters[market], metrics=metrics,
+                                          cache=response_cache, offline=offline)
+        downloader.run(symbols, start_time, end_time)
+    metrics.print_summary(metrics_file)
+
+    months = np.arange(month_of(to_milliseconds(start_time)), month_of(to_milliseconds(end_time)) + 1)
+    for symbol in symbols:
+        for month in months:
+            trade_store.compact(db_symbol(symbol, market), Exchange.BINANCE.value, str(month))
+
+
+def sync_forever(symbols: list, market: str, lookback_days: int = 3, concurrency: int = 10,
+                 use_store: bool = False):
     """
+    常驻运行, 每分钟结束之后同步所有symbol新走完的1分钟K线, 本地还没有数据的从lookback_days天之前开始.
+    :param symbols: ["BTCUSDT", "ETHUSDT"]
+    :param market: spot, usdt_future, inverse_future
+    :param use_store: 保存到bar_store而不是数据库.
+    """
+    on_batch, source = (save_kline_batch_to_store, bar_store) if use_store else (save_kline_batch, database)
+    daemon = SyncDaemon(market, symbols, on_batch, source, lookback_days=lookback_days, validator=get_validator(),
+                        concurrency=concurrency, proxy=get_proxy(), limiter=limiters[market],
+                        cache=response_cache, offline=offline)
+    daemon.run_forever()
 
-    # BTCUSDT的， 要注意看该币的上市时间。
-    t1 = Thread(target=get_binance_data, args=(symbol, 'future', "2022-12-01", "2022-12-31"))
-    t2 = Thread(target=get_binance_data, args=(symbol, 'future', "2023-01-01", "2023-01-31"))
-    t3 = Thread(target=get_binance_data, args=(symbol, 'future', "2023-02-01", "2023-02-13"))
 
-    t1.start()
-    t2.start()
-    t3.start()
+def import_archives(folder: str, market: str, workers: int = None, use_store: bool = False):
+    """
+    导入从data.binance.vision下载的1分钟K线月度zip文件, 不需要请求API.
+    :param folder: zip文件所在的目录
+    :param market: spot, usdt_future, inverse_future, 决定保存的symbol是否小写.
+    :param workers: 解析文件的进程数量, 默认等于CPU核心数.
+    :param use_store: 保存到bar_store而不是数据库.
+    """
+    sink = save_klines_to_store if use_store else save_klines
 
-    t1.join()
-    t2.join()
-    t3.join()
+    count = 0
+    firsts = {}  # symbol: 导入的第一根K线, 历史数据通常比bar_store里已有的更早
+    with BarWriter(sink, validator=get_validator()) as writer:
+        for symbol, bars in read_archives(folder, '1m', workers):
+            writer.put(symbol, market, bars)
+            if len(bars):
+                first = int(bars['datetime'].min())
+                firsts[symbol] = min(firsts.get(symbol, first), first)
+            count += len(bars)
+            print(f"{symbol} 读取{len(bars)}根K线")
 
+    print(f"导入完成, 共{count}根K线")
+    print(get_validator())
 
-if __name__ == '__main__':
+    if use_store:
+        for symbol, first in firsts.items():
+            derive_bars([symbol], market, first)
+
+
+def load_proxies():
+    """
+    读取配置文件里的代理.
+    :return: {'http': proxy, 'https': proxy}, 没有配置返回None
+    """
     with open('.vntrader/connect_binance_spot.json') as json_file:
         connect_binance = json.load(json_file)
 
     proxy_host = connect_binance["代理地址"]
     proxy_port = connect_binance["代理端口"]
-    
+
     proxies = None
     if proxy_host and proxy_port:
         proxy = f'http://{proxy_host}:{proxy_port}'
         proxies = {'http': proxy, 'https': proxy}
+    return proxies
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="爬取币安的K线数据")
+    parser.add_argument("--metrics", help="下载结束之后把运行指标保存为json文件")
+    parser.add_argument("--cache", help="原始响应的缓存目录, 重新下载的时候命中的页直接从磁盘读取")
+    parser.add_argument("--cache-size", type=int, default=None, help="缓存的大小上限, MB, 超过之后淘汰最久没有使用的")
+    parser.add_argument("--offline", action="store_true", help="只从缓存里读取, 用来重新解析已经下载过的数据")
+    subparsers = parser.add_subparsers(dest="command")
+
+    import_parser = subparsers.add_parser("import", help="导入币安历史数据的月度K线zip文件")
+    import_parser.add_argument("folder", help="zip文件所在的目录")
+    import_parser.add_argument("--market", default="spot", choices=list(BINANCE_MARKETS))
+    import_parser.add_argument("--workers", type=int, default=None, help="进程数量, 默认等于CPU核心数")
+    import_parser.add_argument("--store", action="store_true", help="保存到bar_store而不是数据库")
+
+    trades_parser = subparsers.add_parser("trades", help="下载逐笔的归集成交")
+    trades_parser.add_argument("symbols", nargs="+", help="例如BTCUSDT ETHUSDT")
+    trades_parser.add_argument("--market", default="spot", choices=list(AGG_TRADE_MARKETS))
+    trades_parser.add_argument("--start", required=True, help="例如2021-1-1")
+    trades_parser.add_argument("--end", required=True, help="例如2021-2-1")
+    trades_parser.add_argument("--concurrency", type=int, default=10)
+
+    funding_parser = subparsers.add_parser("funding", help="下载USDT合约的资金费率和标记价格K线")
+    funding_parser.add_argument("symbols", nargs="+", help="例如BTCUSDT ETHUSDT")
+    funding_parser.add_argument("--start", required=True, help="例如2021-1-1")
+    funding_parser.add_argument("--end", required=True, help="例如2021-2-1")
+
+    sync_parser = subparsers.add_parser("sync", help="常驻运行, 每分钟同步新走完的1分钟K线")
+    sync_parser.add_argument("symbols", nargs="+", help="例如BTCUSDT ETHUSDT")
+    sync_parser.add_argument("--market", default="spot", choices=list(BINANCE_MARKETS))
+    sync_parser.add_argument("--lookback", type=int, default=3, help="本地还没有数据的symbol从多少天之前开始同步")
+    sync_parser.add_argument("--concurrency", type=int, default=10)
+    sync_parser.add_argument("--store", action="store_true", help="保存到bar_store而不是数据库")
+
+    resample_parser = subparsers.add_parser("resample", help="用bar_store里的1分钟K线合成更大周期的K线")
+    resample_parser.add_argument("symbols", nargs="+", help="例如BTCUSDT ETHUSDT")
+    resample_parser.add_argument("--market", default="spot", choices=list(BINANCE_MARKETS))
+    resample_parser.add_argument("--since", help="回补过更早的K线的时候, 从这一天开始重新合成, 例如2021-1-1")
+
+    args = parser.parse_args()
+    metrics_file = args.metrics
+    offline = args.offline
+    if args.cache:
+        response_cache = ResponseCache(args.cache, args.cache_size * 1024 * 1024 if args.cache_size else None)
+    if args.command == "import":
+        import_archives(args.folder, args.market, args.workers, args.store)
+    elif args.command == "resample":
+        derive_bars(args.symbols, args.market, to_milliseconds(args.since) if args.since else None)
+    elif args.command == "trades":
+        proxies = load_proxies()
+        download_trades(args.symbols, args.market, args.start, args.end, args.concurrency)
+    elif args.command == "sync":
+        proxies = load_proxies()
+        sync_forever(args.symbols, args.market, args.lookback, args.concurrency, args.store)
+    elif args.command == "funding":
+        proxies = load_proxies()
+        download_funding(args.symbols, args.start, args.end)
+    else:
+        proxies = load_proxies()
 
-    download_spot("BTCUSDT") # 下载现货的数据
-    # download_future("BTCUSDT")  # 下载合约的数据
+        download_spot(["BTCUSDT"], "2022-12-01", "2023-02-13") # 下载现货的数据
+        # download_spot(["BTCUSDT"], "2022-12-01", "2023-02-13", use_store=True)  # 保存到bar_store
+        # download_future(["BTCUSDT"], "2022-12-01", "2023-02-13")  # 下载合约的数据
+        # fill_gaps(["BTCUSDT"], 'spot', "2022-12-01", "2023-02-13")  # 检查并补齐缺失的K线
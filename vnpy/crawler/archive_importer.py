@@ -0,0 +1,78 @@
+"""
+导入币安历史数据网站(data.binance.vision)下载的月度K线zip文件.
+
+很多人回补数据的时候直接下载交易所每个月的csv压缩包, 而不是通过REST接口每次请求1000根.
+这里直接从zip里以流的方式读取csv(不解压到磁盘), 用kline_decoder解码成数组,
+每个文件交给一个进程处理, 用满所有的CPU核心, 不消耗任何API权重.
+
+文件名格式: BTCUSDT-1m-2021-01.zip, 日度文件为BTCUSDT-1m-2021-01-01.zip
+"""
+
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from crawler.kline_decoder import BAR_DTYPE, decode_kline_csv
+
+ARCHIVE_PATTERN = re.compile(r"^(?P<symbol>[A-Z0-9]+)-(?P<interval>\w+)-\d{4}-\d{2}(-\d{2})?\.zip$")
+
+
+def parse_archive_name(path: Path) -> Tuple[str, str]:
+    """
+    :return: (symbol, interval), 例如("BTCUSDT", "1m")
+    """
+    match = ARCHIVE_PATTERN.match(path.name)
+    if not match:
+        raise ValueError(f"无法识别的文件名: {path.name}")
+    return match.group("symbol"), match.group("interval")
+
+
+def read_archive(path: Path) -> Tuple[str, np.ndarray]:
+    """
+    读取一个zip文件里所有的csv, 在子进程里运行.
+    :return: (symbol, bars)
+    """
+    symbol, _ = parse_archive_name(path)
+
+    parts = []
+    with zipfile.ZipFile(path) as zip_file:
+        for name in zip_file.namelist():
+            if not name.endswith(".csv"):
+                continue
+
+            with zip_file.open(name) as file:
+                has_header = not file.readline()[:1].isdigit()
+
+            with zip_file.open(name) as file:
+                parts.append(decode_kline_csv(file, has_header))
+
+    bars = np.concatenate(parts) if parts else np.empty(0, dtype=BAR_DTYPE)
+    return symbol, bars
+
+
+def find_archives(folder: str, interval: str = '1m') -> list:
+    """
+    目录下所有interval周期的K线zip文件.
+    """
+    return sorted(Path(folder).glob(f"*-{interval}-*.zip"))
+
+
+def read_archives(folder: str, interval: str = '1m', workers: Optional[int] = None) -> Iterator[Tuple[str, np.ndarray]]:
+    """
+    多进程读取目录下的zip文件, 按完成的顺序返回.
+    :param workers: 进程数量, 默认等于CPU核心数.
+    :return: 迭代器, 每个元素为(symbol, bars)
+    """
+    paths = find_archives(folder, interval)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(read_archive, path): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as error:
+                print(f"{futures[future].name} 读取失败: {error}")
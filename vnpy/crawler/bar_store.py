@@ -0,0 +1,227 @@
+"""
+按月分区的Parquet K线存储.
+
+目录结构: root/exchange/symbol/interval/YYYY-MM.parquet, 每个文件是一个symbol一个月的K线,
+按开盘时间排序. 读取的时候只打开和时间范围有交集的月份文件, 文件内部再按时间过滤,
+并且只读取需要的列, 加载一年的1分钟K线(约52.5万根)只需要几十毫秒.
+
+既可以作为crawl_data.py的写入目标, 也可以作为backtest_fixed_time.py的数据来源:
+    store = ParquetBarStore(get_folder_path("bar_store"))
+    engine.history_data = store.load_bar_data("btcusdt", Exchange.BINANCE, Interval.MINUTE, start, end)
+"""
+
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from vnpy.trader.constant import Exchange, Interval
+from vnpy.trader.database import BarOverview
+from vnpy.trader.object import BarData
+
+from crawler.kline_decoder import BAR_DTYPE, datetime_to_ms, ms_to_datetime, to_bars
+
+# Interval的值与目录名不一致的周期, 目录名与币安的周期一致.
+INTERVAL_FOLDERS = {"d": "1d", "w": "1w"}
+
+
+def month_of(timestamps: np.ndarray) -> np.ndarray:
+    """
+    毫秒时间戳所在的月份(UTC), 例如2020-01.
+    """
+    return np.asarray(timestamps, dtype=np.int64).astype('datetime64[ms]').astype('datetime64[M]')
+
+
+class ParquetBarStore:
+    """
+    列式的K线存储.
+    """
+
+    def __init__(self, root: str, dtype: np.dtype = BAR_DTYPE):
+        """
+        :param root: 存储目录
+        :param dtype: 保存的数组格式, 第一列必须是datetime, 例如资金费率用FUNDING_DTYPE.
+        """
+        self.root = Path(root)
+        self.dtype = dtype
+
+    def get_folder(self, symbol: str, exchange: str, interval: str) -> Path:
+        """"""
+        return self.root.joinpath(exchange, symbol, interval)
+
+    def get_path(self, symbol: str, exchange: str, interval: str, month: np.datetime64) -> Path:
+        """"""
+        return self.get_folder(symbol, exchange, interval).joinpath(f"{month}.parquet")
+
+    def write(self, symbol: str, exchange: str, interval: str, bars: np.ndarray) -> None:
+        """
+        写入self.dtype的数组, 和已有的数据按开盘时间合并, 相同时间的K线以新数据为准.
+        :param exchange: 交易所, 例如BINANCE
+        :param interval: K线周期, 例如1m
+        """
+        if not len(bars):
+            return
+
+        folder = self.get_folder(symbol, exchange, interval)
+        folder.mkdir(parents=True, exist_ok=True)
+
+        months = month_of(bars['datetime'])
+        for month in np.unique(months):
+            data = bars[months == month]
+            path = self.get_path(symbol, exchange, interval, month)
+
+            if path.exists():
+                data = np.concatenate([data, self.read_file(path)])
+
+            # 按时间排序, 重复的时间只保留第一次出现的(也就是新数据).
+            _, ix = np.unique(data['datetime'], return_index=True)
+            self.write_file(path, data[ix])
+
+    def read(
+        self,
+        symbol: str,
+        exchange: str,
+        interval: str,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        columns: Optional[Sequence[str]] = None,
+    ) -> np.ndarray:
+        """
+        读取[start, end]之间的K线.
+        :param start: 毫秒, None表示不限制
+        :param end: 毫秒, 闭区间, None表示不限制
+        :param columns: 需要读取的列, datetime总会被读取.
+        :return: 只包含所选列的结构化数组, 按时间排序.
+        """
+        names = list(self.dtype.names)
+        if columns:
+            names = ['datetime'] + [name for name in columns if name != 'datetime']
+        dtype = np.dtype([(name, self.dtype[name]) for name in names])
+
+        filters = []
+        if start is not None:
+            filters.append(('datetime', '>=', start))
+        if end is not None:
+            filters.append(('datetime', '<=', end))
+
+        first = month_of(start) if start is not None else None
+        last = month_of(end) if end is not None else None
+
+        parts = []
+        for path in self.get_paths(symbol, exchange, interval):
+            month = np.datetime64(path.stem, 'M')
+            if (first is not None and month < first) or (last is not None and month > last):
+                continue
+
+            table = pq.read_table(path, columns=names, filters=filters or None)
+            if table.num_rows:
+                parts.append(self.table_to_array(table, dtype))
+
+        if not parts:
+            return np.empty(0, dtype=dtype)
+        return np.concatenate(parts)
+
+    def load_bar_data(
+        self,
+        symbol: str,
+        exchange,
+        interval,
+        start: datetime,
+        end: datetime,
+        gateway_name: str = "DB",
+    ) -> List[BarData]:
+        """
+        与BaseDatabase.load_bar_data的参数一致, 返回BarData.
+        :param exchange: Exchange.BINANCE
+        :param interval: Interval.MINUTE
+        """
+        folder = INTERVAL_FOLDERS.get(interval.value, interval.value)
+        bars = self.read(symbol, exchange.value, folder, datetime_to_ms(start), datetime_to_ms(end))
+        return to_bars(bars, symbol, exchange, interval, gateway_name)
+
+    def get_bar_overview(self) -> List[BarOverview]:
+        """
+        与BaseDatabase.get_bar_overview一致, 可以直接用于DatabaseCheckpoint.
+        只统计Interval里有的周期.
+        """
+        values = {name: value for value, name in INTERVAL_FOLDERS.items()}
+
+        overviews = []
+        for folder in sorted(self.root.glob("*/*/*")):
+            exchange, symbol, interval = folder.parts[-3:]
+            try:
+                overview = BarOverview(
+                    symbol=symbol, exchange=Exchange(exchange), interval=Interval(values.get(interval, interval))
+                )
+            except ValueError:
+                continue
+
+            paths = self.get_paths(symbol, exchange, interval)
+            if not paths:
+                continue
+
+            first = pq.read_table(paths[0], columns=['datetime']).column('datetime')
+            last = pq.read_table(paths[-1], columns=['datetime']).column('datetime')
+            overview.start = ms_to_datetime(first[0].as_py())
+            overview.end = ms_to_datetime(last[-1].as_py())
+            overview.count = sum(pq.ParquetFile(path).metadata.num_rows for path in paths)
+            overviews.append(overview)
+
+        return overviews
+
+    def last_bar_time(self, symbol: str, exchange: str, interval: str) -> Optional[int]:
+        """
+        最后一根K线的开盘时间, 毫秒, 没有数据返回None.
+        """
+        paths = self.get_paths(symbol, exchange, interval)
+        if not paths:
+            return None
+        column = pq.read_table(paths[-1], columns=['datetime']).column('datetime')
+        return column[-1].as_py() if len(column) else None
+
+    def get_paths(self, symbol: str, exchange: str, interval: str) -> List[Path]:
+        """
+        按月份排序的所有分区文件.
+        """
+        folder = self.get_folder(symbol, exchange, interval)
+        if not folder.exists():
+            return []
+        return sorted(folder.glob("*.parquet"))
+
+    def read_file(self, path: Path) -> np.ndarray:
+        """"""
+        return self.table_to_array(pq.read_table(path), self.dtype)
+
+    def write_file(self, path: Path, bars: np.ndarray) -> None:
+        """
+        先写临时文件再替换, 中途退出不会留下损坏的分区.
+        """
+        table = pa.table({name: bars[name] for name in bars.dtype.names})
+        tmp_path = path.with_suffix(".tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def table_to_array(table: pa.Table, dtype: np.dtype) -> np.ndarray:
+        """"""
+        array = np.empty(table.num_rows, dtype=dtype)
+        for name in dtype.names:
+            array[name] = table.column(name).to_numpy()
+        return array
+
+
+def load_engine_data(engine, store: ParquetBarStore) -> None:
+    """
+    代替engine.load_data(), 从ParquetBarStore加载回测数据.
+    :param engine: 已经调用过set_parameters的BacktestingEngine
+    """
+    engine.output("开始从bar_store加载历史数据")
+
+    end = engine.end or datetime.now()
+    engine.history_data = store.load_bar_data(engine.symbol, engine.exchange, engine.interval, engine.start, end)
+
+    engine.output(f"历史数据加载完成，数据量：{len(engine.history_data)}")
@@ -0,0 +1,266 @@
+"""
+爬虫的运行指标.
+
+统计请求的页数、K线数量、接收的字节数、每个请求的延迟分布、限流等待和退避的时间、
+每种错误的次数以及写入数据库的时间, 每隔几秒打印一行进度(含ETA), 结束的时候输出
+json格式的汇总. 通过对比网络、限流和写入各自花掉的时间, 可以判断下载慢在哪里.
+
+用法:
+    metrics = CrawlerMetrics()
+    downloader = AsyncKlineDownloader('spot', writer.put_async, metrics=metrics)
+    ...
+    metrics.print_summary()
+"""
+
+import json
+import time
+from collections import Counter, defaultdict
+from threading import Lock
+from typing import Dict, Optional
+
+import numpy as np
+
+# 延迟直方图的上边界(毫秒), 最后一个桶是大于最后一个边界的部分.
+LATENCY_BUCKETS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+WORKER_FIELDS = ("pages", "bars", "errors", "retries", "latency", "backoff")
+
+
+class CrawlerMetrics:
+    """
+    协程和线程都可以调用, 所有的计数都在一个锁里更新.
+    """
+
+    def __init__(self, report_interval: float = 5.0, verbose: bool = True):
+        """
+        :param report_interval: 每隔多少秒打印一次进度.
+        :param verbose: 是否打印进度.
+        """
+        self.report_interval = report_interval
+        self.verbose = verbose
+        self.lock = Lock()
+
+        self.start_time = time.perf_counter()
+        self.last_report = self.start_time
+
+        self.total_pages = 0
+        self.pages = 0
+        self.bars = 0
+        self.bytes = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.latencies = []
+        self.histogram = np.zeros(len(LATENCY_BUCKETS) + 1, dtype=np.int64)
+
+        self.throttle_seconds = 0.0
+        self.backoff_seconds = 0.0
+        self.errors: Counter = Counter()
+        self.workers: Dict[str, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(WORKER_FIELDS, 0))
+
+        self.written = 0
+        self.write_seconds = 0.0
+        self.queue_wait_seconds = 0.0
+
+    def add_total(self, pages: int) -> None:
+        """
+        增加预计要请求的页数, 用来计算进度和ETA.
+        """
+        with self.lock:
+            self.total_pages += pages
+
+    def record_page(self, worker: str, latency: float, nbytes: int, bars: int, cached: bool = False) -> None:
+        """
+        一个成功的请求.
+        :param latency: 秒
+        :param cached: 是否从ResponseCache读取, 不计入延迟的统计.
+        """
+        with self.lock:
+            self.pages += 1
+            self.bars += bars
+            self.bytes += nbytes
+
+            stats = self.workers[worker]
+            stats["pages"] += 1
+            stats["bars"] += bars
+
+            if cached:
+                self.cache_hits += 1
+            else:
+                self.latencies.append(latency)
+                self.histogram[np.searchsorted(LATENCY_BUCKETS, latency * 1000)] += 1
+                stats["latency"] += latency
+
+        self.report()
+
+    def record_throttle(self, seconds: float) -> None:
+        """
+        等待限流器令牌的时间.
+        """
+        with self.lock:
+            self.throttle_seconds += seconds
+
+    def record_backoff(self, worker: str, delay: float, reason: str) -> None:
+        """
+        服务器拒绝或者网络错误之后的一次退避.
+        :param reason: 状态码或者异常的类型, 例如429, TimeoutError
+        """
+        with self.lock:
+            self.retries += 1
+            self.backoff_seconds += delay
+            self.errors[str(reason)] += 1
+
+            stats = self.workers[worker]
+            stats["retries"] += 1
+            stats["backoff"] += delay
+
+    def record_error(self, worker: str, error: Exception) -> None:
+        """
+        重试之后仍然失败, 这一页被放弃.
+        """
+        with self.lock:
+            self.errors[f"failed:{type(error).__name__}"] += 1
+            self.workers[worker]["errors"] += 1
+
+    def record_write(self, rows: int, seconds: float) -> None:
+        """
+        BarWriter的一次写入.
+        """
+        with self.lock:
+            self.written += rows
+            self.write_seconds += seconds
+
+    def record_queue_wait(self, seconds: float) -> None:
+        """
+        写入队列满了, 下载的协程等待的时间.
+        """
+        with self.lock:
+            self.queue_wait_seconds += seconds
+
+    @property
+    def elapsed(self) -> float:
+        """"""
+        return time.perf_counter() - self.start_time
+
+    def eta(self) -> Optional[float]:
+        """
+        按照目前的速度, 剩下的页还需要多少秒.
+        """
+        if not self.pages or not self.total_pages:
+            return None
+        remaining = max(self.total_pages - self.pages, 0)
+        return remaining * self.elapsed / self.pages
+
+    def percentiles(self) -> Dict[str, float]:
+        """
+        请求延迟的分位数(毫秒).
+        """
+        if not self.latencies:
+            return {}
+        values = np.percentile(np.array(self.latencies) * 1000, [50, 90, 99])
+        return {"p50": round(values[0], 1), "p90": round(values[1], 1), "p99": round(values[2], 1),
+                "max": round(max(self.latencies) * 1000, 1)}
+
+    def latency_histogram(self) -> Dict[str, int]:
+        """"""
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}ms"]
+        return {label: int(count) for label, count in zip(labels, self.histogram)}
+
+    def bottleneck(self) -> str:
+        """
+        网络、限流和写入哪一个花的时间最多.
+        请求的延迟是所有并发请求的累加, 所以要除以并发的数量.
+        """
+        workers = max(len(self.workers), 1)
+        network = sum(self.latencies) / workers
+        times = {
+            "network": network,
+            "rate_limit": (self.throttle_seconds + self.backoff_seconds) / workers,
+            "database": max(self.write_seconds, self.queue_wait_seconds / workers),
+        }
+        return max(times, key=times.get)
+
+    def progress(self) -> str:
+        """
+        一行的进度.
+        """
+        elapsed = self.elapsed
+        percent = f"{self.pages / self.total_pages:.1%}" if self.total_pages else "-"
+        eta = self.eta()
+        p50 = np.median(self.latencies[-1000:]) * 1000 if self.latencies else 0
+        return (
+            f"{self.pages}/{self.total_pages or '?'}页 {percent} | "
+            f"{self.bars / elapsed:,.0f}根/秒 {self.bytes / elapsed / 1024:,.0f}KB/秒 | "
+            f"p50 {p50:.0f}ms | 缓存{self.cache_hits} | 重试{self.retries} 退避{self.backoff_seconds:.1f}s | "
+            f"写入{self.written} | ETA {format_seconds(eta)}"
+        )
+
+    def report(self, force: bool = False) -> None:
+        """
+        距离上一次打印超过report_interval的时候打印进度.
+        """
+        if not self.verbose:
+            return
+
+        now = time.perf_counter()
+        with self.lock:
+            if not force and now - self.last_report < self.report_interval:
+                return
+            self.last_report = now
+
+        print(self.progress())
+
+    def summary(self) -> dict:
+        """"""
+        elapsed = self.elapsed
+        return {
+            "seconds": round(elapsed, 3),
+            "pages": self.pages,
+            "total_pages": self.total_pages,
+            "bars": self.bars,
+            "bytes": self.bytes,
+            "bars_per_second": round(self.bars / elapsed, 1),
+            "pages_per_second": round(self.pages / elapsed, 2),
+            "latency_ms": self.percentiles(),
+            "latency_histogram": self.latency_histogram(),
+            "cache_hits": self.cache_hits,
+            "retries": self.retries,
+            "throttle_seconds": round(self.throttle_seconds, 3),
+            "backoff_seconds": round(self.backoff_seconds, 3),
+            "errors": dict(self.errors),
+            "written": self.written,
+            "write_seconds": round(self.write_seconds, 3),
+            "queue_wait_seconds": round(self.queue_wait_seconds, 3),
+            "bottleneck": self.bottleneck(),
+            "workers": {
+                worker: {key: round(value, 3) for key, value in stats.items()}
+                for worker, stats in sorted(self.workers.items())
+            },
+        }
+
+    def print_summary(self, path: Optional[str] = None) -> dict:
+        """
+        打印汇总, 传入path的时候同时保存为json文件.
+        """
+        summary = self.summary()
+        self.report(force=True)
+        print(json.dumps({key: value for key, value in summary.items() if key != "workers"},
+                         ensure_ascii=False, indent=4))
+
+        if path:
+            with open(path, "w") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=4)
+        return summary
+
+
+def format_seconds(seconds: Optional[float]) -> str:
+    """
+    秒数格式化为1h02m03s.
+    """
+    if seconds is None:
+        return "-"
+    seconds = int(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{seconds:02d}s"
+    return f"{minutes}m{seconds:02d}s"
@@ -0,0 +1,119 @@
+"""
+USDT合约的资金费率和标记价格.
+
+永续合约每8小时结算一次资金费率, 持仓的时间越长, 资金费在盈亏里的占比越大.
+这里下载/fapi/v1/fundingRate的资金费率历史和/fapi/v1/markPriceKlines的标记价格K线,
+和K线一样保存到ParquetBarStore里:
+    root/BINANCE/symbol/funding/YYYY-MM.parquet  FUNDING_DTYPE
+    root/BINANCE/symbol/mark_1m/YYYY-MM.parquet  BAR_DTYPE
+回测的时候用backtester/funding.py按持仓一次性计算资金费.
+"""
+
+import time
+from typing import List, Optional
+
+import aiohttp
+import numpy as np
+
+from crawler.async_downloader import AsyncKlineDownloader, split_windows
+
+FUNDING_PATH = '/fapi/v1/fundingRate'
+MARK_PRICE_PATH = '/fapi/v1/markPriceKlines'
+
+FUNDING_FOLDER = "funding"
+MARK_PRICE_FOLDER = "mark_1m"
+
+FUNDING_LIMIT = 1000
+FUNDING_INTERVAL_MS = 8 * 60 * 60 * 1000
+FUNDING_WEIGHT = 1  # 资金费率接口单独限频(每5分钟500次), 这里只占用很少的权重
+
+FUNDING_DTYPE = np.dtype([
+    ('datetime', np.int64),     # 结算时间, 毫秒时间戳(UTC)
+    ('rate', np.float64),
+    ('mark_price', np.float64),  # 早期的数据没有标记价格, 为nan
+])
+
+
+def decode_funding(datas: list) -> np.ndarray:
+    """
+    把资金费率接口返回的一页数据转换成FUNDING_DTYPE数组.
+    [
+        {
+            "symbol": "BTCUSDT",
+            "fundingRate": "-0.03750000",   // 资金费率
+            "fundingTime": 1570608000000,   // 资金费时间
+            "markPrice": "34287.54619963"   // 资金费对应标记价格
+        }
+    ]
+    """
+    funding = np.empty(len(datas), dtype=FUNDING_DTYPE)
+    if not datas:
+        return funding
+
+    funding['datetime'] = [data['fundingTime'] for data in datas]
+    funding['rate'] = np.array([data['fundingRate'] for data in datas]).astype(np.float64)
+    funding['mark_price'] = np.array([data.get('markPrice') or 'nan' for data in datas]).astype(np.float64)
+    return funding
+
+
+class AsyncFundingDownloader(AsyncKlineDownloader):
+    """
+    资金费率历史的下载器, 每页最多1000条, 按8小时结算是333天.
+    """
+
+    def __init__(self, on_page, base_url: Optional[str] = None, **kwargs):
+        """
+        :param on_page: on_page(symbol, market, funding), funding为FUNDING_DTYPE数组.
+        其他参数和AsyncKlineDownloader一致.
+        """
+        super().__init__('usdt_future', on_page, base_url=base_url, path=FUNDING_PATH, **kwargs)
+        self.limit = FUNDING_LIMIT
+        self.interval_ms = FUNDING_INTERVAL_MS
+
+    async def download(self, symbols: List[str], start: int, end: int) -> None:
+        """
+        资金费率的数据很少, 不需要查询上市时间和断点续传.
+        """
+        jobs = []
+        for symbol in symbols:
+            for window in split_windows(start, end, self.interval_ms, self.limit):
+                jobs.append((symbol, window))
+
+        await self.download_windows(jobs)
+
+    async def fetch_page(
+        self,
+        session: aiohttp.ClientSession,
+        symbol: str,
+        start: int,
+        end: int,
+        limit: Optional[int] = None,
+        worker: str = "main",
+    ) -> list:
+        """
+        请求[start, end]之间的资金费率. 返回满页的时候从最后一条之后继续请求, 直到不满一页为止,
+        结算间隔短于8小时的合约一个窗口里会有不止一页.
+        """
+        limit = limit or self.limit
+        rows = []
+        while start <= end:
+            params = {
+                'symbol': symbol,
+                'startTime': start,
+                'endTime': end,
+                'limit': limit,
+            }
+            page = await self.request(session, params, FUNDING_WEIGHT, worker)
+            rows.extend(page)
+            if len(page) < limit:
+                break
+            start = page[-1]['fundingTime'] + 1
+        return rows
+
+    def cacheable(self, params: dict, rows: list) -> bool:
+        """"""
+        return params['endTime'] < time.time() * 1000
+
+    def decode(self, rows: list) -> np.ndarray:
+        """"""
+        return decode_funding(rows)
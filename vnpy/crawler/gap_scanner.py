@@ -0,0 +1,149 @@
+"""
+扫描数据库里K线的缺口, 只把缺失的时间段重新下载.
+
+下载过程中的异常或者空页都会在数据里留下空洞, 网格策略回测的时候每根K线都会触发逻辑,
+一个空洞就像一次假的价格跳空, 很容易错误地触发止损.
+
+用法:
+    gaps = scan_gaps(database_timestamps(database, Exchange.BINANCE, Interval.MINUTE),
+                     ["btcusdt"], start, end, 60 * 1000)  # database也可以是ParquetBarStore
+    print_gaps(gaps, 60 * 1000)
+"""
+
+import sys
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from crawler.bar_store import INTERVAL_FOLDERS, ParquetBarStore
+from crawler.kline_decoder import CHINA_OFFSET_MS, ms_to_datetime, datetime_to_ms
+
+
+def find_gaps(timestamps: np.ndarray, interval_ms: int, start: int = None, end: int = None) -> np.ndarray:
+    """
+    找出相邻两根K线之间的缺口.
+    :param timestamps: 已排序的K线开盘时间, 毫秒.
+    :param start: 需要检查的开始时间, 传入的时候也会检查开头缺失的部分.
+    :param end: 需要检查的结束时间(闭区间), 传入的时候也会检查结尾缺失的部分.
+    :return: shape为(n, 2)的数组, 每一行是缺失的第一根和最后一根K线的开盘时间.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+
+    if start is not None or end is not None:
+        edges = []
+        if start is not None:
+            edges.append(start - interval_ms)
+        edges.append(timestamps)
+        if end is not None:
+            edges.append(end - end % interval_ms + interval_ms)
+        timestamps = np.hstack(edges).astype(np.int64)
+
+    if len(timestamps) < 2:
+        return np.empty((0, 2), dtype=np.int64)
+
+    diffs = np.diff(timestamps)
+    ix = np.flatnonzero(diffs > interval_ms)
+
+    gaps = np.empty((len(ix), 2), dtype=np.int64)
+    gaps[:, 0] = timestamps[ix] + interval_ms
+    gaps[:, 1] = timestamps[ix + 1] - interval_ms
+    return gaps
+
+
+def gaps_to_windows(gaps: np.ndarray, interval_ms: int, limit: int) -> List[Tuple[int, int]]:
+    """
+    把缺口切分成下载的窗口, 每个窗口最多limit根K线.
+    """
+    windows = []
+    step = interval_ms * limit
+    for first, last in gaps.tolist():
+        while first <= last:
+            stop = min(first + step - interval_ms, last)
+            windows.append((first, stop + interval_ms - 1))
+            first = stop + interval_ms
+    return windows
+
+
+def bar_model(database):
+    """
+    peewee实现的数据库(sqlite/mysql/postgresql)在同一个模块里定义了K线的表DbBarData, 其他数据库返回None.
+    """
+    module = sys.modules.get(type(database).__module__)
+    return getattr(module, "DbBarData", None)
+
+
+def database_timestamps(database, exchange, interval) -> Callable[[str, int, int], np.ndarray]:
+    """
+    加载K线开盘时间的函数, 只读取datetime一列, 不构造BarData.
+    :param database: BaseDatabase或者ParquetBarStore
+    """
+    if isinstance(database, ParquetBarStore):
+        folder = INTERVAL_FOLDERS.get(interval.value, interval.value)
+
+        def load(symbol: str, start: int, end: int) -> np.ndarray:
+            return database.read(symbol, exchange.value, folder, start, end, columns=['datetime'])['datetime']
+
+        return load
+
+    model = bar_model(database)
+    if model is not None:
+
+        def load(symbol: str, start: int, end: int) -> np.ndarray:
+            # 数据库里保存的是不带时区的北京时间, 和load_bar_data一样
+            query = (
+                model.select(model.datetime)
+                .where(
+                    (model.symbol == symbol)
+                    & (model.exchange == exchange.value)
+                    & (model.interval == interval.value)
+                    & (model.datetime >= ms_to_datetime(start).replace(tzinfo=None))
+                    & (model.datetime <= ms_to_datetime(end).replace(tzinfo=None))
+                )
+                .order_by(model.datetime)
+                .tuples()
+            )
+            times = np.array([dt for dt, in query], dtype='datetime64[ms]')
+            return times.astype(np.int64) - CHINA_OFFSET_MS
+
+        return load
+
+    def load(symbol: str, start: int, end: int) -> np.ndarray:
+        bars = database.load_bar_data(
+            symbol, exchange, interval, ms_to_datetime(start), ms_to_datetime(end)
+        )
+        return np.fromiter((datetime_to_ms(bar.datetime) for bar in bars), dtype=np.int64, count=len(bars))
+
+    return load
+
+
+def scan_gaps(
+    load_timestamps: Callable[[str, int, int], np.ndarray],
+    symbols: List[str],
+    start: int,
+    end: int,
+    interval_ms: int,
+) -> Dict[str, np.ndarray]:
+    """
+    :param load_timestamps: load_timestamps(symbol, start, end), 返回已排序的开盘时间.
+    :param symbols: 数据库里的symbol, 现货是小写.
+    :param start: 毫秒
+    :param end: 毫秒, 闭区间
+    :return: {symbol: gaps}
+    """
+    results = {}
+    for symbol in symbols:
+        timestamps = load_timestamps(symbol, start, end)
+        results[symbol] = find_gaps(timestamps, interval_ms, start, end)
+    return results
+
+
+def print_gaps(results: Dict[str, np.ndarray], interval_ms: int) -> None:
+    """
+    打印每个symbol的缺口.
+    """
+    for symbol, gaps in results.items():
+        missing = int(((gaps[:, 1] - gaps[:, 0]) // interval_ms + 1).sum()) if len(gaps) else 0
+        print(f"{symbol}: {len(gaps)}个缺口, 共缺{missing}根K线")
+        for first, last in gaps.tolist():
+            count = (last - first) // interval_ms + 1
+            print(f"    {ms_to_datetime(first)} ~ {ms_to_datetime(last)}  {count}根")
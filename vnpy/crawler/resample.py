@@ -0,0 +1,116 @@
+"""
+用已经下载的1分钟K线合成更大周期的K线, 保存到bar_store.
+
+Class12FixedTradeTimeStrategy等策略在每次回测的时候都要通过BarGenerator把1分钟K线合成1小时、
+4小时K线. 这里在数据入库之后用向量化的group-by一次性合成5m/15m/1h/4h/1d的K线,
+之后每次有新的1分钟K线只增量地合成新的部分, 小时级别的回测可以少加载60倍的数据.
+
+K线按北京时间的时钟对齐(1d是北京时间0点开始的一天). 5m/15m/1h和BarGenerator的分钟、小时窗口一致,
+但是BarGenerator的多小时窗口(例如4h)是从第一根小时K线开始每4根推送一次, 和数据的开始时间有关,
+不按时钟对齐. 需要和策略里的BarGenerator完全一致的时候用backtester/vectorized.py的window_bars.
+
+增量合成只会往后延伸. 回补了更早的1分钟K线(导入历史的zip文件、补缺口)之后, 要用since参数
+从回补的位置重新合成, 否则更大周期的K线里不会有回补的部分.
+"""
+
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from crawler.bar_store import ParquetBarStore
+from crawler.kline_decoder import BAR_DTYPE, CHINA_OFFSET_MS
+
+MINUTE_MS = 60 * 1000
+
+DERIVED_INTERVALS: Dict[str, int] = {
+    '5m': 5 * MINUTE_MS,
+    '15m': 15 * MINUTE_MS,
+    '1h': 60 * MINUTE_MS,
+    '4h': 4 * 60 * MINUTE_MS,
+    '1d': 24 * 60 * MINUTE_MS,
+}
+
+
+def bucket_of(timestamps: np.ndarray, interval_ms: int, offset_ms: int = CHINA_OFFSET_MS) -> np.ndarray:
+    """
+    每根K线所在周期的开始时间(毫秒), 按offset_ms的时区对齐.
+    """
+    return (timestamps + offset_ms) // interval_ms * interval_ms - offset_ms
+
+
+def resample_bars(
+    bars: np.ndarray,
+    interval_ms: int,
+    source_ms: int = MINUTE_MS,
+    offset_ms: int = CHINA_OFFSET_MS,
+    include_partial: bool = False,
+) -> np.ndarray:
+    """
+    把按时间排序的K线合成interval_ms周期的K线.
+    :param bars: BAR_DTYPE数组
+    :param source_ms: bars的周期
+    :param include_partial: 是否保留最后一根还没有走完的K线
+    :return: BAR_DTYPE数组, datetime为每个周期的开始时间
+    """
+    if not len(bars):
+        return np.empty(0, dtype=BAR_DTYPE)
+
+    buckets = bucket_of(bars['datetime'], interval_ms, offset_ms)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(bars)] - 1
+
+    result = np.empty(len(starts), dtype=BAR_DTYPE)
+    result['datetime'] = buckets[starts]
+    result['open'] = bars['open'][starts]
+    result['close'] = bars['close'][ends]
+    result['high'] = np.maximum.reduceat(bars['high'], starts)
+    result['low'] = np.minimum.reduceat(bars['low'], starts)
+    result['volume'] = np.add.reduceat(bars['volume'], starts)
+    result['turnover'] = np.add.reduceat(bars['turnover'], starts)
+
+    # 最后一个周期只有走到最后一根K线才算完成, 之前的周期后面已经有数据了, 缺的只能是缺口.
+    if not include_partial and bars['datetime'][-1] + source_ms < result['datetime'][-1] + interval_ms:
+        result = result[:-1]
+
+    return result
+
+
+def update_derived_bars(
+    store: ParquetBarStore,
+    symbol: str,
+    exchange: str,
+    intervals: Sequence[str] = tuple(DERIVED_INTERVALS),
+    since: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    增量地把bar_store里的1分钟K线合成更大周期的K线.
+    每个周期从已经保存的最后一根K线之后开始, 只保存已经完成的K线.
+    :param exchange: 交易所, 例如BINANCE
+    :param since: 毫秒, 回补的1分钟K线里最早的时间, 从它所在的周期开始重新合成, 覆盖已经保存的K线.
+    :return: {interval: 新写入的K线数量}
+    """
+    counts = {}
+    for interval in intervals:
+        interval_ms = DERIVED_INTERVALS[interval]
+
+        start = None
+        last = store.last_bar_time(symbol, exchange, interval)
+        if last is not None:
+            start = last + interval_ms
+
+        rebuild = since is not None and (start is None or since < start)
+        if rebuild:
+            start = int(bucket_of(since, interval_ms))
+
+        minutes = store.read(symbol, exchange, '1m', start=start)
+        derived = resample_bars(minutes, interval_ms)
+
+        # 没有历史记录或者从回补的位置重新合成的时候, 第一个周期可能不完整.
+        if (last is None or rebuild) and len(derived) and len(minutes):
+            if derived['datetime'][0] < minutes['datetime'][0]:
+                derived = derived[1:]
+
+        store.write(symbol, exchange, interval, derived)
+        counts[interval] = len(derived)
+
+    return counts
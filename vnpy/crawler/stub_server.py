@@ -0,0 +1,362 @@
+"""
+本地的币安K线模拟服务器, 用来离线测试和压测爬虫.
+
+提供/api/v3/klines, /fapi/v1/klines, /dapi/v1/klines三个接口, 按照startTime/endTime/limit返回
+确定性的合成K线(同一个symbol同一分钟的数据每次都一样), 可以模拟网络延迟、权重限频(429)
+以及注入错误. /fapi/v1/fundingRate每8小时一条合成的资金费率. /api/v3/aggTrades和/fapi/v1/aggTrades按照fromId/startTime返回合成的归集成交,
+每TRADE_STEP_MS毫秒一笔, id从上市时间开始连续编号.
+
+用法:
+    server = KlineStubServer(latency=0.02, max_weight=1200)
+    server.start()
+    downloader = AsyncKlineDownloader('spot', on_page, base_url=server.url)
+    ...
+    server.stop()
+"""
+
+import json
+import random
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from crawler.rate_limiter import agg_trades_weight, klines_weight
+
+MINUTE_MS = 60 * 1000
+
+# path: (market, 每页最大条数)
+KLINE_PATHS = {
+    '/api/v3/klines': ('spot', 1000),
+    '/fapi/v1/klines': ('usdt_future', 1500),
+    '/dapi/v1/klines': ('inverse_future', 1500),
+    '/fapi/v1/markPriceKlines': ('usdt_future', 1500),
+}
+
+FUNDING_RATE_PATH = '/fapi/v1/fundingRate'
+FUNDING_INTERVAL_MS = 8 * 60 * MINUTE_MS
+
+# path: (market, 每页最大条数)
+AGG_TRADE_PATHS = {
+    '/api/v3/aggTrades': ('spot', 1000),
+    '/fapi/v1/aggTrades': ('usdt_future', 1000),
+}
+
+TRADE_STEP_MS = 1000
+
+INTERVAL_MS = {
+    '1m': MINUTE_MS,
+    '5m': 5 * MINUTE_MS,
+    '15m': 15 * MINUTE_MS,
+    '1h': 60 * MINUTE_MS,
+    '4h': 4 * 60 * MINUTE_MS,
+    '1d': 24 * 60 * MINUTE_MS,
+}
+
+# 2017-08-17, 币安最早的K线
+DEFAULT_LISTING_TIME = 1502942400000
+
+
+def synthetic_klines(symbol: str, start: int, end: int, interval_ms: int, limit: int) -> List[list]:
+    """
+    生成[start, end]之间的合成K线, 格式与币安一致.
+    价格只由symbol和开盘时间决定, 所以任意切分的窗口拼起来都是一致的.
+    """
+    first = -(-start // interval_ms) * interval_ms
+    times = np.arange(first, end + 1, interval_ms, dtype=np.int64)[:limit]
+    if not len(times):
+        return []
+
+    seed = zlib.crc32(symbol.encode())
+    minutes = times // MINUTE_MS
+    base = 100 + seed % 1000
+    close = base * (1 + 0.2 * np.sin(minutes / 5000 + seed)) + np.sin(minutes * 0.37) * base * 0.002
+    open_ = base * (1 + 0.2 * np.sin((minutes - 1) / 5000 + seed)) + np.sin((minutes - 1) * 0.37) * base * 0.002
+    high = np.maximum(open_, close) * 1.001
+    low = np.minimum(open_, close) * 0.999
+    volume = 10 + (minutes * 7919 + seed) % 100
+    turnover = volume * close
+
+    return [
+        [t, f"{o:.2f}", f"{h:.2f}", f"{l:.2f}", f"{c:.2f}", f"{v:.3f}", t + interval_ms - 1,
+         f"{q:.4f}", 100, f"{v / 2:.3f}", f"{q / 2:.4f}", "0"]
+        for t, o, h, l, c, v, q in zip(
+            times.tolist(), open_.tolist(), high.tolist(), low.tolist(),
+            close.tolist(), volume.tolist(), turnover.tolist()
+        )
+    ]
+
+
+def synthetic_agg_trades(symbol: str, first_id: int, count: int, listing: int) -> List[dict]:
+    """
+    生成从first_id开始的count笔归集成交, 格式与币安一致.
+    """
+    ids = np.arange(first_id, first_id + count, dtype=np.int64)
+    times = listing + ids * TRADE_STEP_MS
+
+    seed = zlib.crc32(symbol.encode())
+    base = 100 + seed % 1000
+    price = base * (1 + 0.2 * np.sin(times / MINUTE_MS / 5000 + seed)) + np.sin(ids * 0.11) * base * 0.001
+    qty = 0.001 * (1 + (ids * 7919 + seed) % 500)
+
+    return [
+        {"a": a, "p": f"{p:.2f}", "q": f"{q:.3f}", "f": a, "l": a, "T": t, "m": a % 3 == 0, "M": True}
+        for a, p, q, t in zip(ids.tolist(), price.tolist(), qty.tolist(), times.tolist())
+    ]
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    """
+    默认的监听队列只有5, 并发连接多的时候会丢SYN, 客户端要等1秒重传.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class KlineStubServer:
+    """
+    在后台线程里运行的模拟服务器.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        max_weight: Optional[int] = None,
+        weight_window: float = 60,
+        error_rate: float = 0.0,
+        listing_times: Optional[Dict[str, int]] = None,
+        now: Optional[int] = None,
+        funding_interval_ms: int = FUNDING_INTERVAL_MS,
+    ):
+        """
+        :param port: 0表示随机端口
+        :param latency: 每个请求的模拟延迟, 秒
+        :param max_weight: 每个weight_window的权重上限, 超过返回429, None表示不限频
+        :param weight_window: 权重统计的窗口, 秒, 币安是60秒, 测试的时候可以改小
+        :param error_rate: 随机返回500的概率
+        :param listing_times: 每个symbol的上市时间(毫秒), 之前没有K线
+        :param now: 模拟的当前时间(毫秒), 之后没有K线, 默认为真实的当前时间
+        :param funding_interval_ms: 资金费率的结算间隔, 默认8小时
+        """
+        self.latency = latency
+        self.max_weight = max_weight
+        self.weight_window = weight_window
+        self.error_rate = error_rate
+        self.listing_times = listing_times or {}
+        self.now = now
+        self.funding_interval_ms = funding_interval_ms
+
+        self.lock = Lock()
+        self.injected: List[int] = []
+        self.weight_minute = 0
+        self.used_weight = 0
+
+        self.requests = 0
+        self.rejected = 0
+        self.errors = 0
+        self.bars = 0
+
+        self.server = StubHTTPServer((host, port), self.create_handler())
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> None:
+        """"""
+        self.thread.start()
+
+    def stop(self) -> None:
+        """"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def inject_errors(self, *statuses: int) -> None:
+        """
+        接下来的请求依次返回这些状态码, 例如inject_errors(429, 500, 418).
+        """
+        with self.lock:
+            self.injected.extend(statuses)
+
+    def take_weight(self, weight: int) -> int:
+        """
+        按自然窗口累计权重, 返回当前窗口已用的权重.
+        """
+        with self.lock:
+            minute = int(time.time() // self.weight_window)
+            if minute != self.weight_minute:
+                self.weight_minute = minute
+                self.used_weight = 0
+            self.used_weight += weight
+            return self.used_weight
+
+    def next_error(self) -> Optional[int]:
+        """"""
+        with self.lock:
+            if self.injected:
+                return self.injected.pop(0)
+        if self.error_rate and random.random() < self.error_rate:
+            return 500
+        return None
+
+    def check_limits(self, weight: int) -> (Optional[int], dict, bytes):
+        """
+        扣减权重, 超过上限或者有注入的错误的时候返回错误的状态码.
+        :return: (status, headers, body), 没有错误的时候status为None
+        """
+        used = self.take_weight(weight)
+        headers = {"X-MBX-USED-WEIGHT-1M": str(used)}
+
+        retry_after = 1
+        status = self.next_error()
+        if status is None and self.max_weight and used > self.max_weight:
+            status = 429
+            retry_after = self.weight_window - time.time() % self.weight_window
+
+        if status:
+            with self.lock:
+                if status in (418, 429):
+                    self.rejected += 1
+                else:
+                    self.errors += 1
+            headers["Retry-After"] = f"{retry_after:.3f}"
+            return status, headers, json.dumps({"code": -1003, "msg": "stub error"}).encode()
+
+        return None, headers, b""
+
+    def handle_klines(self, path: str, query: Dict[str, str]) -> (int, dict, bytes):
+        """
+        :return: (status, headers, body)
+        """
+        market, max_limit = KLINE_PATHS[path]
+        limit = min(int(query.get('limit', 500)), max_limit)
+
+        status, headers, body = self.check_limits(klines_weight(market, limit))
+        if status:
+            return status, headers, body
+
+        symbol = query['symbol']
+        interval_ms = INTERVAL_MS[query.get('interval', '1m')]
+        now = self.now or int(time.time() * 1000)
+        listing = self.listing_times.get(symbol, DEFAULT_LISTING_TIME)
+
+        start = max(int(query.get('startTime', listing)), listing)
+        end = min(int(query.get('endTime', now)), now)
+        rows = synthetic_klines(symbol, start, end, interval_ms, limit)
+
+        with self.lock:
+            self.bars += len(rows)
+        return 200, headers, json.dumps(rows).encode()
+
+    def handle_agg_trades(self, path: str, query: Dict[str, str]) -> (int, dict, bytes):
+        """
+        fromId优先, 其次startTime, 都没有的时候返回最近的成交.
+        """
+        market, max_limit = AGG_TRADE_PATHS[path]
+        limit = min(int(query.get('limit', 500)), max_limit)
+
+        status, headers, body = self.check_limits(agg_trades_weight(market))
+        if status:
+            return status, headers, body
+
+        symbol = query['symbol']
+        now = self.now or int(time.time() * 1000)
+        listing = self.listing_times.get(symbol, DEFAULT_LISTING_TIME)
+        last_id = (now - listing) // TRADE_STEP_MS
+
+        if 'fromId' in query:
+            first_id = int(query['fromId'])
+        elif 'startTime' in query:
+            first_id = max(-(-(int(query['startTime']) - listing) // TRADE_STEP_MS), 0)
+        else:
+            first_id = last_id - limit + 1
+
+        if 'endTime' in query:
+            last_id = min(last_id, (int(query['endTime']) - listing) // TRADE_STEP_MS)
+
+        first_id = max(first_id, 0)
+        rows = synthetic_agg_trades(symbol, first_id, max(min(limit, last_id - first_id + 1), 0), listing)
+        return 200, headers, json.dumps(rows).encode()
+
+    def handle_funding_rate(self, query: Dict[str, str]) -> (int, dict, bytes):
+        """
+        每funding_interval_ms一条资金费率, 在0.01%附近波动.
+        """
+        status, headers, body = self.check_limits(1)
+        if status:
+            return status, headers, body
+
+        symbol = query['symbol']
+        now = self.now or int(time.time() * 1000)
+        listing = self.listing_times.get(symbol, DEFAULT_LISTING_TIME)
+        limit = min(int(query.get('limit', 100)), 1000)
+
+        start = max(int(query.get('startTime', listing)), listing)
+        end = min(int(query.get('endTime', now)), now)
+        first = -(-start // self.funding_interval_ms) * self.funding_interval_ms
+        times = np.arange(first, end + 1, self.funding_interval_ms, dtype=np.int64)[:limit]
+
+        seed = zlib.crc32(symbol.encode())
+        rates = 0.0001 + 0.0003 * np.sin(times / FUNDING_INTERVAL_MS / 10 + seed)
+        rows = [
+            {"symbol": symbol, "fundingTime": t, "fundingRate": f"{r:.8f}", "markPrice": ""}
+            for t, r in zip(times.tolist(), rates.tolist())
+        ]
+        return 200, headers, json.dumps(rows).encode()
+
+    def create_handler(self):
+        """"""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # 支持长连接
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+                with server.lock:
+                    server.requests += 1
+
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if url.path in KLINE_PATHS:
+                    status, headers, body = server.handle_klines(url.path, query)
+                elif url.path == FUNDING_RATE_PATH:
+                    status, headers, body = server.handle_funding_rate(query)
+                elif url.path in AGG_TRADE_PATHS:
+                    status, headers, body = server.handle_agg_trades(url.path, query)
+                else:
+                    status, headers, body = 404, {}, b'{"code": -1, "msg": "not found"}'
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def stats(self) -> Dict[str, int]:
+        """"""
+        return {
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "bars": self.bars,
+        }
@@ -0,0 +1,157 @@
+"""
+基于asyncio的币安归集成交(aggTrades)下载器.
+
+Class16SpotGridStrategy、Class18HighFrequencyStrategy等策略在on_tick和定时器里下单,
+用1分钟K线回测不够准确, 需要逐笔的成交数据.
+
+归集成交的id是连续的, 所以先查出[start, end)对应的第一笔和最后一笔成交的id,
+再按fromId切分成每页1000笔的窗口, 和K线一样放进同一个队列并发地下载, 限流、重试、
+连接池和BarWriter都和AsyncKlineDownloader共用. 传入ParquetTradeStore的时候只下载还没有
+保存的id范围.
+
+用法:
+    store = ParquetTradeStore(get_folder_path("bar_store"))
+    with BarWriter(save_trades, batch_size=1000000, key=None) as writer:
+        downloader = AsyncTradeDownloader('spot', writer.put_async, store=store)
+        downloader.run(["BTCUSDT"], "2021-1-1", "2021-2-1")
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+import numpy as np
+
+from crawler.async_downloader import AsyncKlineDownloader, db_symbol, split_windows
+from crawler.kline_decoder import ms_to_datetime
+from crawler.http_session import create_client_session
+from crawler.rate_limiter import agg_trades_weight
+from crawler.trade_store import ParquetTradeStore, decode_agg_trades
+
+AGG_TRADE_LIMIT = 1000
+
+# market: (host, path)
+AGG_TRADE_MARKETS: Dict[str, Tuple[str, str]] = {
+    'spot': ('https://api.binance.com', '/api/v3/aggTrades'),
+    'usdt_future': ('https://fapi.binance.com', '/fapi/v1/aggTrades'),
+}
+
+
+class AsyncTradeDownloader(AsyncKlineDownloader):
+    """
+    按成交id并发下载归集成交.
+    """
+
+    def __init__(
+        self,
+        market: str,
+        on_page: Callable[[str, str, np.ndarray], Optional[Awaitable]],
+        store: Optional[ParquetTradeStore] = None,
+        exchange: str = "BINANCE",
+        base_url: Optional[str] = None,
+        **kwargs,
+    ):
+        """
+        :param on_page: 每下载完一页的回调, on_page(symbol, market, trades), trades为TRADE_DTYPE数组.
+        :param store: 传入的时候只下载store里缺少的id范围.
+        :param exchange: store里的交易所目录.
+        其他参数和AsyncKlineDownloader一致.
+        """
+        if market not in AGG_TRADE_MARKETS:
+            raise Exception('交易所名称请输入以下其中一个：spot, usdt_future')
+
+        super().__init__(market, on_page, base_url=base_url, **kwargs)
+
+        host, path = AGG_TRADE_MARKETS[market]
+        self.url = (base_url or host) + path
+        self.limit = AGG_TRADE_LIMIT
+        self.store = store
+        self.exchange = exchange
+
+    async def download(self, symbols: List[str], start: int, end: int) -> None:
+        """
+        下载[start, end)之间的成交.
+        :param start: 毫秒时间戳
+        :param end: 毫秒时间戳
+        """
+        self.metrics.add_total(2 * len(symbols))
+        async with create_client_session(self.concurrency, self.timeout) as session:
+            ranges = await asyncio.gather(*[self.id_range(session, symbol, start, end) for symbol in symbols])
+
+        jobs = []
+        for symbol, (first, last) in zip(symbols, ranges):
+            if first is None or last < first:
+                print(f"{symbol} 在{ms_to_datetime(start)}到{ms_to_datetime(end)}之间没有成交")
+                continue
+
+            missing = [(first, last)]
+            if self.store:
+                missing = self.store.missing_ids(db_symbol(symbol, self.market), self.exchange, first, last)
+
+            count = sum(stop - begin + 1 for begin, stop in missing)
+            print(f"{symbol} 成交id: {first}-{last}, 需要下载{count}笔")
+
+            for begin, stop in missing:
+                for window in split_windows(begin, stop + 1, 1, self.limit):
+                    jobs.append((symbol, window))
+
+        await self.download_windows(jobs)
+
+    async def id_range(
+        self,
+        session: aiohttp.ClientSession,
+        symbol: str,
+        start: int,
+        end: int,
+    ) -> Tuple[Optional[int], Optional[int]]:
+        """
+        [start, end)之间第一笔和最后一笔成交的id.
+        结束时间之后还没有成交的时候, 最后一笔就是当前最新的成交.
+        """
+        first = await self.trade_id_at(session, symbol, start)
+        if first is None:
+            return None, None
+
+        after_end = await self.trade_id_at(session, symbol, end)
+        if after_end is not None:
+            return first, after_end - 1
+
+        rows = await self.request(session, {'symbol': symbol, 'limit': 1}, agg_trades_weight(self.market))
+        return first, rows[-1]['a'] if rows else first - 1
+
+    async def trade_id_at(self, session: aiohttp.ClientSession, symbol: str, timestamp: int) -> Optional[int]:
+        """
+        timestamp之后(含)的第一笔成交的id, 没有返回None.
+        """
+        params = {'symbol': symbol, 'startTime': timestamp, 'limit': 1}
+        rows = await self.request(session, params, agg_trades_weight(self.market))
+        return rows[0]['a'] if rows else None
+
+    async def fetch_page(
+        self,
+        session: aiohttp.ClientSession,
+        symbol: str,
+        start: int,
+        end: int,
+        limit: Optional[int] = None,
+        worker: str = "main",
+    ) -> list:
+        """
+        请求id在[start, end]之间的成交.
+        """
+        params = {
+            'symbol': symbol,
+            'fromId': start,
+            'limit': limit or end - start + 1,
+        }
+        return await self.request(session, params, agg_trades_weight(self.market), worker)
+
+    def cacheable(self, params: dict, rows: list) -> bool:
+        """
+        按fromId或者startTime请求的满页不会再变化, 查询最新成交的请求不缓存.
+        """
+        return ('fromId' in params or 'startTime' in params) and len(rows) >= params['limit']
+
+    def decode(self, rows: list) -> np.ndarray:
+        """"""
+        return decode_agg_trades(rows)
@@ -0,0 +1,241 @@
+"""
+K线入库之前的数据检查.
+
+每一页K线(BAR_DTYPE数组)一次性地做向量化的检查, 不合格的行不写入数据库, 而是连同原因
+一起放到sqlite的隔离表(bar_quarantine)里, 页内发现的缺口记录到data_gaps表:
+    - 最高价小于最低价, 开盘价或收盘价不在最高最低价之间
+    - 价格小于等于0或者不是数字, 成交量为负
+    - 开盘时间重复、不是递增、没有对齐到K线周期
+    - 没有成交量价格却变化了(零成交量的插针)
+    - 相对上一根收盘价的跳动或者影线远远超过这一页的正常波动
+
+最后一种可能是真实的插针行情, 只标记不丢弃: 照常写入数据库, 同时记录到bar_suspects表里备查.
+丢弃的话数据库里会留下缺口, fill_gaps每次补数据都会重新下载到同样的K线, 永远补不上.
+
+一千万根K线的检查只需要几秒, 相对网络请求可以忽略.
+"""
+
+import sqlite3
+import time
+from threading import Lock
+from typing import Dict
+
+import numpy as np
+
+HIGH_LOW = 1
+OPEN_RANGE = 2
+CLOSE_RANGE = 4
+BAD_PRICE = 8
+BAD_VOLUME = 16
+DUPLICATE = 32
+NON_MONOTONIC = 64
+MISALIGNED = 128
+ZERO_VOLUME_SPIKE = 256
+OUTLIER = 512
+
+# 只标记不丢弃的标记位
+SUSPECT = OUTLIER
+
+REASONS: Dict[int, str] = {
+    HIGH_LOW: "high<low",
+    OPEN_RANGE: "open_out_of_range",
+    CLOSE_RANGE: "close_out_of_range",
+    BAD_PRICE: "bad_price",
+    BAD_VOLUME: "negative_volume",
+    DUPLICATE: "duplicate_time",
+    NON_MONOTONIC: "non_monotonic_time",
+    MISALIGNED: "misaligned_time",
+    ZERO_VOLUME_SPIKE: "zero_volume_spike",
+    OUTLIER: "outlier",
+}
+
+
+def describe(flags: int) -> str:
+    """
+    把标记位转换成逗号分隔的原因.
+    """
+    return ",".join(reason for bit, reason in REASONS.items() if flags & bit)
+
+
+def check_bars(
+    bars: np.ndarray,
+    interval_ms: int = 60 * 1000,
+    max_jump: float = 0.1,
+    jump_factor: float = 50,
+) -> np.ndarray:
+    """
+    检查一页K线, 返回每一行的标记位, 0表示正常.
+    :param bars: BAR_DTYPE数组, 保持交易所返回的顺序
+    :param max_jump: 对数收益率的绝对值小于这个值的跳动总是正常的
+    :param jump_factor: 超过这一页收益率中位数的多少倍算异常
+    """
+    flags = np.zeros(len(bars), dtype=np.uint16)
+    if not len(bars):
+        return flags
+
+    # 结构化数组的字段是跨步的, 先复制成连续的数组, 后面的比较快得多.
+    times = np.ascontiguousarray(bars['datetime'])
+    open_ = np.ascontiguousarray(bars['open'])
+    high = np.ascontiguousarray(bars['high'])
+    low = np.ascontiguousarray(bars['low'])
+    close = np.ascontiguousarray(bars['close'])
+    volume = np.ascontiguousarray(bars['volume'])
+
+    flags[high < low] |= HIGH_LOW
+    flags[(open_ > high) | (open_ < low)] |= OPEN_RANGE
+    flags[(close > high) | (close < low)] |= CLOSE_RANGE
+
+    bad_price = ~(np.isfinite(open_) & np.isfinite(high) & np.isfinite(low) & np.isfinite(close))
+    bad_price |= (open_ <= 0) | (high <= 0) | (low <= 0) | (close <= 0)
+    flags[bad_price] |= BAD_PRICE
+    flags[~np.isfinite(volume) | (volume < 0)] |= BAD_VOLUME
+
+    flags[times % interval_ms != 0] |= MISALIGNED
+    if len(bars) > 1:
+        previous = np.maximum.accumulate(times)[:-1]
+        flags[1:][times[1:] == previous] |= DUPLICATE
+        flags[1:][times[1:] < previous] |= NON_MONOTONIC
+
+    flags[(volume == 0) & (high != low)] |= ZERO_VOLUME_SPIKE
+
+    # 跳动: 相对上一根的收盘价, 第一根相对自己的开盘价. 影线: 最高最低价离开实体的幅度.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        previous_close = np.r_[open_[:1], close[:-1]]
+        jump = np.abs(np.log(close / previous_close))
+        wick = np.maximum(np.log(high / np.maximum(open_, close)), np.log(np.minimum(open_, close) / low))
+
+    valid = np.isfinite(jump) & np.isfinite(wick)
+    if valid.any():
+        typical = np.median(jump[valid]) + np.median(wick[valid])
+        threshold = max(max_jump, jump_factor * typical)
+        flags[valid & ((jump > threshold) | (wick > threshold))] |= OUTLIER
+
+    return flags
+
+
+def find_page_gaps(times: np.ndarray, interval_ms: int) -> np.ndarray:
+    """
+    页内相邻两根K线之间缺少的部分.
+    :param times: 递增的开盘时间, 也就是check_bars检查合格的K线
+    :return: (n, 3)的数组, [第一根缺少的时间, 最后一根缺少的时间, 缺少的数量]
+    """
+    diff = np.diff(times)
+    ix = np.flatnonzero(diff > interval_ms)
+    return np.column_stack([times[ix] + interval_ms, times[ix + 1] - interval_ms, diff[ix] // interval_ms - 1])
+
+
+class Quarantine:
+    """
+    sqlite里的隔离表, 保存不合格的K线和原因.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: sqlite文件, 例如get_file_path("quarantine.db")
+        """
+        self.lock = Lock()
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS bar_quarantine (
+                symbol TEXT, market TEXT, datetime INTEGER,
+                open REAL, high REAL, low REAL, close REAL, volume REAL, turnover REAL,
+                flags INTEGER, reasons TEXT, created INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS bar_quarantine_symbol ON bar_quarantine (symbol, market, datetime);
+            CREATE TABLE IF NOT EXISTS bar_suspects (
+                symbol TEXT, market TEXT, datetime INTEGER,
+                open REAL, high REAL, low REAL, close REAL, volume REAL, turnover REAL,
+                flags INTEGER, reasons TEXT, created INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS bar_suspects_symbol ON bar_suspects (symbol, market, datetime);
+            CREATE TABLE IF NOT EXISTS data_gaps (
+                symbol TEXT, market TEXT, start INTEGER, end INTEGER, missing INTEGER, created INTEGER
+            );
+            """
+        )
+
+    def add_bars(self, symbol: str, market: str, bars: np.ndarray, flags: np.ndarray,
+                 table: str = "bar_quarantine") -> None:
+        """
+        :param table: bar_quarantine保存丢弃的K线, bar_suspects保存写入了但是可疑的K线
+        """
+        created = int(time.time() * 1000)
+        rows = [
+            (symbol, market, int(bar['datetime']), float(bar['open']), float(bar['high']), float(bar['low']),
+             float(bar['close']), float(bar['volume']), float(bar['turnover']), int(flag), describe(int(flag)),
+             created)
+            for bar, flag in zip(bars, flags)
+        ]
+        with self.lock, self.connection:
+            self.connection.executemany(f"INSERT INTO {table} VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+
+    def add_gaps(self, symbol: str, market: str, gaps: np.ndarray) -> None:
+        """"""
+        created = int(time.time() * 1000)
+        rows = [(symbol, market, int(start), int(end), int(missing), created) for start, end, missing in gaps]
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT INTO data_gaps VALUES (?,?,?,?,?,?)", rows)
+
+    def close(self) -> None:
+        """"""
+        self.connection.close()
+
+
+class BarValidator:
+    """
+    检查每一页K线, 返回合格的行, 不合格的行放进隔离表, 只有SUSPECT标记的行照常返回.
+    """
+
+    def __init__(self, quarantine: Quarantine = None, interval_ms: int = 60 * 1000, max_jump: float = 0.1,
+                 jump_factor: float = 50):
+        """
+        :param quarantine: None的时候只丢弃和计数, 不保存.
+        其他参数见check_bars.
+        """
+        self.quarantine = quarantine
+        self.interval_ms = interval_ms
+        self.max_jump = max_jump
+        self.jump_factor = jump_factor
+
+        self.rows = 0
+        self.rejected = 0
+        self.suspects = 0
+        self.gaps = 0
+        self.reasons: Dict[str, int] = {}
+        self.seconds = 0.0
+
+    def filter(self, symbol: str, market: str, bars: np.ndarray) -> np.ndarray:
+        """
+        :return: 合格的K线, 包括只有SUSPECT标记的K线
+        """
+        start = time.perf_counter()
+        flags = check_bars(bars, self.interval_ms, self.max_jump, self.jump_factor)
+        bad = (flags & ~np.uint16(SUSPECT)) != 0
+        suspect = ~bad & (flags != 0)
+        gaps = find_page_gaps(bars['datetime'][~bad], self.interval_ms)
+
+        self.rows += len(bars)
+        self.gaps += len(gaps)
+        if bad.any() or suspect.any():
+            self.rejected += int(bad.sum())
+            self.suspects += int(suspect.sum())
+            for bit, reason in REASONS.items():
+                count = int(np.count_nonzero(flags & bit))
+                if count:
+                    self.reasons[reason] = self.reasons.get(reason, 0) + count
+
+        if self.quarantine:
+            if bad.any():
+                self.quarantine.add_bars(symbol, market, bars[bad], flags[bad])
+            if suspect.any():
+                self.quarantine.add_bars(symbol, market, bars[suspect], flags[suspect], "bar_suspects")
+            if len(gaps):
+                self.quarantine.add_gaps(symbol, market, gaps)
+
+        self.seconds += time.perf_counter() - start
+        return bars[~bad] if bad.any() else bars
+
+    def __str__(self) -> str:
+        return (f"检查{self.rows}根K线, 隔离{self.rejected}根, 可疑{self.suspects}根{self.reasons}, "
+                f"页内缺口{self.gaps}个, 用时{self.seconds:.2f}s")
@@ -17,6 +17,8 @@ from vnpy_ctastrategy.base import EVENT_CTA_LOG
 from vnpy_ib import IbGateway
 from vnpy_binance import BinanceSpotGateway,BinanceUsdtGateway,BinanceInverseGateway
 
+from recorder.book_recorder import BookRecorderEngine
+
 SETTINGS["log.level"] = INFO
 SETTINGS["log.file"] = True
 SETTINGS["log.active"] = True  
@@ -31,6 +33,10 @@ main_engine.add_gateway(BinanceInverseGateway, "BINANCE_INVERSE")
 cta_engine: CtaEngine = main_engine.add_app(CtaStrategyApp) # 添加cta引擎, 实际上就是初始化引擎
 main_engine.write_log("主引擎创建成功")
 
+recorder: BookRecorderEngine = main_engine.add_engine(BookRecorderEngine)  # 记录策略收到的盘口快照
+# recorder.add_recording("btcusdt.BINANCE")  # 只记录指定的合约, 默认记录所有收到的tick
+main_engine.write_log("盘口记录引擎创建成功")
+
 log_engine = main_engine.get_engine("log")
 event_engine.register(EVENT_CTA_LOG, log_engine.process_log_event)
 main_engine.write_log("注册日志事件监听")
@@ -0,0 +1,156 @@
+"""
+按块压缩、只追加的盘口快照文件.
+
+每个symbol每天一个文件 root/exchange/symbol/YYYY-MM-DD.book, 内容是一个接一个的数据块:
+    块头(BLOCK_HEADER): magic, 压缩后的字节数, 行数, 档数, 最早的时间, 最晚的时间
+    zlib压缩的book_dtype(档数)数组
+旁边的.idx文件是时间索引, 每个块一条(最早的时间, 最晚的时间, 块的偏移, 行数),
+读取一段时间的时候只解压有交集的块. 索引丢失或者不完整的时候可以从块头重建.
+
+程序中途退出最多丢失最后一个没有写完的块, 之前的块都可以正常读取.
+"""
+
+import struct
+import zlib
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+BOOK_DEPTH = 5  # TickData最多5档
+
+BLOCK_MAGIC = b"BOOK"
+BLOCK_HEADER = struct.Struct("<4sIIIqq")
+
+INDEX_DTYPE = np.dtype([('start', np.int64), ('end', np.int64), ('offset', np.int64), ('rows', np.int64)])
+
+
+def book_dtype(depth: int = BOOK_DEPTH) -> np.dtype:
+    """
+    保存前depth档的快照格式, 时间是毫秒, 其余都是float64.
+    """
+    names = []
+    for side in ('bid', 'ask'):
+        names += [f'{side}_price_{i}' for i in range(1, depth + 1)]
+        names += [f'{side}_volume_{i}' for i in range(1, depth + 1)]
+    names += ['last_price', 'volume']
+    return np.dtype([('datetime', np.int64)] + [(name, np.float64) for name in names])
+
+
+class BookFileWriter:
+    """
+    往一个快照文件追加数据块, 不是线程安全的, 只在写入线程里使用.
+    """
+
+    def __init__(self, path: Path, level: int = 6):
+        """
+        :param level: zlib的压缩级别
+        """
+        self.path = Path(path)
+        self.index_path = self.path.with_suffix(".idx")
+        self.level = level
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, "ab")
+        self.index_file = open(self.index_path, "ab")
+
+    def write_block(self, rows: np.ndarray, depth: int) -> int:
+        """
+        压缩并追加一个块.
+        :param rows: book_dtype(depth)的数组
+        :return: 写入的字节数
+        """
+        if not len(rows):
+            return 0
+
+        # 不同线程推送的tick不一定按时间排序, 块的时间范围用最小和最大值
+        start, end = int(rows['datetime'].min()), int(rows['datetime'].max())
+        data = zlib.compress(rows.tobytes(), self.level)
+        header = BLOCK_HEADER.pack(BLOCK_MAGIC, len(data), len(rows), depth, start, end)
+
+        offset = self.file.tell()
+        self.file.write(header)
+        self.file.write(data)
+        self.file.flush()
+
+        entry = np.array([(start, end, offset, len(rows))], dtype=INDEX_DTYPE)
+        self.index_file.write(entry.tobytes())
+        self.index_file.flush()
+
+        return len(header) + len(data)
+
+    def close(self) -> None:
+        """"""
+        self.file.close()
+        self.index_file.close()
+
+
+def scan_blocks(path: Path) -> np.ndarray:
+    """
+    从块头重建时间索引, 最后一个不完整的块会被忽略.
+    """
+    entries = []
+    size = path.stat().st_size
+    with open(path, "rb") as f:
+        offset = 0
+        while offset + BLOCK_HEADER.size <= size:
+            magic, length, rows, _, start, end = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+            if magic != BLOCK_MAGIC or offset + BLOCK_HEADER.size + length > size:
+                break
+            entries.append((start, end, offset, rows))
+            offset += BLOCK_HEADER.size + length
+            f.seek(offset)
+    return np.array(entries, dtype=INDEX_DTYPE)
+
+
+def load_index(path: Path) -> np.ndarray:
+    """
+    读取.idx文件, 最后一条索引指向的块正好在文件末尾结束的时候才使用,
+    索引少了最后几条或者文件末尾的块不完整的时候从块头重建.
+    """
+    path = Path(path)
+    index_path = path.with_suffix(".idx")
+    if index_path.exists():
+        index = np.fromfile(index_path, dtype=INDEX_DTYPE, count=index_path.stat().st_size // INDEX_DTYPE.itemsize)
+        if len(index):
+            offset = int(index[-1]['offset'])
+            size = path.stat().st_size
+            if offset + BLOCK_HEADER.size <= size:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    magic, length, _, _, _, _ = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+                if magic == BLOCK_MAGIC and offset + BLOCK_HEADER.size + length == size:
+                    return index
+    return scan_blocks(path)
+
+
+def read_book(path: Path, start: Optional[int] = None, end: Optional[int] = None) -> np.ndarray:
+    """
+    读取[start, end]之间的快照.
+    :param start: 毫秒, None表示不限制
+    :param end: 毫秒, 闭区间, None表示不限制
+    :return: book_dtype(档数)的数组, 档数以文件里记录的为准.
+    """
+    index = load_index(path)
+    if start is not None:
+        index = index[index['end'] >= start]
+    if end is not None:
+        index = index[index['start'] <= end]
+
+    parts = []
+    with open(path, "rb") as f:
+        for entry in index:
+            f.seek(entry['offset'])
+            _, length, _, depth, _, _ = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+            dtype = book_dtype(depth)
+            parts.append(np.frombuffer(zlib.decompress(f.read(length)), dtype=dtype))
+
+    if not parts:
+        return np.empty(0, dtype=book_dtype())
+
+    rows = np.concatenate(parts)
+    if start is not None:
+        rows = rows[rows['datetime'] >= start]
+    if end is not None:
+        rows = rows[rows['datetime'] <= end]
+    return rows